@@ -1,34 +1,114 @@
 #!/usr/bin/env python3
 """
-Minimal benchmark via Gatekeeper:
-- Sends 1000 READ and 1000 WRITE per strategy (direct, random, custom)
-- Uses Gatekeeper /query (POST JSON {"sql": "..."}), header X-API-Key: changeme
-- Reads Gatekeeper public IP from Final/infra/instances.json
+Benchmark via Gatekeeper:
+- Per strategy (direct, random, custom by default), runs one block per workload mix:
+  READ (0% writes) and WRITE (100% writes) by default, optional mixed ratios (MIXES=0,0.2,1)
+- Uses Gatekeeper /query (POST JSON {"sql": "...", "params": [...]}), header X-API-Key: changeme
+- Reads Gatekeeper public IP from Final/infra/instances.json (or GATEKEEPER_URL)
+- Every request's latency is recorded; blocks report p50/p95/p99/max and a log-scale histogram
+- Load models (MODE):
+    closed (default): CONCURRENCY workers, each sends its next request when the previous one returns
+    open: requests are scheduled at a constant RATE (req/s) whatever the response times; latency is
+          measured from the scheduled send time, so queueing behind slow requests is not hidden
+          (coordinated omission). "service" latency (actual send -> response) is reported too.
+- Each block is preceded by WARMUP_REQUESTS requests that are not recorded
+- Response encodings (ENCODINGS=json,msgpack,columnar,columnar-json): one block set per encoding, sent as
+  the Accept header; responses are decoded (client cost included) and the mean body size is reported
+- Output: results/<RUN_NAME>.csv (one row per block) and results/<RUN_NAME>.json (config + full stats);
+  `python3 bench.py compare old.json new.json` prints the per-block p50/p99/throughput deltas
 """
 
 import asyncio
 import aiohttp
+import bisect
 import time
 import csv
 import os
 import json
+import math
+import random
+import sys
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 ROOT = Path(__file__).resolve().parents[1]
 INFRA = ROOT / "infra" / "instances.json"
 
 API_KEY = os.getenv("API_KEY", "changeme")
+GATEKEEPER_URL = os.getenv("GATEKEEPER_URL", "")
 CONCURRENCY = int(os.getenv("CONCURRENCY", "100"))
 NUM_REQUESTS = int(os.getenv("NUM_REQUESTS", "1000"))
+WARMUP_REQUESTS = int(os.getenv("WARMUP_REQUESTS", "50"))
+MODE = os.getenv("MODE", "closed")                     # closed | open
+RATE = float(os.getenv("RATE", "200"))                 # open loop: requests per second
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "1000"))  # open loop: connection cap
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+STRATEGIES = [s for s in os.getenv("STRATEGIES", "direct,random,custom").split(",") if s]
+# Write fraction per block: 0 = READ, 1 = WRITE, anything between = mixed
+MIXES = [float(m) for m in os.getenv("MIXES", "0,1").split(",") if m]
+CATALOG = os.getenv("CATALOG", "basic")                # basic | sakila
+SEED = int(os.getenv("SEED", "42"))
+RUN_NAME = os.getenv("RUN_NAME", "results")
+ENCODINGS = [e for e in os.getenv("ENCODINGS", "json").split(",") if e]
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "columnar": "application/vnd.dbproxy.columnar+msgpack",
+    "columnar-json": "application/vnd.dbproxy.columnar+json",
+}
 
-READ_SQL = "SELECT COUNT(*) AS cnt FROM film;"
 CREATE_TABLE_SQL = "CREATE TABLE IF NOT EXISTS test_bench (id INT AUTO_INCREMENT PRIMARY KEY, txt VARCHAR(255));"
-WRITE_SQL = "INSERT INTO test_bench(txt) VALUES ('x');"
+# PARAMETERIZED=1 (default): send the WRITE as a template + params (prepared statement on the proxy)
+PARAMETERIZED = os.getenv("PARAMETERIZED", "1") == "1"
 
-STRATEGIES = ["direct", "random", "custom"]
+# Query catalogs: (name, weight, sql, params factory or None)
+Entry = Tuple[str, float, str, Any]
+
+CATALOGS: Dict[str, Dict[str, List[Entry]]] = {
+    # The original fixed statements
+    "basic": {
+        "read": [
+            ("count_film", 1, "SELECT COUNT(*) AS cnt FROM film;", None),
+        ],
+        "write": [
+            ("insert_bench", 1, "INSERT INTO test_bench(txt) VALUES (%s)", lambda r: ["x"])
+            if PARAMETERIZED
+            else ("insert_bench", 1, "INSERT INTO test_bench(txt) VALUES ('x');", None),
+        ],
+    },
+    # Typical Sakila access paths: point lookups, short ranges, joins, an aggregate
+    "sakila": {
+        "read": [
+            ("film_by_id", 40, "SELECT film_id, title, rental_rate FROM film WHERE film_id = %s", lambda r: [r.randint(1, 1000)]),
+            ("customer_by_id", 20, "SELECT customer_id, first_name, last_name, email FROM customer WHERE customer_id = %s",
+             lambda r: [r.randint(1, 599)]),
+            ("rentals_of_customer", 15,
+             "SELECT rental_id, rental_date, return_date FROM rental WHERE customer_id = %s ORDER BY rental_date DESC LIMIT 20",
+             lambda r: [r.randint(1, 599)]),
+            ("actors_of_film", 15,
+             "SELECT a.actor_id, a.first_name, a.last_name FROM film_actor fa JOIN actor a ON a.actor_id = fa.actor_id "
+             "WHERE fa.film_id = %s", lambda r: [r.randint(1, 1000)]),
+            ("films_by_category", 5,
+             "SELECT c.name, COUNT(*) AS films FROM film_category fc JOIN category c ON c.category_id = fc.category_id "
+             "GROUP BY c.name", None),
+            ("count_film", 5, "SELECT COUNT(*) AS cnt FROM film", None),
+        ],
+        "write": [
+            ("insert_bench", 70, "INSERT INTO test_bench(txt) VALUES (%s)", lambda r: [f"x{r.randint(0, 1 << 30)}"]),
+            ("update_bench", 20, "UPDATE test_bench SET txt = %s WHERE id = %s",
+             lambda r: [f"u{r.randint(0, 1 << 30)}", r.randint(1, 1000)]),
+            ("delete_bench", 10, "DELETE FROM test_bench WHERE id = %s", lambda r: [r.randint(1, 1000)]),
+        ],
+    },
+}
+
+# Histogram bucket upper bounds (ms), log-scale from 0.5 ms to ~65 s
+BUCKETS_MS = [0.5 * 2 ** i for i in range(18)]
 
 
 def gatekeeper_base_url() -> str:
+    if GATEKEEPER_URL:
+        return GATEKEEPER_URL.rstrip("/")
     with open(INFRA, "r", encoding="utf-8") as f:
         data = json.load(f)
     gk_ip = data["gatekeeper"].get("public_ip") or data["gatekeeper"].get("private_ip")
@@ -37,73 +117,297 @@ def gatekeeper_base_url() -> str:
     return f"http://{gk_ip}"
 
 
-async def post_sql(session: aiohttp.ClientSession, base: str, sql: str, strategy: str):
+def decode_body(raw: bytes, content_type: str) -> Any:
+    if "msgpack" in content_type:
+        import msgpack
+
+        return msgpack.unpackb(raw)
+    # try json, else text
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.decode("utf-8", "replace")
+
+
+async def post_sql(session: aiohttp.ClientSession, base: str, sql: str, strategy: str, params=None, encoding: str = "json"):
+    """Returns (status, decoded body, body size in bytes)."""
     url = f"{base}/query?strategy={strategy}"
     headers = {
         "X-API-Key": API_KEY,
         "Content-Type": "application/json",
+        "Accept": MEDIA_TYPES[encoding],
     }
+    payload = {"sql": sql} if params is None else {"sql": sql, "params": params}
     try:
-        async with session.post(url, json={"sql": sql}, headers=headers) as resp:
+        async with session.post(url, json=payload, headers=headers) as resp:
             status = resp.status
-            # try json, else text
-            try:
-                body = await resp.json()
-            except Exception:
-                body = await resp.text()
-            return status, body
+            raw = await resp.read()
+            return status, decode_body(raw, resp.headers.get("content-type", "")), len(raw)
     except Exception as e:
-        return None, str(e)
+        return None, str(e), 0
 
 
-async def run_many(session: aiohttp.ClientSession, base: str, sql: str, strategy: str, n: int):
-    sem = asyncio.Semaphore(CONCURRENCY)
+# --- workload ---
 
-    async def one(i: int):
-        async with sem:
-            return await post_sql(session, base, sql, strategy)
+class Workload:
+    """Draws (query name, sql, params) with the block's write fraction and the catalog weights."""
 
-    tasks = [asyncio.create_task(one(i)) for i in range(n)]
-    results = await asyncio.gather(*tasks)
-    return results
+    def __init__(self, catalog: Dict[str, List[Entry]], write_ratio: float, seed: int):
+        self.rng = random.Random(seed)
+        self.write_ratio = write_ratio
+        self.kinds = {}
+        for kind in ("read", "write"):
+            entries = catalog[kind]
+            total = float(sum(e[1] for e in entries))
+            acc, cum = 0.0, []
+            for e in entries:
+                acc += e[1] / total
+                cum.append(acc)
+            self.kinds[kind] = (entries, cum)
 
+    def next(self) -> Tuple[str, str, str, Optional[list]]:
+        kind = "write" if self.rng.random() < self.write_ratio else "read"
+        entries, cum = self.kinds[kind]
+        name, _, sql, make_params = entries[min(bisect.bisect_left(cum, self.rng.random()), len(entries) - 1)]
+        return kind, name, sql, (make_params(self.rng) if make_params else None)
 
-async def run_block(label: str, base: str, sql: str, strategy: str, n: int, writer):
-    start = time.time()
-    async with aiohttp.ClientSession() as session:
-        results = await run_many(session, base, sql, strategy, n)
-    duration = time.time() - start
-    success = sum(1 for r in results if r[0] == 200)
-    avg = duration / n if n else 0.0
 
-    print(f"[{label}] success={success}/{n} total={duration:.2f}s avg={avg:.4f}s")
-    writer.writerow([label, strategy, n, success, f"{duration:.4f}", f"{avg:.6f}"])
+# --- stats ---
+
+def percentile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    # Nearest rank
+    idx = min(len(sorted_vals) - 1, max(0, math.ceil(q / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[idx]
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Any]:
+    vals = sorted(latencies_ms)
+    hist = [0] * (len(BUCKETS_MS) + 1)
+    for v in vals:
+        hist[bisect.bisect_left(BUCKETS_MS, v)] += 1
+
+    def r(v):
+        return round(v, 3) if v is not None else None
+
+    return {
+        "count": len(vals),
+        "mean_ms": r(sum(vals) / len(vals)) if vals else None,
+        "p50_ms": r(percentile(vals, 50)),
+        "p95_ms": r(percentile(vals, 95)),
+        "p99_ms": r(percentile(vals, 99)),
+        "max_ms": r(vals[-1]) if vals else None,
+        # Non-empty buckets as [upper bound ms, count]; None = above the last bound
+        "histogram": [[b, n] for b, n in zip(BUCKETS_MS + [None], hist) if n],
+    }
+
+
+# --- load generators ---
+
+# kind, name, status, body, latency_ms, service_ms, response bytes
+Sample = Tuple[str, str, Optional[int], Any, float, float, int]
+
+
+async def one_request(session, base: str, strategy: str, encoding: str, item, scheduled: float) -> Sample:
+    kind, name, sql, params = item
+    sent = time.perf_counter()
+    status, body, size = await post_sql(session, base, sql, strategy, params, encoding)
+    done = time.perf_counter()
+    return kind, name, status, body, (done - scheduled) * 1000.0, (done - sent) * 1000.0, size
+
+
+async def run_closed(session, base: str, strategy: str, encoding: str, items: list) -> List[Sample]:
+    queue = iter(items)
+    samples: List[Sample] = []
+
+    async def worker():
+        for item in queue:
+            now = time.perf_counter()
+            samples.append(await one_request(session, base, strategy, encoding, item, now))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, CONCURRENCY))))
+    return samples
+
+
+async def run_open(session, base: str, strategy: str, encoding: str, items: list) -> List[Sample]:
+    # Constant arrival rate: request i is due at start + i / RATE, sent even if earlier ones are still pending
+    start = time.perf_counter()
+    tasks = []
+    for i, item in enumerate(items):
+        due = start + i / RATE
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one_request(session, base, strategy, encoding, item, due)))
+    return list(await asyncio.gather(*tasks))
+
+
+async def run_block(
+    label: str, base: str, strategy: str, encoding: str, write_ratio: float, workload: Workload
+) -> Dict[str, Any]:
+    limit = CONCURRENCY if MODE == "closed" else MAX_INFLIGHT
+    connector = aiohttp.TCPConnector(limit=limit)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    run = run_open if MODE == "open" else run_closed
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        if WARMUP_REQUESTS:
+            await run(session, base, strategy, encoding, [workload.next() for _ in range(WARMUP_REQUESTS)])
+        items = [workload.next() for _ in range(NUM_REQUESTS)]
+        start = time.perf_counter()
+        samples = await run(session, base, strategy, encoding, items)
+        duration = time.perf_counter() - start
+
+    ok = [s for s in samples if s[2] == 200]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s[2] != 200:
+            key = str(s[2]) if s[2] is not None else "exception"
+            errors[key] = errors.get(key, 0) + 1
+    # Proxy result cache (RESULT_CACHE=1) tags READ responses with "cache": "hit"/"miss"
+    cache_hits = sum(1 for s in samples if isinstance(s[3], dict) and s[3].get("cache") == "hit")
+    by_query: Dict[str, List[float]] = {}
+    for s in ok:
+        by_query.setdefault(s[1], []).append(s[4])
+
+    block = {
+        "label": label,
+        "strategy": strategy,
+        "encoding": encoding,
+        "write_ratio": write_ratio,
+        "mode": MODE,
+        "requests": len(samples),
+        "success": len(ok),
+        "errors": errors,
+        "cache_hits": cache_hits,
+        "response_bytes_mean": round(sum(s[6] for s in ok) / len(ok), 1) if ok else None,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(ok) / duration, 2) if duration > 0 else None,
+        "latency": summarize([s[4] for s in ok]),
+        "queries": {name: summarize(vals) for name, vals in sorted(by_query.items())},
+    }
+    if MODE == "open":
+        block["target_rps"] = RATE
+        block["service"] = summarize([s[5] for s in ok])
+    lat = block["latency"]
+    print(
+        f"[{label}] success={len(ok)}/{len(samples)} total={duration:.2f}s rps={block['throughput_rps']} "
+        f"p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms max={lat['max_ms']}ms cache_hits={cache_hits} "
+        f"bytes={block['response_bytes_mean']}"
+    )
+    return block
+
+
+def mix_label(write_ratio: float) -> str:
+    if write_ratio <= 0:
+        return "READ"
+    if write_ratio >= 1:
+        return "WRITE"
+    return f"MIX {round((1 - write_ratio) * 100)}/{round(write_ratio * 100)}"
+
+
+CSV_HEADER = [
+    "Label", "Strategy", "Mode", "Write ratio", "Requests", "Success", "Errors", "Total (s)", "Throughput (req/s)",
+    "Mean (ms)", "p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Cache hits", "Encoding", "Mean response (bytes)",
+]
+
+
+def csv_row(b: Dict[str, Any]) -> list:
+    lat = b["latency"]
+    return [
+        b["label"], b["strategy"], b["mode"], b["write_ratio"], b["requests"], b["success"],
+        b["requests"] - b["success"], f"{b['duration_s']:.4f}", b["throughput_rps"],
+        lat["mean_ms"], lat["p50_ms"], lat["p95_ms"], lat["p99_ms"], lat["max_ms"], b["cache_hits"],
+        b.get("encoding", "json"), b.get("response_bytes_mean"),
+    ]
 
 
 async def main():
+    if CATALOG not in CATALOGS:
+        raise SystemExit(f"Unknown CATALOG {CATALOG!r} (expected {'|'.join(CATALOGS)})")
+    if MODE not in ("closed", "open"):
+        raise SystemExit(f"Unknown MODE {MODE!r} (expected closed|open)")
+    unknown = [e for e in ENCODINGS if e not in MEDIA_TYPES]
+    if unknown:
+        raise SystemExit(f"Unknown ENCODINGS {unknown} (expected {'|'.join(MEDIA_TYPES)})")
+    if any("msgpack" in MEDIA_TYPES[e] for e in ENCODINGS):
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            raise SystemExit("ENCODINGS with msgpack/columnar need the msgpack package (pip install msgpack)")
     base = gatekeeper_base_url()
-    print(f"Gatekeeper: {base}")
+    print(f"Gatekeeper: {base} mode={MODE} catalog={CATALOG}")
 
     out_dir = ROOT / "benchmark" / "results"
     out_dir.mkdir(parents=True, exist_ok=True)
-    csv_path = out_dir / "results.csv"
+    csv_path = out_dir / f"{RUN_NAME}.csv"
+    json_path = out_dir / f"{RUN_NAME}.json"
+
+    # Prepare table for WRITE
+    async with aiohttp.ClientSession() as session:
+        st, body, _ = await post_sql(session, base, CREATE_TABLE_SQL, "direct")
+        print(f"[prepare CREATE TABLE] status={st} body={body}")
+
+    blocks = []
+    for strat in STRATEGIES:
+        for enc in ENCODINGS:
+            for i, ratio in enumerate(MIXES):
+                # Same seed per (mix, position) so every strategy and encoding gets the same request sequence
+                workload = Workload(CATALOGS[CATALOG], ratio, SEED + i)
+                label = f"{mix_label(ratio)} {strat}" + ("" if enc == "json" else f" {enc}")
+                blocks.append(await run_block(label, base, strat, enc, ratio, workload))
 
     with open(csv_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
-        writer.writerow(["Label", "Strategy", "Requests", "Success", "Total (s)", "Avg (s)"])
+        writer.writerow(CSV_HEADER)
+        for b in blocks:
+            writer.writerow(csv_row(b))
+
+    config = {
+        "gatekeeper": base,
+        "mode": MODE,
+        "rate": RATE if MODE == "open" else None,
+        "concurrency": CONCURRENCY if MODE == "closed" else None,
+        "requests_per_block": NUM_REQUESTS,
+        "warmup_requests": WARMUP_REQUESTS,
+        "strategies": STRATEGIES,
+        "mixes": MIXES,
+        "catalog": CATALOG,
+        "encodings": ENCODINGS,
+        "parameterized": PARAMETERIZED,
+        "seed": SEED,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(json_path, "w", encoding="utf-8") as f:
+        # Stable key order and indentation so two runs diff cleanly
+        json.dump({"config": config, "blocks": blocks}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+    print(f"Results written: {csv_path} {json_path}")
+
 
-        # Prepare table for WRITE
-        async with aiohttp.ClientSession() as session:
-            st, body = await post_sql(session, base, CREATE_TABLE_SQL, "direct")
-            print(f"[prepare CREATE TABLE] status={st} body={body}")
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = {b["label"]: b for b in json.load(f)["blocks"]}
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = {b["label"]: b for b in json.load(f)["blocks"]}
 
-        # For each strategy: 1000 READ + 1000 WRITE
-        for strat in STRATEGIES:
-            await run_block(f"READ {strat}", base, READ_SQL, strat, NUM_REQUESTS, writer)
-            await run_block(f"WRITE {strat}", base, WRITE_SQL, strat, NUM_REQUESTS, writer)
+    def delta(a, b):
+        if a is None or b is None:
+            return "n/a"
+        return f"{a} -> {b} ({(b - a) / a * 100:+.1f}%)" if a else f"{a} -> {b}"
 
-    print(f"Results written: {csv_path}")
+    for label in [lbl for lbl in new if lbl in old]:
+        o, n = old[label], new[label]
+        print(f"[{label}]")
+        print(f"  p50_ms  {delta(o['latency']['p50_ms'], n['latency']['p50_ms'])}")
+        print(f"  p99_ms  {delta(o['latency']['p99_ms'], n['latency']['p99_ms'])}")
+        print(f"  rps     {delta(o['throughput_rps'], n['throughput_rps'])}")
+        print(f"  success {o['success']}/{o['requests']} -> {n['success']}/{n['requests']}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+    else:
+        asyncio.run(main())
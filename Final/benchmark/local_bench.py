@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Local benchmark: no EC2, no MySQL.
+
+- Writes a throwaway proxy config (1 manager + LOCAL_WORKERS fake workers)
+- Starts proxy/app.py (DB_DRIVER=fake, see proxy/fakedb.py) and gatekeeper/app.py as local subprocesses
+- Runs bench.py against the Gatekeeper (LOCAL_TARGET=gatekeeper, default) or the Proxy directly
+  (LOCAL_TARGET=proxy), with the same env knobs (MODE, RATE, MIXES, CATALOG, STRATEGIES, ...)
+- Optional regression gate: BASELINE=<results json> fails (exit 1) if any block's p50/p99 is more than
+  MAX_REGRESSION_PCT (10) % slower than in the baseline
+
+FAKE_* env vars (latency per node, failure injection, rows) are passed through to the fake backend.
+Results: Final/benchmark/results/<RUN_NAME, default "local">.{csv,json}
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PY = sys.executable
+
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", "2"))
+LOCAL_TARGET = os.getenv("LOCAL_TARGET", "gatekeeper")  # gatekeeper | proxy
+RUN_NAME = os.getenv("RUN_NAME", "local")
+BASELINE = os.getenv("BASELINE", "")
+MAX_REGRESSION_PCT = float(os.getenv("MAX_REGRESSION_PCT", "10"))
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "20"))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(url: str, proc: subprocess.Popen) -> None:
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{url}: process exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url}: not healthy after {STARTUP_TIMEOUT}s")
+
+
+def check_regressions(baseline_path: str, results_path: Path) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        old = {b["label"]: b for b in json.load(f)["blocks"]}
+    with open(results_path, "r", encoding="utf-8") as f:
+        new = {b["label"]: b for b in json.load(f)["blocks"]}
+    failures = 0
+    for label, b in new.items():
+        if label not in old:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            was, now = old[label]["latency"][key], b["latency"][key]
+            if was and now is not None and (now - was) / was * 100 > MAX_REGRESSION_PCT:
+                print(f"REGRESSION [{label}] {key}: {was} -> {now} (> {MAX_REGRESSION_PCT}%)")
+                failures += 1
+    if not failures:
+        print(f"No regression above {MAX_REGRESSION_PCT}% against {baseline_path}")
+    return failures
+
+
+def main() -> int:
+    proxy_port = free_port()
+    gk_port = free_port()
+    tmp = tempfile.mkdtemp(prefix="local_bench_")
+    config_path = Path(tmp) / "config.json"
+    config = {
+        "manager": {"host": "manager", "port": 3306},
+        "workers": [{"host": f"worker{i + 1}", "port": 3306} for i in range(LOCAL_WORKERS)],
+        "listen_port": proxy_port,
+    }
+    config_path.write_text(json.dumps(config, indent=2), encoding="utf-8")
+
+    env = dict(os.environ)
+    env.setdefault("PYTHONUNBUFFERED", "1")
+    proxy_env = dict(env, DB_DRIVER="fake", PROXY_CONFIG=str(config_path))
+    gk_env = dict(env, PORT=str(gk_port), PROXY_URL=f"http://127.0.0.1:{proxy_port}/query")
+
+    logs = [open(Path(tmp) / name, "w", encoding="utf-8") for name in ("proxy.log", "gatekeeper.log")]
+    procs = []
+    try:
+        procs.append(subprocess.Popen([PY, "app.py"], cwd=ROOT / "proxy", env=proxy_env, stdout=logs[0], stderr=subprocess.STDOUT))
+        wait_healthy(f"http://127.0.0.1:{proxy_port}/health", procs[0])
+        procs.append(subprocess.Popen([PY, "app.py"], cwd=ROOT / "gatekeeper", env=gk_env, stdout=logs[1], stderr=subprocess.STDOUT))
+        wait_healthy(f"http://127.0.0.1:{gk_port}/health", procs[1])
+        print(f"Proxy :{proxy_port} (fake DB, {LOCAL_WORKERS} workers), Gatekeeper :{gk_port}; logs in {tmp}")
+
+        target = f"http://127.0.0.1:{gk_port if LOCAL_TARGET == 'gatekeeper' else proxy_port}"
+        bench_env = dict(env, GATEKEEPER_URL=target, RUN_NAME=RUN_NAME)
+        rc = subprocess.call([PY, str(ROOT / "benchmark" / "bench.py")], env=bench_env)
+        if rc != 0:
+            return rc
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        for f in logs:
+            f.close()
+
+    if BASELINE:
+        return 1 if check_regressions(BASELINE, ROOT / "benchmark" / "results" / f"{RUN_NAME}.json") else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
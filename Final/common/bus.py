@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Local message bus between the worker processes of one service (PROCESSES > 1).
+
+Every process binds a Unix datagram socket <dir>/<name>-<pid>.sock; publish()
+sends a JSON message to every other socket in the directory and the receiving
+processes dispatch it to the handler subscribed for its topic. Datagrams on a
+local Unix socket are neither lost nor reordered; a process that has died
+leaves a socket nobody listens on, which is removed on the next send.
+
+publish() never blocks the event loop: each peer has its own non-blocking
+socket, and what a peer with a full receive queue cannot take yet is kept in
+a per-peer backlog (at most BACKLOG_MAX_BYTES; newer messages are dropped
+beyond that) and sent when its socket is writable again. Messages larger than
+one datagram (DATAGRAM_MAX_BYTES) are sent as fragments and reassembled by the
+receiver; at most MESSAGE_MAX_BYTES per message.
+
+The directory must be private to the service's user: start() creates it with
+mode 0700 and refuses one that another user owns or can write to, since whoever
+can add a socket there can inject messages (topology changes) or receive them.
+default_directory() is under $XDG_RUNTIME_DIR when set, else a per-uid name in
+the temp dir.
+
+try_lead() is a non-blocking exclusive flock on <dir>/<name>.leader: exactly one
+live process holds it (the kernel releases it when the holder exits), so
+background work that must run once per host (probing, polling) runs there and
+its results are published to the others.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import socket
+import stat
+import tempfile
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+PEER_REFRESH_S = 1.0
+# Below the default socket send buffer (net.core.wmem_default), so a datagram never fails with EMSGSIZE
+DATAGRAM_MAX_BYTES = 64 * 1024
+MESSAGE_MAX_BYTES = 16 * 1024 * 1024
+BACKLOG_MAX_BYTES = 4 * 1024 * 1024
+# A message whose fragments stop arriving (sender died mid-message) is discarded after this
+FRAGMENT_TIMEOUT_S = 5.0
+# Fragment datagram: FRAGMENT + b"<message id> <index> <count>\n" + part of the JSON message
+FRAGMENT = b"#"
+
+
+def default_directory(name: str) -> str:
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, name)
+    return os.path.join(tempfile.gettempdir(), f"{name}-u{os.getuid()}")
+
+
+def _private_directory(path: str) -> None:
+    """Creates path with mode 0700, or checks that an existing one is ours and not writable by others."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"bus directory {path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"bus directory {path} is owned by uid {st.st_uid}, not {os.getuid()}")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"bus directory {path} is writable by other users (mode {stat.S_IMODE(st.st_mode):o})")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _ends_message(datagram: bytes) -> bool:
+    # A whole message, or the last fragment of one
+    if not datagram.startswith(FRAGMENT):
+        return True
+    _, index, count = datagram[len(FRAGMENT):datagram.index(b"\n")].split(b" ")
+    return int(index) + 1 == int(count)
+
+
+class _Peer:
+    __slots__ = ("path", "sock", "backlog", "backlog_bytes", "writing")
+
+    def __init__(self, path: str, sock: socket.socket):
+        self.path = path
+        self.sock = sock
+        self.backlog: Deque[bytes] = deque()
+        self.backlog_bytes = 0
+        self.writing = False
+
+
+class Bus:
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name}-{os.getpid()}.sock")
+        self._handlers: Dict[str, Callable[[Any], None]] = {}
+        self._recv: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._peers: Dict[str, _Peer] = {}
+        self._peers_at = 0.0
+        self._partial: Dict[bytes, Tuple[float, List[Optional[bytes]]]] = {}
+        self._seq = 0
+        self._lock_fd: Optional[int] = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str, handler: Callable[[Any], None]) -> None:
+        self._handlers[topic] = handler
+
+    def start(self) -> None:
+        _private_directory(self.directory)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._loop = asyncio.get_running_loop()
+        self._recv = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._recv.bind(self.path)
+        self._recv.setblocking(False)
+        self._loop.add_reader(self._recv.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        if self._recv is not None:
+            try:
+                self._loop.remove_reader(self._recv.fileno())
+            except RuntimeError:
+                pass
+            self._recv.close()
+            self._recv = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        for peer in list(self._peers.values()):
+            self._drop_peer(peer, unlink=False)
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # --- receive ---
+
+    def _on_readable(self) -> None:
+        assert self._recv is not None
+        while True:
+            try:
+                data = self._recv.recv(DATAGRAM_MAX_BYTES + 256)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.received += 1
+            if data.startswith(FRAGMENT):
+                data = self._reassemble(data)
+                if data is None:
+                    continue
+            try:
+                msg = json.loads(data)
+                handler = self._handlers.get(msg["topic"])
+                if handler is not None:
+                    handler(msg["data"])
+            except Exception as e:
+                print(f"[bus] bad message: {e}")
+
+    def _reassemble(self, data: bytes) -> Optional[bytes]:
+        head, _, part = data[len(FRAGMENT):].partition(b"\n")
+        try:
+            msg_id, index, count = head.split(b" ")
+            i, n = int(index), int(count)
+        except ValueError:
+            print("[bus] bad fragment header")
+            return None
+        now = time.monotonic()
+        for stale in [k for k, (at, _) in self._partial.items() if now - at > FRAGMENT_TIMEOUT_S]:
+            del self._partial[stale]
+        _, parts = self._partial.setdefault(msg_id, (now, [None] * n))
+        if i >= len(parts):
+            return None
+        parts[i] = part
+        if any(p is None for p in parts):
+            return None
+        del self._partial[msg_id]
+        return b"".join(parts)  # type: ignore[arg-type]
+
+    # --- send ---
+
+    def peers(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > PEER_REFRESH_S:
+            prefix = f"{self.name}-"
+            paths = {
+                os.path.join(self.directory, f)
+                for f in os.listdir(self.directory)
+                if f.startswith(prefix) and f.endswith(".sock") and os.path.join(self.directory, f) != self.path
+            }
+            for path in paths - set(self._peers):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                try:
+                    # Connected: the socket is writable exactly when the peer's receive queue has room
+                    sock.connect(path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    sock.close()
+                    self._forget(path)
+                    continue
+                self._peers[path] = _Peer(path, sock)
+            for path in set(self._peers) - paths:
+                self._drop_peer(self._peers[path], unlink=False)
+            self._peers_at = now
+        return list(self._peers)
+
+    def _datagrams(self, payload: bytes) -> List[bytes]:
+        if len(payload) <= DATAGRAM_MAX_BYTES:
+            return [payload]
+        self._seq += 1
+        msg_id = f"{os.getpid()}.{self._seq}".encode("ascii")
+        chunks = [payload[i:i + DATAGRAM_MAX_BYTES] for i in range(0, len(payload), DATAGRAM_MAX_BYTES)]
+        return [FRAGMENT + b"%s %d %d\n" % (msg_id, i, len(chunks)) + c for i, c in enumerate(chunks)]
+
+    def publish(self, topic: str, data: Any) -> None:
+        if self._recv is None:
+            return
+        payload = json.dumps({"topic": topic, "data": data}, separators=(",", ":")).encode("utf-8")
+        if len(payload) > MESSAGE_MAX_BYTES:
+            self.dropped += 1
+            print(f"[bus] {topic} message of {len(payload)} bytes over {MESSAGE_MAX_BYTES}, not sent")
+            return
+        datagrams = self._datagrams(payload)
+        size = sum(len(d) for d in datagrams)
+        self.peers()
+        for peer in list(self._peers.values()):
+            if peer.backlog:
+                # Keep the order: queue behind what the peer has not taken yet
+                if peer.backlog_bytes + size > BACKLOG_MAX_BYTES:
+                    self.dropped += 1
+                    continue
+                peer.backlog.extend(datagrams)
+                peer.backlog_bytes += size
+                continue
+            self._send(peer, datagrams)
+
+    def _send(self, peer: _Peer, datagrams: List[bytes]) -> None:
+        for n, d in enumerate(datagrams):
+            try:
+                peer.sock.send(d)
+            except BlockingIOError:
+                # Peer's queue is full: the rest goes out when its socket is writable again
+                rest = datagrams[n:]
+                size = sum(len(x) for x in rest)
+                if n == 0 and size > BACKLOG_MAX_BYTES:
+                    self.dropped += 1
+                    return
+                peer.backlog.extend(rest)
+                peer.backlog_bytes += size
+                self._watch(peer)
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Process gone: forget its socket
+                self._drop_peer(peer)
+                return
+            except OSError as e:
+                self.dropped += 1
+                print(f"[bus] send to {peer.path} failed: {e}")
+                return
+        self.sent += 1
+
+    def _watch(self, peer: _Peer) -> None:
+        if not peer.writing:
+            peer.writing = True
+            self._loop.add_writer(peer.sock.fileno(), self._flush, peer)
+
+    def _flush(self, peer: _Peer) -> None:
+        while peer.backlog:
+            d = peer.backlog[0]
+            try:
+                peer.sock.send(d)
+            except BlockingIOError:
+                return
+            except OSError:
+                self._drop_peer(peer)
+                return
+            peer.backlog.popleft()
+            peer.backlog_bytes -= len(d)
+            if _ends_message(d):
+                self.sent += 1
+        peer.writing = False
+        self._loop.remove_writer(peer.sock.fileno())
+
+    def _drop_peer(self, peer: _Peer, unlink: bool = True) -> None:
+        if peer.writing:
+            self._loop.remove_writer(peer.sock.fileno())
+            peer.writing = False
+        peer.sock.close()
+        self._peers.pop(peer.path, None)
+        if peer.backlog:
+            self.dropped += 1
+        if unlink:
+            self._forget(peer.path)
+
+    def _forget(self, path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._peers_at = 0.0
+
+    # --- leader ---
+
+    def try_lead(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(os.path.join(self.directory, f"{self.name}.leader"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_fd is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "leader": self.is_leader,
+            "peers": len(self.peers()),
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "backlog_bytes": sum(p.backlog_bytes for p in self._peers.values()),
+        }
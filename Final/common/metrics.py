@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Minimal Prometheus metrics + Server-Timing support shared by the Gatekeeper and the Proxy.
+
+- Counter / Gauge / Histogram with labels, rendered in the Prometheus text format
+  (version 0.0.4) by Registry.render() for a /metrics endpoint; with several worker
+  processes each one publishes Registry.export() and render() merges the peers' values
+- Per-request stage timings: ServerTimingMiddleware starts a Timings object for each
+  HTTP request (kept in a context variable, so it is also visible from threadpool
+  workers); code wraps its stages in stage("execute") and the collected durations
+  are returned in the Server-Timing response header and observed in a histogram
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def items(self) -> Dict[Tuple[str, ...], Any]:
+        with self._lock:
+            return {k: (list(v) if isinstance(v, list) else v) for k, v in self._values.items()}
+
+    def combine(self, a: Any, b: Any) -> Any:
+        # Values of the same series from two processes
+        return a + b
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, items: Dict[Tuple[str, ...], Any]) -> List[str]:
+        return self._header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(items.items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Set explicitly, or computed at scrape time by a callback returning [(label values, value), ...].
+    merge: how processes combine ("sum" for per-process quantities, "max" for values they all share).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Callable[[], Iterable[Tuple[Sequence[str], float]]]] = None,
+        merge: str = "sum",
+    ):
+        super().__init__(name, help_text, labelnames)
+        self._collect = collect
+        self.merge = merge
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def items(self) -> Dict[Tuple[str, ...], Any]:
+        if self._collect is not None:
+            return {tuple(str(x) for x in k): v for k, v in self._collect()}
+        return super().items()
+
+    def combine(self, a: Any, b: Any) -> Any:
+        return max(a, b) if self.merge == "max" else a + b
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def combine(self, a: Any, b: Any) -> Any:
+        return [x + y for x, y in zip(a, b)]
+
+    def render(self, items: Dict[Tuple[str, ...], Any]) -> List[str]:
+        out = self._header()
+        for k, row in sorted(items.items()):
+            cumulative = 0.0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {_num(cumulative)}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {_num(row[-1])}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {_num(row[-1])}")
+        return out
+
+
+class Registry:
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    # Peer snapshots older than this belong to processes that are gone
+    PEER_TTL_S = 10.0
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._peers: Dict[int, Tuple[float, Dict[str, list]]] = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), collect=None, merge: str = "sum") -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, collect, merge))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    # --- multi-process: each process publishes export(), the others load_peer() it ---
+
+    def export(self) -> Dict[str, list]:
+        return {m.name: [[list(k), v] for k, v in m.items().items()] for m in self._metrics}
+
+    def load_peer(self, pid: int, data: Dict[str, list]) -> None:
+        self._peers[pid] = (time.monotonic(), data)
+
+    def render(self) -> str:
+        now = time.monotonic()
+        for pid in [p for p, (at, _) in self._peers.items() if now - at > self.PEER_TTL_S]:
+            del self._peers[pid]
+        peers = [data for _, data in list(self._peers.values())]
+        lines: List[str] = []
+        for m in self._metrics:
+            items = m.items()
+            for data in peers:
+                for k, v in data.get(m.name, []):
+                    key = tuple(k)
+                    items[key] = m.combine(items[key], v) if key in items else v
+            lines.extend(m.render(items))
+        return "\n".join(lines) + "\n"
+
+
+# --- per-request stage timings (Server-Timing) ---
+
+class Timings:
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.upstream: List[str] = []
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages.append((name, seconds))
+
+    def add_upstream(self, header: Optional[str], prefix: str) -> None:
+        # Re-emit another hop's Server-Timing entries under a prefix (proxy's "execute" -> "px-execute")
+        for entry in (header or "").split(","):
+            entry = entry.strip()
+            if entry:
+                self.upstream.append(prefix + entry)
+
+    def header(self) -> str:
+        # Repeated stages (e.g. several fetches) are summed
+        totals: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        own = [f"{name};dur={seconds * 1000.0:.3f}" for name, seconds in totals.items()]
+        return ", ".join(own + self.upstream)
+
+
+_CURRENT: ContextVar[Optional[Timings]] = ContextVar("server_timing", default=None)
+_STAGE_HIST: List[Histogram] = []
+
+
+def current_timings() -> Optional[Timings]:
+    return _CURRENT.get()
+
+
+def record_stage(name: str, seconds: float) -> None:
+    # Only inside an HTTP request: background work (probes, lag polling) is not a request stage
+    timings = _CURRENT.get()
+    if timings is None:
+        return
+    timings.add(name, seconds)
+    for hist in _STAGE_HIST:
+        hist.observe(seconds, name)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def observe_stages(hist: Histogram) -> None:
+    """Also feed every stage() duration into hist (labelled by stage name)."""
+    _STAGE_HIST.append(hist)
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware: per-request Timings, Server-Timing header (with a total) on the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = Timings()
+        token = _CURRENT.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings.add("total", time.perf_counter() - start)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _CURRENT.reset(token)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Single-pass SQL lexer shared by the Gatekeeper and the Proxy.
+
+scan(sql) tokenizes a statement once (comments and quoted literals skipped, MySQL
+/*! ... */ executable comments treated as code) and returns a SqlInfo with:
+- keyword: first keyword of the statement (WITH resolves to the statement it prefixes)
+- operation: "read" (SELECT/SHOW/DESC/DESCRIBE/EXPLAIN without a locking clause) or "write"
+- tables: referenced table names (lowercase, schema dropped)
+- locking: "for update" / "for share" / "lock in share mode" or ""
+- volatile: uses a non-deterministic function or a @variable (result not cacheable)
+- statements: number of statements separated by ';'
+- commands: DDL/DCL keywords used as commands anywhere (DROP, TRUNCATE TABLE, ALTER …)
+
+Results are memoized by statement text in a bounded LRU (statements longer than
+SCAN_CACHE_MAX_LEN are scanned every time, so big literal-heavy writes do not
+fill the cache). The Gatekeeper sends its result to the Proxy in the X-Sql-Info
+header (encode_header()/decode_header()) so the statement is not scanned twice.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+SCAN_CACHE_SIZE = int(os.getenv("SQL_SCAN_CACHE_SIZE", "4096"))
+SCAN_CACHE_MAX_LEN = int(os.getenv("SQL_SCAN_CACHE_MAX_LEN", "4096"))
+
+HEADER = "X-Sql-Info"
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ws>\s+)
+    | (?P<comment>--(?=\s|$)[^\n]*|\#[^\n]*|/\*(?![!])[\s\S]*?(?:\*/|$))
+    | (?P<exec>/\*!\d*|\*/)
+    | (?P<str>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    | (?P<ident>`(?:[^`]|``)*`)
+    | (?P<var>@@?[A-Za-z0-9_$.]*)
+    | (?P<word>[A-Za-z_$][A-Za-z0-9_$]*)
+    | (?P<num>[0-9][A-Za-z0-9_$.]*)
+    | (?P<punct>.)
+    """,
+    re.VERBOSE,
+)
+
+READ_KEYWORDS = frozenset({"select", "show", "desc", "describe", "explain"})
+COMMAND_KEYWORDS = frozenset({"drop", "truncate", "alter", "create", "rename", "grant", "revoke"})
+VOLATILE_FUNCTIONS = frozenset({
+    "now", "sysdate", "curdate", "curtime", "current_date", "current_time", "current_timestamp", "localtime",
+    "localtimestamp", "unix_timestamp", "utc_date", "utc_time", "utc_timestamp", "rand", "uuid", "uuid_short",
+    "connection_id", "last_insert_id", "found_rows", "row_count", "sleep", "get_lock", "user", "current_user",
+    "session_user", "system_user",
+})
+# Also valid without parentheses
+_BARE_VOLATILE = frozenset({
+    "current_date", "current_time", "current_timestamp", "localtime", "localtimestamp", "current_user",
+    "utc_date", "utc_time", "utc_timestamp",
+})
+# A table name follows these
+_TABLE_INTRO = frozenset({"from", "join", "straight_join", "into", "update", "table"})
+# Modifiers that may sit between the intro keyword and the table name
+_TABLE_SKIP = frozenset({"table", "ignore", "low_priority", "high_priority", "delayed", "quick", "only", "if", "not", "exists"})
+# End a comma-separated table list (FROM a, b / UPDATE a, b)
+_LIST_END = frozenset({
+    "where", "group", "order", "limit", "having", "join", "inner", "left", "right", "cross", "natural",
+    "straight_join", "union", "on", "using", "for", "lock", "window", "into", "set", "values", "select", "partition",
+})
+_NOT_TABLES = frozenset({"dual", "select", "with", "lateral"})
+
+
+class SqlInfo(NamedTuple):
+    keyword: str
+    operation: str
+    tables: FrozenSet[str]
+    locking: str
+    volatile: bool
+    statements: int
+    commands: FrozenSet[str]
+
+
+def _tokens(sql: str) -> List[Sequence[str]]:
+    out = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment", "exec"):
+            continue
+        value = m.group()
+        if kind == "word":
+            value = value.lower()
+        elif kind == "ident":
+            value = value[1:-1].replace("``", "`").lower()
+        out.append((kind, value))
+    return out
+
+
+def spans(sql: str) -> List[Tuple[str, str, int, int]]:
+    """Tokens as (kind, value, start, end) offsets into sql (for callers that rewrite the text)."""
+    out = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment", "exec"):
+            continue
+        value = m.group()
+        if kind == "word":
+            value = value.lower()
+        elif kind == "ident":
+            value = value[1:-1].replace("``", "`").lower()
+        out.append((kind, value, m.start(), m.end()))
+    return out
+
+
+def _scan(sql: str) -> SqlInfo:
+    toks = _tokens(sql)
+    n = len(toks)
+    first_words: List[str] = []
+    tables = set()
+    commands = set()
+    locking = ""
+    volatile = False
+    statements = 0
+    # Paren stack: True for subqueries (FROM/JOIN/IN (SELECT …)), False for expressions
+    # like EXTRACT(YEAR FROM d), whose FROM does not introduce a table
+    parens: List[bool] = []
+    # Paren depths currently inside a FROM/UPDATE table list (where ',' introduces another table)
+    lists = set()
+    start_of_statement = True
+    i = 0
+    while i < n:
+        kind, value = toks[i]
+        nxt = toks[i + 1] if i + 1 < n else ("", "")
+        if start_of_statement and kind != "punct":
+            statements += 1
+            first_words.append(value if kind == "word" else "")
+            start_of_statement = False
+        if kind == "punct":
+            if value == ";":
+                start_of_statement = True
+                parens.clear()
+                lists.clear()
+            elif value == "(":
+                prev = toks[i - 1][1] if i else ""
+                parens.append(nxt[1] in ("select", "with") or prev in _TABLE_INTRO)
+            elif value == ")":
+                if parens:
+                    parens.pop()
+                lists.discard(len(parens) + 1)
+            elif value == "," and len(parens) in lists:
+                i = _read_table(toks, i + 1, tables)
+                continue
+        elif kind == "var":
+            volatile = True
+        elif kind == "word":
+            if nxt == ("punct", "("):
+                # Function call (NOW(), TRUNCATE(x, 2)) unless it is FROM (subquery) and the like
+                if value in VOLATILE_FUNCTIONS:
+                    volatile = True
+            else:
+                if value in _BARE_VOLATILE:
+                    volatile = True
+                if value in COMMAND_KEYWORDS:
+                    commands.add(value)
+                if value == "for" and nxt[1] in ("update", "share"):
+                    locking = f"for {nxt[1]}"
+                elif value == "lock" and nxt[1] == "in":
+                    locking = "lock in share mode"
+            if value in _LIST_END:
+                lists.discard(len(parens))
+            # Not a table: ON DUPLICATE KEY UPDATE col = …, SELECT … FOR UPDATE
+            prev = toks[i - 1][1] if i else ""
+            intro = value in _TABLE_INTRO and not (value == "update" and prev in ("key", "for"))
+            if intro and (not parens or parens[-1]):
+                if value in ("from", "update"):
+                    lists.add(len(parens))
+                i = _read_table(toks, i + 1, tables)
+                continue
+        i += 1
+
+    words = [w for w in first_words if w]
+    keyword = words[0] if words else ""
+    if keyword == "with":
+        keyword = _with_target(toks)
+    op = "read" if keyword in READ_KEYWORDS and not locking else "write"
+    # Any non-read statement in a multi-statement text makes the whole text a write
+    if any(w not in READ_KEYWORDS and w != "with" for w in words):
+        op = "write"
+    return SqlInfo(keyword, op, frozenset(tables - _NOT_TABLES), locking, volatile, statements, frozenset(commands))
+
+
+def _read_table(toks: List[Sequence[str]], i: int, tables: set) -> int:
+    # [modifiers] name[.name]: records the table, returns the index after it
+    n = len(toks)
+    while i < n and toks[i][0] == "word" and toks[i][1] in _TABLE_SKIP:
+        i += 1
+    if i >= n or toks[i][0] not in ("word", "ident"):
+        return i
+    name = toks[i][1]
+    i += 1
+    if i + 1 < n and toks[i] == ("punct", ".") and toks[i + 1][0] in ("word", "ident"):
+        name = toks[i + 1][1]
+        i += 2
+    tables.add(name)
+    return i
+
+
+def _with_target(toks: List[Sequence[str]]) -> str:
+    # WITH cte AS (…) [, …] SELECT/INSERT/UPDATE/DELETE: first statement keyword at depth 0
+    depth = 0
+    for kind, value in toks[1:]:
+        if kind == "punct":
+            depth += 1 if value == "(" else -1 if value == ")" else 0
+        elif depth == 0 and kind == "word" and value in ("select", "insert", "update", "delete", "replace"):
+            return value
+    return "with"
+
+
+_scan_cached = lru_cache(maxsize=SCAN_CACHE_SIZE)(_scan)
+
+
+def scan(sql: str) -> SqlInfo:
+    return _scan_cached(sql) if len(sql) <= SCAN_CACHE_MAX_LEN else _scan(sql)
+
+
+def cache_stats() -> dict:
+    info = _scan_cached.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+# --- X-Sql-Info header (Gatekeeper -> Proxy) ---
+
+def _to_list(info: SqlInfo) -> list:
+    return [info.keyword, info.operation, sorted(info.tables), info.locking, int(info.volatile), info.statements, sorted(info.commands)]
+
+
+def _from_list(item: list) -> SqlInfo:
+    keyword, op, tables, locking, volatile, statements, commands = item
+    if op not in ("read", "write"):
+        raise ValueError(op)
+    return SqlInfo(str(keyword), op, frozenset(tables), str(locking), bool(volatile), int(statements), frozenset(commands))
+
+
+def encode_header(infos: Sequence[SqlInfo]) -> str:
+    return json.dumps([_to_list(i) for i in infos], separators=(",", ":"))
+
+
+def decode_header(header: Optional[str], count: int) -> Optional[List[SqlInfo]]:
+    """Infos from the header, or None if missing/malformed or not one per statement (caller scans itself)."""
+    if not header:
+        return None
+    try:
+        infos = [_from_list(item) for item in json.loads(header)]
+    except (ValueError, TypeError):
+        return None
+    return infos if len(infos) == count else None
@@ -71,6 +71,8 @@ mysql -uroot -p"${ROOT_PASS}" -e "SOURCE sakila-schema.sql; SOURCE sakila-data.s
 echo "[5/6] Create app and replication users"
 mysql -uroot -p"${ROOT_PASS}" -e "CREATE USER IF NOT EXISTS 'app'@'%' IDENTIFIED BY '${APP_PASS}';"
 mysql -uroot -p"${ROOT_PASS}" -e "GRANT ALL PRIVILEGES ON sakila.* TO 'app'@'%'; FLUSH PRIVILEGES;"
+# Lets the Proxy read SHOW REPLICA STATUS on workers (lag-aware strategy); replicated with the user
+mysql -uroot -p"${ROOT_PASS}" -e "GRANT REPLICATION CLIENT ON *.* TO 'app'@'%'; FLUSH PRIVILEGES;"
 mysql -uroot -p"${ROOT_PASS}" -e "CREATE USER IF NOT EXISTS 'repl'@'%' IDENTIFIED BY '${REPL_PASS}';"
 mysql -uroot -p"${ROOT_PASS}" -e "GRANT REPLICATION SLAVE ON *.* TO 'repl'@'%'; FLUSH PRIVILEGES;"
 
@@ -1,11 +1,13 @@
 #!/usr/bin/env bash
 # Minimal bootstrap for MySQL Worker: install MySQL + Sakila + configure replication to manager + sysbench
-# Usage (on worker): sudo bash setup_worker.sh MANAGER_PRIV_IP REPL_PASS ROOT_PASS
+# Usage (on worker): sudo bash setup_worker.sh MANAGER_PRIV_IP REPL_PASS ROOT_PASS [PHASE]
+# PHASE: all (default) | prepare (steps 1-4, the manager is not needed yet) | replicate (steps 5-6)
 set -euo pipefail
 
 MANAGER_IP="${1:?manager private IP required}"
 REPL_PASS="${2:-replpass}"
 ROOT_PASS="${3:-rootpass}"
+PHASE="${4:-all}"
 
 export DEBIAN_FRONTEND=noninteractive
 
@@ -23,34 +25,35 @@ retry_apt() {
   echo "apt failed after multiple attempts"; exit 1
 }
 
-echo "[1/6] Install MySQL and sysbench"
-retry_apt
-
-echo "[2/6] Configure root password and auth plugin (mysql_native_password)"
-mysql -uroot -e "ALTER USER 'root'@'localhost' IDENTIFIED WITH mysql_native_password BY '${ROOT_PASS}'; FLUSH PRIVILEGES;" || true
-
-echo "[3/6] Configure replica settings (server-id unique) and restart"
-CNF="/etc/mysql/mysql.conf.d/mysqld.cnf"
-# remove previous if present
-sed -i '/^server-id=/d' "$CNF" || true
-sed -i '/^gtid_mode=/d' "$CNF" || true
-sed -i '/^enforce_gtid_consistency=/d' "$CNF" || true
-sed -i '/^binlog_format=/d' "$CNF" || true
-sed -i '/^read_only=/d' "$CNF" || true
-sed -i '/^super_read_only=/d' "$CNF" || true
-
-# pick a pseudo-random server-id from instance-id hash if available; else use 2
-SID="2"
-if command -v curl >/dev/null 2>&1; then
-  TOKEN="$(curl -sS -m 0.5 -X PUT 'http://169.254.169.254/latest/api/token' -H 'X-aws-ec2-metadata-token-ttl-seconds: 21600' || true)"
-  IID="$(curl -sS -m 0.5 -H "X-aws-ec2-metadata-token: ${TOKEN:-}" 'http://169.254.169.254/latest/meta-data/instance-id' || true)"
-  if [[ -n "${IID:-}" ]]; then
-    SID="$(( (16#$(echo -n "$IID" | tail -c 4 | xxd -p 2>/dev/null || echo -n "0002")) % 4294967295 ))"
-    [[ "$SID" -lt 2 ]] && SID=2
+if [[ "$PHASE" != "replicate" ]]; then
+  echo "[1/6] Install MySQL and sysbench"
+  retry_apt
+
+  echo "[2/6] Configure root password and auth plugin (mysql_native_password)"
+  mysql -uroot -e "ALTER USER 'root'@'localhost' IDENTIFIED WITH mysql_native_password BY '${ROOT_PASS}'; FLUSH PRIVILEGES;" || true
+
+  echo "[3/6] Configure replica settings (server-id unique) and restart"
+  CNF="/etc/mysql/mysql.conf.d/mysqld.cnf"
+  # remove previous if present
+  sed -i '/^server-id=/d' "$CNF" || true
+  sed -i '/^gtid_mode=/d' "$CNF" || true
+  sed -i '/^enforce_gtid_consistency=/d' "$CNF" || true
+  sed -i '/^binlog_format=/d' "$CNF" || true
+  sed -i '/^read_only=/d' "$CNF" || true
+  sed -i '/^super_read_only=/d' "$CNF" || true
+
+  # pick a pseudo-random server-id from instance-id hash if available; else use 2
+  SID="2"
+  if command -v curl >/dev/null 2>&1; then
+    TOKEN="$(curl -sS -m 0.5 -X PUT 'http://169.254.169.254/latest/api/token' -H 'X-aws-ec2-metadata-token-ttl-seconds: 21600' || true)"
+    IID="$(curl -sS -m 0.5 -H "X-aws-ec2-metadata-token: ${TOKEN:-}" 'http://169.254.169.254/latest/meta-data/instance-id' || true)"
+    if [[ -n "${IID:-}" ]]; then
+      SID="$(( (16#$(echo -n "$IID" | tail -c 4 | xxd -p 2>/dev/null || echo -n "0002")) % 4294967295 ))"
+      [[ "$SID" -lt 2 ]] && SID=2
+    fi
   fi
-fi
 
-cat >> "$CNF" <<EOF
+  cat >> "$CNF" <<EOF
 
 # --- worker replication config (added by setup_worker.sh) ---
 server-id=${SID}
@@ -61,22 +64,28 @@ read_only=ON
 super_read_only=ON
 EOF
 
-systemctl restart mysql
-sleep 2
+  systemctl restart mysql
+  sleep 2
 
-echo "[3b] Temporarily disable read_only to import Sakila"
-mysql -uroot -p"${ROOT_PASS}" -e "SET GLOBAL super_read_only=OFF; SET GLOBAL read_only=OFF;"
+  echo "[3b] Temporarily disable read_only to import Sakila"
+  mysql -uroot -p"${ROOT_PASS}" -e "SET GLOBAL super_read_only=OFF; SET GLOBAL read_only=OFF;"
+
+  echo "[4/6] Install Sakila sample DB (schema + data)"
+  WORKDIR="/tmp/sakila"
+  mkdir -p "$WORKDIR"
+  cd "$WORKDIR"
+  if [[ ! -f sakila-db.tar.gz ]]; then
+    wget -q https://downloads.mysql.com/docs/sakila-db.tar.gz
+  fi
+  tar xzf sakila-db.tar.gz
+  cd sakila-db
+  mysql -uroot -p"${ROOT_PASS}" -e "SOURCE sakila-schema.sql; SOURCE sakila-data.sql;"
+fi
 
-echo "[4/6] Install Sakila sample DB (schema + data)"
-WORKDIR="/tmp/sakila"
-mkdir -p "$WORKDIR"
-cd "$WORKDIR"
-if [[ ! -f sakila-db.tar.gz ]]; then
-  wget -q https://downloads.mysql.com/docs/sakila-db.tar.gz
+if [[ "$PHASE" == "prepare" ]]; then
+  echo "Worker prepared (replication not configured yet)."
+  exit 0
 fi
-tar xzf sakila-db.tar.gz
-cd sakila-db
-mysql -uroot -p"${ROOT_PASS}" -e "SOURCE sakila-schema.sql; SOURCE sakila-data.sql;"
 
 echo "[5/6] Configure replication to manager (GTID auto position)"
 mysql -uroot -p"${ROOT_PASS}" -e "STOP SLAVE;" || true
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Per-API-key admission control for the Gatekeeper.
+
+Every key has a token bucket (rate requests/s, burst tokens) and a concurrency
+limit (requests forwarded to the Proxy at the same time). A request that finds
+no token or no free slot waits in the key's queue, in arrival order, as long as
+- fewer than queue requests of that key are already waiting, and
+- it can be served within queue_timeout seconds;
+otherwise it is rejected at once (Rejected -> HTTP 429 with Retry-After), so an
+overloaded backend sees at most its sustainable load instead of a growing backlog.
+
+rate = 0 disables the token bucket, concurrency = 0 the concurrency limit.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class KeyLimiter:
+    def __init__(
+        self,
+        name: str,
+        rate: float = 0.0,
+        burst: float = 0.0,
+        concurrency: int = 0,
+        queue: int = 0,
+        queue_timeout: float = 5.0,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst or rate)
+        self.concurrency = concurrency
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {}
+
+    def _reject(self, reason: str, retry_after: float) -> Rejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return Rejected(reason, retry_after)
+
+    def _reserve_token(self) -> float:
+        # Takes a token (the balance may go negative: later requests queue behind this one);
+        # returns how long to wait until it is actually available
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        delay = 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+        if delay > 0 and (self.waiting >= self.queue or delay > self.queue_timeout):
+            raise self._reject("rate", delay)
+        self.tokens -= 1.0
+        return delay
+
+    async def acquire(self) -> None:
+        """Admit one request (waiting in the queue if needed) or raise Rejected. Pair with release()."""
+        slot_free = self.concurrency <= 0 or (self.in_flight < self.concurrency and not self._slots)
+        if not slot_free and self.waiting >= self.queue:
+            raise self._reject("queue_full", self.queue_timeout)
+        delay = self._reserve_token()
+        if delay <= 0 and slot_free:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        deadline = time.monotonic() + self.queue_timeout
+        self.waiting += 1
+        self.queued += 1
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.concurrency > 0 and (self.in_flight >= self.concurrency or self._slots):
+                await self._wait_slot(deadline)
+            else:
+                self.in_flight += 1
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+
+    async def _wait_slot(self, deadline: float) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        self._slots.append(fut)
+        try:
+            # release() hands its slot over directly (in_flight already counts us)
+            await asyncio.wait_for(asyncio.shield(fut), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if fut.done():
+                return  # handed over just as the wait timed out
+            self._slots.remove(fut)
+            fut.cancel()
+            raise self._reject("queue_timeout", self.queue_timeout) from None
+        except BaseException:
+            # Cancelled (client gone): give back a slot we were handed, or leave the queue
+            if fut.done():
+                self.release()
+            else:
+                self._slots.remove(fut)
+                fut.cancel()
+            raise
+
+    def release(self) -> None:
+        while self._slots:
+            fut = self._slots.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "rate": self.rate,
+            "burst": self.burst if self.rate > 0 else None,
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def build_limiters(keys: List[Dict[str, Any]], defaults: Dict[str, Any], processes: int = 1) -> Dict[str, KeyLimiter]:
+    """
+    API key -> limiter. keys: [{"key": "...", "name": "...", "rate": …, "burst": …, "concurrency": …,
+    "queue": …, "queue_timeout": …}, ...]; missing fields come from defaults. With several worker
+    processes each one enforces its share of the rate, burst, concurrency and queue.
+    """
+    out: Dict[str, KeyLimiter] = {}
+    for i, k in enumerate(keys):
+        c = {**defaults, **k}
+        share = max(1, processes)
+        out[str(c["key"])] = KeyLimiter(
+            name=str(c.get("name") or f"key{i + 1}"),
+            rate=float(c["rate"]) / share,
+            burst=float(c["burst"]) / share,
+            concurrency=_share(int(c["concurrency"]), share),
+            queue=_share(int(c["queue"]), share),
+            queue_timeout=float(c["queue_timeout"]),
+        )
+    return out
+
+
+def _share(limit: int, processes: int) -> int:
+    return 0 if limit <= 0 else max(1, math.ceil(limit / processes))
+
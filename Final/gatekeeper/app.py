@@ -1,16 +1,44 @@
 #!/usr/bin/env python3
 import os
+import sys
+import asyncio
 import json
-from typing import Dict
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+from urllib.parse import quote
 
 from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-import requests
+import aiohttp
 
-app = FastAPI(title="Simple Gatekeeper")
+# Modules shared with the Proxy (Final/common, deployed next to this directory)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
+from admission import KeyLimiter, Rejected, build_limiters, retry_after_header
+from bus import Bus, default_directory
+from metrics import Registry, ServerTimingMiddleware, current_timings, observe_stages, stage
+from sqlscan import HEADER as SQL_INFO_HEADER, SqlInfo, encode_header, scan
 
 API_KEY = os.getenv("API_KEY", "changeme")
+# Several API keys with their own limits: keys.json next to app.py (or the path in API_KEYS_CONFIG),
+# {"keys": [{"key": "...", "name": "...", "rate": 50, "concurrency": 10}, ...]}; without it API_KEY is the only key
+# /metrics is open like /health so Prometheus can scrape it without custom headers;
+# METRICS_REQUIRE_KEY=1 puts it behind X-API-Key (the scrape job then sends the header)
+METRICS_REQUIRE_KEY = os.getenv("METRICS_REQUIRE_KEY", "0") == "1"
+API_KEYS_CONFIG = Path(os.getenv("API_KEYS_CONFIG", str(Path(__file__).resolve().parent / "keys.json")))
+# Per-key defaults: token bucket (RATE_LIMIT req/s, 0 = off; RATE_BURST tokens, 0 = RATE_LIMIT),
+# MAX_CONCURRENCY requests in flight to the proxy (0 = off), at most MAX_QUEUE waiting up to QUEUE_TIMEOUT s
+KEY_DEFAULTS = {
+    "rate": float(os.getenv("RATE_LIMIT", "0")),
+    "burst": float(os.getenv("RATE_BURST", "0")),
+    "concurrency": int(os.getenv("MAX_CONCURRENCY", "64")),
+    "queue": int(os.getenv("MAX_QUEUE", "256")),
+    "queue_timeout": float(os.getenv("QUEUE_TIMEOUT", "5")),
+}
 # Either provide PROXY_URL directly (e.g., http://10.0.0.12:8080/query)
 # or PROXY_HOST/PROXY_PORT to build it.
 PROXY_URL = os.getenv("PROXY_URL")
@@ -18,50 +46,373 @@ if not PROXY_URL:
     proxy_host = os.getenv("PROXY_HOST", "127.0.0.1")
     proxy_port = int(os.getenv("PROXY_PORT", "8080"))
     PROXY_URL = f"http://{proxy_host}:{proxy_port}/query"
+PROXY_BASE = PROXY_URL[: -len("/query")] if PROXY_URL.endswith("/query") else PROXY_URL.rstrip("/")
+PROXY_BATCH_URL = f"{PROXY_BASE}/batch"
+
+# Shared keep-alive client to the Proxy (bounded pool + timeouts)
+PROXY_POOL_SIZE = int(os.getenv("PROXY_POOL_SIZE", "100"))
+PROXY_KEEPALIVE = float(os.getenv("PROXY_KEEPALIVE", "30"))
+PROXY_TIMEOUT = float(os.getenv("PROXY_TIMEOUT", "10"))
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "2"))
+
+# Streamed responses (stream=1) may last longer than PROXY_TIMEOUT in total;
+# only the gap between two chunks is bounded
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=PROXY_CONNECT_TIMEOUT, sock_read=PROXY_TIMEOUT)
+
+# Worker processes (uvicorn workers); each keeps its own proxy connection pool.
+# With more than one, metrics are shared over a local Unix socket bus.
+PROCESSES = int(os.getenv("PROCESSES", "1"))
+BUS_DIR = os.getenv("BUS_DIR") or default_directory(f"gatekeeper-{os.getenv('PORT', '80')}")
+METRICS_SHARE_INTERVAL = 1.0
+
+# Largest X-Sql-Info header forwarded (servers commonly cap all headers at 8-16 KiB)
+SQL_INFO_MAX_BYTES = 4096
+
+
+
+def load_keys() -> List[Dict[str, Any]]:
+    if not API_KEYS_CONFIG.exists():
+        return [{"key": API_KEY, "name": "default"}]
+    with open(API_KEYS_CONFIG, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    keys = data["keys"] if isinstance(data, dict) else data
+    print(f"[gatekeeper] {len(keys)} API key(s) from {API_KEYS_CONFIG}")
+    return keys
+
+
+HTTP: Optional[aiohttp.ClientSession] = None
+BUS = Bus("gatekeeper", BUS_DIR) if PROCESSES > 1 else None
+# Each process enforces its share of every key's limits
+LIMITERS: Dict[str, KeyLimiter] = build_limiters(load_keys(), KEY_DEFAULTS, PROCESSES)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    global HTTP
+    HTTP = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=PROXY_POOL_SIZE,
+            limit_per_host=PROXY_POOL_SIZE,
+            keepalive_timeout=PROXY_KEEPALIVE,
+        ),
+        timeout=aiohttp.ClientTimeout(total=PROXY_TIMEOUT, sock_connect=PROXY_CONNECT_TIMEOUT),
+    )
+    sharing = None
+    if BUS is not None:
+        BUS.subscribe("metrics", lambda d: METRICS.load_peer(d[0], d[1]))
+        BUS.start()
+        sharing = asyncio.get_running_loop().create_task(share_metrics())
+    yield
+    if sharing is not None:
+        sharing.cancel()
+        BUS.close()
+    await HTTP.close()
+
+
+async def share_metrics():
+    while True:
+        BUS.publish("metrics", [os.getpid(), METRICS.export()])
+        await asyncio.sleep(METRICS_SHARE_INTERVAL)
+
+
+app = FastAPI(title="Simple Gatekeeper", lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
+
+METRICS = Registry()
+REQUESTS = METRICS.counter(
+    "gatekeeper_requests_total", "Requests by endpoint, strategy and HTTP status", ("endpoint", "strategy", "status")
+)
+REQUEST_SECONDS = METRICS.histogram(
+    "gatekeeper_request_duration_seconds", "Request latency (until the response headers are ready)", ("endpoint", "strategy")
+)
+observe_stages(METRICS.histogram(
+    "gatekeeper_stage_duration_seconds", "Per-request stage durations (auth/validate/admit/proxy)", ("stage",)
+))
+REJECTED = METRICS.counter(
+    "gatekeeper_rejected_total", "Requests rejected with 429 by API key and reason", ("key", "reason")
+)
+METRICS.gauge(
+    "gatekeeper_in_flight", "Admitted requests not finished yet, by API key", ("key",),
+    collect=lambda: [((l.name,), l.in_flight) for l in LIMITERS.values()],
+)
+METRICS.gauge(
+    "gatekeeper_queued", "Requests waiting for admission, by API key", ("key",),
+    collect=lambda: [((l.name,), l.waiting) for l in LIMITERS.values()],
+)
 
 
 class QueryBody(BaseModel):
     sql: str
+    params: Optional[List[Any]] = None
+    # Paginated READ: rows per page, and the "next" token of the previous page
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+
+
+class Statement(BaseModel):
+    sql: str
+    params: Optional[List[Any]] = None
+
+
+class BatchBody(BaseModel):
+    statements: List[Union[str, Statement]]
+
+
+BLOCKED_COMMANDS = frozenset({"drop", "truncate", "alter"})
 
 
-def is_safe_sql(sql: str) -> bool:
+def is_safe_sql(info: SqlInfo) -> bool:
     """
     Minimal validation: block obviously dangerous statements.
-    Keep it simple: substring-based detection.
+    Works on the lexer's tokens, so keywords inside literals or comments do not count
+    and a command hidden behind a comment or after ';' does.
     """
-    s = sql.lower()
-    blocked = ["drop ", "truncate ", "alter "]
-    return not any(b in s for b in blocked)
+    return not (info.commands & BLOCKED_COMMANDS)
 
 
 @app.get("/health")
-def health():
-    return {"status": "ok", "proxy_url": PROXY_URL}
+async def health():
+    return {
+        "status": "ok",
+        "proxy_url": PROXY_URL,
+        "processes": PROCESSES,
+        "keys": [l.stats() for l in LIMITERS.values()],
+    }
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    if METRICS_REQUIRE_KEY:
+        check_api_key(request)
+    return Response(METRICS.render(), media_type=Registry.CONTENT_TYPE)
+
+
+def check_api_key(request: Request) -> KeyLimiter:
+    # Simple AuthN via X-API-Key header; the key's limiter does admission control
+    limiter = LIMITERS.get(request.headers.get("x-api-key") or "")
+    if limiter is None:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return limiter
+
+
+async def admit(limiter: KeyLimiter) -> None:
+    # Waits for a token and a concurrency slot of the key, or fails fast with 429
+    try:
+        with stage("admit"):
+            await limiter.acquire()
+    except Rejected as e:
+        REJECTED.inc(limiter.name, e.reason)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests ({e.reason})",
+            headers={"Retry-After": retry_after_header(e.retry_after)},
+        )
+
+
+def forward_headers(request: Request, infos: List[SqlInfo]) -> Dict[str, str]:
+    # X-Session-Id enables read-your-writes routing in the proxy; X-Sql-Info saves it re-scanning
+    # the SQL (left out when too large for a header, e.g. big batches: the proxy scans itself)
+    headers = {}
+    sql_info = encode_header(infos)
+    if len(sql_info) <= SQL_INFO_MAX_BYTES:
+        headers[SQL_INFO_HEADER] = sql_info
+    session_id = request.headers.get("x-session-id")
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    # Response encoding is negotiated by the proxy (JSON, MessagePack, columnar); the body is relayed as-is
+    accept = request.headers.get("accept")
+    if accept:
+        headers["Accept"] = accept
+    return headers
+
+
+def upstream_timing(header: Optional[str]) -> None:
+    # Proxy stages appear in our Server-Timing header as px-<stage>
+    timings = current_timings()
+    if timings is not None:
+        timings.add_upstream(header, "px-")
+
+
+async def forward(url: str, params: Dict[str, str], payload: dict, headers: Dict[str, str]) -> Response:
+    # Forward as-is to Proxy (Trusted Host) on a pooled keep-alive connection;
+    # the proxy's body is passed through without re-parsing
+    assert HTTP is not None
+    try:
+        with stage("proxy"):
+            async with HTTP.post(url, params=params, json=payload, headers=headers) as resp:
+                content = await resp.read()
+        upstream_timing(resp.headers.get("server-timing"))
+        # Back-pressure from the proxy (429 when its write queue is full) keeps its Retry-After
+        retry_after = resp.headers.get("retry-after")
+        return Response(
+            content=content,
+            status_code=resp.status,
+            media_type=resp.headers.get("content-type", "application/json"),
+            headers={"Retry-After": retry_after} if retry_after else None,
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"Proxy unreachable: {e}")
+
+
+class RelayResponse(StreamingResponse):
+    """StreamingResponse that calls cleanup() however it ends, also if the body was never started."""
+
+    def __init__(self, content: Any, cleanup: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cleanup()
+
+
+async def forward_stream(
+    url: str, params: Dict[str, str], payload: dict, headers: Dict[str, str], on_close: Callable[[], None]
+) -> StreamingResponse:
+    # Pipe the proxy's NDJSON byte stream chunk by chunk; on_close() runs once the relay ends
+    assert HTTP is not None
+    try:
+        # Until the proxy's response headers; the body is relayed afterwards
+        with stage("proxy"):
+            resp = await HTTP.post(url, params=params, json=payload, headers=headers, timeout=STREAM_TIMEOUT)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"Proxy unreachable: {e}")
+    upstream_timing(resp.headers.get("server-timing"))
+
+    finished = False
+    closed = False
+
+    def close() -> None:
+        # Once, from the end of the relay or of the response (a client gone before the first
+        # chunk never starts relay()): the admission slot and the upstream connection are freed
+        nonlocal closed
+        if closed:
+            return
+        closed = True
+        if finished:
+            resp.release()
+        else:
+            resp.close()
+        on_close()
+
+    async def relay():
+        nonlocal finished
+        try:
+            async for chunk in resp.content.iter_any():
+                yield chunk
+            finished = True
+        finally:
+            close()
+
+    return RelayResponse(
+        relay(),
+        close,
+        status_code=resp.status,
+        media_type=resp.headers.get("content-type", "application/x-ndjson"),
+    )
 
 
 @app.post("/query")
-def forward_query(
+async def forward_query(
     request: Request,
     body: QueryBody,
-    strategy: str = Query("direct")
+    strategy: str = Query("direct"),
+    stream: bool = Query(False),
+    ack: Optional[str] = Query(None),
 ):
-    # Simple AuthN via X-API-Key header
-    api_key = request.headers.get("x-api-key")
-    if api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    start = time.perf_counter()
+    status = 500
+    limiter: Optional[KeyLimiter] = None
+    try:
+        with stage("auth"):
+            key_limiter = check_api_key(request)
+
+        # Minimal validation
+        with stage("validate"):
+            info = scan(body.sql)
+            safe = is_safe_sql(info)
+        if not safe:
+            raise HTTPException(status_code=400, detail="Unsafe SQL detected")
+
+        await admit(key_limiter)
+        limiter = key_limiter
+        # Only the SQL template is validated; params are bound by the DB, never spliced into it
+        payload = body.model_dump(exclude_none=True)
+        headers = forward_headers(request, [info])
+        if stream:
+            # The concurrency slot is held until the stream has been relayed
+            resp = await forward_stream(PROXY_URL, {"strategy": strategy, "stream": "1"}, payload, headers, limiter.release)
+            limiter = None
+        else:
+            params = {"strategy": strategy, "ack": ack} if ack else {"strategy": strategy}
+            resp = await forward(PROXY_URL, params, payload, headers)
+        status = resp.status_code
+        return resp
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        if limiter is not None:
+            limiter.release()
+        REQUESTS.inc("query", strategy, str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, "query", strategy)
+
+
+@app.post("/batch")
+async def forward_batch(
+    request: Request,
+    body: BatchBody,
+    strategy: str = Query("direct"),
+):
+    start = time.perf_counter()
+    status = 500
+    limiter: Optional[KeyLimiter] = None
+    try:
+        with stage("auth"):
+            key_limiter = check_api_key(request)
+
+        # Every statement must pass validation, otherwise nothing is forwarded
+        with stage("validate"):
+            statements = [s if isinstance(s, str) else s.model_dump(exclude_none=True) for s in body.statements]
+            infos = [scan(s if isinstance(s, str) else s["sql"]) for s in statements]
+            unsafe = [i for i, info in enumerate(infos) if not is_safe_sql(info)]
+        if unsafe:
+            raise HTTPException(status_code=400, detail=f"Unsafe SQL detected in statements {unsafe}")
+
+        # A batch takes one token and one slot, like a query
+        await admit(key_limiter)
+        limiter = key_limiter
+        resp = await forward(PROXY_BATCH_URL, {"strategy": strategy}, {"statements": statements}, forward_headers(request, infos))
+        status = resp.status_code
+        return resp
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        if limiter is not None:
+            limiter.release()
+        REQUESTS.inc("batch", strategy, str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, "batch", strategy)
 
-    # Minimal validation
-    if not is_safe_sql(body.sql):
-        raise HTTPException(status_code=400, detail="Unsafe SQL detected")
 
-    # Forward as-is to Proxy (Trusted Host)
+@app.get("/writes/{ticket}")
+async def write_status(request: Request, ticket: str):
+    # Outcome of an ack=queued WRITE (polled by clients, which cannot reach the proxy)
+    check_api_key(request)
+    assert HTTP is not None
     try:
-        resp = requests.post(f"{PROXY_URL}?strategy={strategy}", json={"sql": body.sql}, timeout=10)
-        return resp.json(), resp.status_code
-    except requests.RequestException as e:
+        async with HTTP.get(f"{PROXY_BASE}/writes/{quote(ticket, safe='')}") as resp:
+            content = await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         raise HTTPException(status_code=502, detail=f"Proxy unreachable: {e}")
+    return Response(content=content, status_code=resp.status, media_type=resp.headers.get("content-type", "application/json"))
 
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "80"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    if PROCESSES > 1:
+        uvicorn.run("app:app", host="0.0.0.0", port=port, workers=PROCESSES, app_dir=str(Path(__file__).resolve().parent))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
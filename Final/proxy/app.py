@@ -1,198 +1,1543 @@
 #!/usr/bin/env python3
 import os
+import sys
+import asyncio
 import json
-import time
+import math
 import random
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Tuple, Any, cast
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
-from fastapi import FastAPI, HTTPException, Query
+import anyio.to_thread
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
-import mysql.connector
-from mysql.connector import Error as MySQLError
+# Modules shared with the Gatekeeper (Final/common, deployed next to this directory)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))
+
+from bus import Bus, default_directory
+from metrics import Registry, ServerTimingMiddleware, current_timings, observe_stages, stage
+from backends import BatchError, DBError, NodeError, PoolExhausted, make_backend
+from breaker import CircuitBreakers
+from batch import coalesce_items
+from loadbalance import LoadTracker
+from encoding import JSON, available as available_encodings, encode, ndjson_line, negotiate
+from cache import ResultCache, estimate_bytes, is_cacheable, normalize_sql, write_tables
+from prober import LatencyProber
+from paging import Cursor, CursorsFull, CursorTable, decode_token, encode_token, query_hash
+from querylog import QueryLog, fingerprint
+from replication import ReplicationMonitor, SessionGtids
+from scatter import ScatterPlan, ScatterUnsupported, plan as scatter_plan
+from singleflight import SingleFlight
+from writequeue import QueueFull, QueuedWrite, WriteQueue
+from sqlscan import SqlInfo, decode_header, scan
+from sqlscan import cache_stats as sql_scan_stats
 
 
 APP_DIR = Path(__file__).resolve().parent
-CONFIG_PATH = APP_DIR / "config.json"
+CONFIG_PATH = Path(os.getenv("PROXY_CONFIG", str(APP_DIR / "config.json")))
 
-# Load config (written by boto_up_final.py)
+# Load config (written by boto_up_final.py; PROXY_CONFIG points elsewhere, e.g. for local benchmarks)
 with open(CONFIG_PATH, "r", encoding="utf-8") as f:
     CONFIG = json.load(f)
 
-MANAGER = CONFIG["manager"]                      # {"host": "...", "port": 3306}
-WORKERS: List[dict] = CONFIG.get("workers", [])  # [{"host":"...", "port":3306}, ...]
+
+
+def parse_topology(data: dict) -> Tuple[dict, List[dict]]:
+    # {"manager": {"host": "...", "port": 3306}, "workers": [{"host": "...", "port": 3306}, ...]}
+    def node(n: dict) -> dict:
+        return {"host": str(n["host"]), "port": int(n.get("port", 3306))}
+
+    return node(data["manager"]), [node(w) for w in data.get("workers", [])]
+
+
+# Replaced as a whole when the topology changes (config file edit or POST /topology)
+MANAGER, WORKERS = parse_topology(CONFIG)
 
 LISTEN_PORT = int(CONFIG.get("listen_port", 8080))
 
+# Worker processes (uvicorn workers). With more than one, cache invalidations and
+# read-your-writes sessions are broadcast over a local Unix socket bus and one
+# elected process runs the prober/lag monitor and shares their tables.
+PROCESSES = int(os.getenv("PROCESSES", "1"))
+BUS_DIR = os.getenv("BUS_DIR") or default_directory(f"dbproxy-{LISTEN_PORT}")
+
 # Credentials from environment (keep it minimal and configurable)
 DB_USER = os.getenv("DB_USER", "app")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
 DB_NAME = os.getenv("DB_NAME", "sakila")
 
-app = FastAPI(title="Simple DB Proxy (Trusted Host)")
+# Execution path: sync (mysql-connector in threadpool) | async (aiomysql on the event loop) | fake (no MySQL, local benchmarks)
+DB_DRIVER = os.getenv("DB_DRIVER", "sync")
+# Upper bound on opening a connection to a node that does not answer
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "2"))
+# Threadpool size for the sync path (Starlette default: 40)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+
+# Connection pool sizing (per node)
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "20"))
+POOL_IDLE_TIMEOUT = float(os.getenv("POOL_IDLE_TIMEOUT", "300"))
+POOL_PING_AFTER = float(os.getenv("POOL_PING_AFTER", "1.0"))
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("POOL_CHECKOUT_TIMEOUT", "5"))
+
+# Background latency probing (custom strategy)
+PROBE_INTERVAL = float(os.getenv("PROBE_INTERVAL", "1.0"))
+PROBE_EWMA_ALPHA = float(os.getenv("PROBE_EWMA_ALPHA", "0.3"))
+PROBE_WINDOW = int(os.getenv("PROBE_WINDOW", "60"))
+PROBE_FAIL_THRESHOLD = int(os.getenv("PROBE_FAIL_THRESHOLD", "3"))
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", "2.0"))
+
+# Replication lag monitoring (lag-aware strategy) and read-your-writes sessions
+LAG_POLL_INTERVAL = float(os.getenv("LAG_POLL_INTERVAL", "1.0"))
+LAG_MAX_SECONDS = float(os.getenv("LAG_MAX_SECONDS", "5"))
+RYW_MAX_SESSIONS = int(os.getenv("RYW_MAX_SESSIONS", "10000"))
+RYW_SESSION_TTL = float(os.getenv("RYW_SESSION_TTL", "300"))
+
+# least-loaded strategy: latency EWMA factor and manager weight as a read target (0 = never)
+LOAD_EWMA_ALPHA = float(os.getenv("LOAD_EWMA_ALPHA", "0.2"))
+LEAST_LOADED_MANAGER_WEIGHT = float(os.getenv("LEAST_LOADED_MANAGER_WEIGHT", "0"))
+
+# Circuit breakers (per node): open after N consecutive node failures, half-open trial after the timeout
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "5"))
+CIRCUIT_HALF_OPEN_MAX = int(os.getenv("CIRCUIT_HALF_OPEN_MAX", "1"))
+# A READ whose node fails is retried on another node (at most this many times)
+READ_RETRIES = int(os.getenv("READ_RETRIES", "1"))
+
+STRATEGY_PATTERN = "^(direct|random|custom|lag-aware|least-loaded|scatter)$"
+
+# Streaming reads (?stream=1): rows fetched per round trip from the unbuffered cursor
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "500"))
+
+# /batch: max statements per request, max rows per coalesced multi-row INSERT
+BATCH_MAX_STATEMENTS = int(os.getenv("BATCH_MAX_STATEMENTS", "1000"))
+BATCH_INSERT_ROWS = int(os.getenv("BATCH_INSERT_ROWS", "1000"))
+
+# Server-side prepared statements kept per pooled connection (sync driver, parameterized queries)
+PREPARED_CACHE_SIZE = int(os.getenv("PREPARED_CACHE_SIZE", "64"))
+
+# Optional read-result cache (off by default)
+RESULT_CACHE = os.getenv("RESULT_CACHE", "0") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "5"))
+CACHE_WRITE_HOLD = float(os.getenv("CACHE_WRITE_HOLD", "1.0"))
+
+# Topology hot reload: config file checked every TOPOLOGY_WATCH_INTERVAL s (0 = off);
+# removed nodes get up to DRAIN_TIMEOUT s for their in-flight queries before their pools close
+TOPOLOGY_WATCH_INTERVAL = float(os.getenv("TOPOLOGY_WATCH_INTERVAL", "2"))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+
+# Identical concurrent READs on the same node share one execution (on by default)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+# scatter strategy: split key per table ("rental=rental_id,..."; default <table>_id, the Sakila
+# primary keys), smallest key range worth splitting, how long a table's key bounds are reused
+SCATTER_KEYS = {
+    t.strip(): k.strip() for t, _, k in (p.partition("=") for p in os.getenv("SCATTER_KEYS", "").split(",")) if k
+}
+SCATTER_MIN_KEYS = int(os.getenv("SCATTER_MIN_KEYS", "10000"))
+SCATTER_BOUNDS_TTL = float(os.getenv("SCATTER_BOUNDS_TTL", "60"))
+
+# Query log: last QUERY_LOG_SIZE requests (0 = off), and as many of those taking >= SLOW_QUERY_MS;
+# aggregates for at most QUERY_LOG_FINGERPRINTS normalized statements
+QUERY_LOG_SIZE = int(os.getenv("QUERY_LOG_SIZE", "1000"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+QUERY_LOG_FINGERPRINTS = int(os.getenv("QUERY_LOG_FINGERPRINTS", "1000"))
+
+# ack=queued WRITEs: queue bound (0 = off), group commit size/interval, optional journal
+# directory (durable queue; WRITE_QUEUE_FSYNC=1 syncs every accepted write), how long
+# ticket results are kept, delay before retrying a group whose commit failed on a node error
+WRITE_QUEUE_MAX = int(os.getenv("WRITE_QUEUE_MAX", "10000"))
+WRITE_GROUP_SIZE = int(os.getenv("WRITE_GROUP_SIZE", "200"))
+WRITE_GROUP_INTERVAL_MS = float(os.getenv("WRITE_GROUP_INTERVAL_MS", "20"))
+WRITE_QUEUE_JOURNAL = os.getenv("WRITE_QUEUE_JOURNAL", "")
+WRITE_QUEUE_FSYNC = os.getenv("WRITE_QUEUE_FSYNC", "0") == "1"
+WRITE_TICKET_TTL = float(os.getenv("WRITE_TICKET_TTL", "300"))
+WRITE_RETRY_INTERVAL = float(os.getenv("WRITE_RETRY_INTERVAL", "1"))
+
+# Paginated READs (page_size): largest page, how long an idle server-side cursor is kept
+# (below MySQL's net_write_timeout, 60s), open cursors per node (each holds a pooled connection)
+PAGE_MAX_ROWS = int(os.getenv("PAGE_MAX_ROWS", "10000"))
+CURSOR_IDLE_TIMEOUT = float(os.getenv("CURSOR_IDLE_TIMEOUT", "30"))
+CURSOR_MAX_PER_NODE = int(os.getenv("CURSOR_MAX_PER_NODE", "8"))
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Warm pools for every known node, then probe workers in background
+    await BACKEND.start([MANAGER] + WORKERS)
+    if WRITES is not None:
+        WRITES.start()
+    CURSORS.start()
+    PROBER.set_nodes(WORKERS)
+    REPLICATION.set_nodes(MANAGER, WORKERS)
+    watcher = None
+    if TOPOLOGY_WATCH_INTERVAL > 0:
+        watcher = asyncio.get_running_loop().create_task(watch_config())
+    sharing = None
+    if BUS is None:
+        PROBER.start()
+        REPLICATION.start()
+    else:
+        BUS.start()
+        sharing = asyncio.get_running_loop().create_task(share_routing_state())
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if sharing is not None:
+        sharing.cancel()
+    if WRITES is not None:
+        await WRITES.stop()
+    await CURSORS.stop()
+    await REPLICATION.stop()
+    await PROBER.stop()
+    if BUS is not None:
+        BUS.close()
+    await BACKEND.close()
+
+
+async def share_routing_state():
+    # One process per host probes/polls (flock leader); it broadcasts the resulting
+    # tables and the other processes route from the copies. Leadership moves to a
+    # surviving process if the leader exits. Every process also shares its metrics
+    # so /metrics reports the whole service whichever process answers.
+    interval = min(PROBE_INTERVAL, LAG_POLL_INTERVAL)
+    while True:
+        if not BUS.is_leader and BUS.try_lead():
+            print(f"[bus] pid {os.getpid()} runs latency probing and lag polling")
+            PROBER.start()
+            REPLICATION.start()
+        if BUS.is_leader:
+            BUS.publish("routing", {"latency": PROBER.export_state(), "replication": REPLICATION.export_state()})
+        BUS.publish("metrics", [os.getpid(), METRICS.export()])
+        if QUERY_LOG is not None:
+            BUS.publish("querylog", [os.getpid(), QUERY_LOG.export()])
+        await asyncio.sleep(interval)
+
+
+app = FastAPI(title="Simple DB Proxy (Trusted Host)", lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
 
 
 class QueryBody(BaseModel):
     sql: str
+    # Values for %s placeholders in sql (sent separately, never spliced into the text)
+    params: Optional[List[Any]] = None
+    # Paginated READ: rows per page; the "next" token of the previous page (same sql and params)
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+
+
+class Statement(BaseModel):
+    sql: str
+    params: Optional[List[Any]] = None
+
+
+class BatchBody(BaseModel):
+    # Plain SQL strings or {"sql": ..., "params": [...]}
+    statements: List[Union[str, Statement]]
+
+
+class NodeAddr(BaseModel):
+    host: str
+    port: int = 3306
+
+
+class ExplainBody(BaseModel):
+    # A fingerprint id from /queries/top (its last statement is explained), or a statement
+    id: Optional[str] = None
+    sql: Optional[str] = None
+    params: Optional[List[Any]] = None
+    # "manager", a worker's host or host:port; default: where the statement last ran
+    node: Optional[str] = None
+    format: str = "traditional"
+    # EXPLAIN ANALYZE runs the statement (READs only)
+    analyze: bool = False
+
+
+class TopologyBody(BaseModel):
+    manager: NodeAddr
+    workers: List[NodeAddr] = []
+
+
+def sql_infos(header: Optional[str], stmts: List[str]) -> List[SqlInfo]:
+    # READ if SELECT/SHOW/DESC/DESCRIBE/EXPLAIN without a locking clause; otherwise WRITE.
+    # The Gatekeeper already scanned the statements and sends the result (X-Sql-Info);
+    # requests without it (or with a malformed one) are scanned here.
+    return decode_header(header, len(stmts)) or [scan(sql) for sql in stmts]
+
 
+BACKEND = make_backend(
+    DB_DRIVER,
+    DB_USER,
+    DB_PASSWORD,
+    DB_NAME,
+    stmt_cache_size=PREPARED_CACHE_SIZE,
+    connect_timeout=DB_CONNECT_TIMEOUT,
+    min_size=POOL_MIN_SIZE,
+    max_size=POOL_MAX_SIZE,
+    idle_timeout=POOL_IDLE_TIMEOUT,
+    ping_after=POOL_PING_AFTER,
+    checkout_timeout=POOL_CHECKOUT_TIMEOUT,
+)
 
-def classify_sql(sql: str) -> str:
-    s = sql.lstrip().lower()
-    # READ if SELECT/SHOW/DESC/DESCRIBE/EXPLAIN (not FOR UPDATE); otherwise WRITE
-    if (
-        s.startswith("select")
-        or s.startswith("show")
-        or s.startswith("desc")
-        or s.startswith("describe")
-        or s.startswith("explain")
-    ) and "for update" not in s:
-        return "read"
-    return "write"
-
-
-def connect(host: str, port: int):
-    return mysql.connector.connect(
-        host=host,
-        port=port,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        database=DB_NAME,
-        connection_timeout=5,
+PROBER = LatencyProber(
+    BACKEND.ping,
+    interval=PROBE_INTERVAL,
+    alpha=PROBE_EWMA_ALPHA,
+    window=PROBE_WINDOW,
+    fail_threshold=PROBE_FAIL_THRESHOLD,
+    timeout=PROBE_TIMEOUT,
+)
+
+REPLICATION = ReplicationMonitor(BACKEND.read, interval=LAG_POLL_INTERVAL, max_lag_s=LAG_MAX_SECONDS, timeout=PROBE_TIMEOUT)
+LOAD = LoadTracker(alpha=LOAD_EWMA_ALPHA)
+# Per process: each one opens/closes its breakers from the failures it sees itself
+BREAKERS = CircuitBreakers(
+    (NodeError,),
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    half_open_max=CIRCUIT_HALF_OPEN_MAX,
+)
+SESSIONS = SessionGtids(max_sessions=RYW_MAX_SESSIONS, ttl=RYW_SESSION_TTL)
+
+CACHE = (
+    ResultCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL, write_hold=CACHE_WRITE_HOLD)
+    if RESULT_CACHE
+    else None
+)
+
+FLIGHTS = SingleFlight() if SINGLE_FLIGHT else None
+WRITES = (
+    WriteQueue(
+        lambda group: commit_group(group),
+        max_items=WRITE_QUEUE_MAX,
+        group_size=WRITE_GROUP_SIZE,
+        interval=WRITE_GROUP_INTERVAL_MS / 1000.0,
+        journal_dir=WRITE_QUEUE_JOURNAL,
+        fsync=WRITE_QUEUE_FSYNC,
+        ticket_ttl=WRITE_TICKET_TTL,
+        retry_interval=WRITE_RETRY_INTERVAL,
+        retry_types=(NodeError, PoolExhausted),
     )
+    if WRITE_QUEUE_MAX > 0
+    else None
+)
+CURSORS = CursorTable(max_per_node=min(CURSOR_MAX_PER_NODE, POOL_MAX_SIZE), idle_timeout=CURSOR_IDLE_TIMEOUT)
+QUERY_LOG = QueryLog(size=QUERY_LOG_SIZE, slow_ms=SLOW_QUERY_MS, fingerprints=QUERY_LOG_FINGERPRINTS) if QUERY_LOG_SIZE > 0 else None
+# (table, key) -> ((min, max) or None if the key is not usable, expiry)
+SCATTER_BOUNDS: Dict[Tuple[str, str], Tuple[Optional[Tuple[int, int]], float]] = {}
 
+BUS = Bus("proxy", BUS_DIR) if PROCESSES > 1 else None
+# WRITEs note the tables they touch: for the cache and for single-flight
+TRACK_WRITES = CACHE is not None or FLIGHTS is not None
 
-def exec_read(sql: str, host: str, port: int) -> Tuple[List[str], List[Tuple[Any, ...]]]:
-    conn = None
-    try:
-        conn = connect(host, port)
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows_raw = cur.fetchall()
-        rows: List[Tuple[Any, ...]] = cast(List[Tuple[Any, ...]], rows_raw if rows_raw is not None else [])
-        colnames = [desc[0] for desc in cur.description] if cur.description else []
-        return colnames, rows
-    finally:
-        try:
-            if conn:
-                conn.close()
-        except Exception:
-            pass
 
+def _on_write(tables: set) -> None:
+    if CACHE is not None:
+        CACHE.invalidate(tables)
+    if FLIGHTS is not None:
+        FLIGHTS.bump(tables)
+
+
+def invalidate_cache(tables: set) -> None:
+    # Before and after a WRITE to tables (empty: unknown scope): cached results and reads in flight are stale
+    _on_write(tables)
+    if BUS is not None:
+        BUS.publish("invalidate", sorted(tables))
+
+
+def remember_session(session: str, gtid: str) -> None:
+    SESSIONS.set(session, gtid)
+    if BUS is not None:
+        BUS.publish("session", [session, gtid])
+
+
+def _on_routing(data: dict) -> None:
+    PROBER.load_state(data["latency"])
+    REPLICATION.load_state(data["replication"])
+
+
+if BUS is not None:
+    BUS.subscribe("routing", _on_routing)
+    BUS.subscribe("session", lambda d: SESSIONS.set(d[0], d[1]))
+    BUS.subscribe("metrics", lambda d: METRICS.load_peer(d[0], d[1]))
+    if WRITES is not None:
+        # Ticket results, so a poll answered by another process finds them
+        WRITES.on_results = lambda done: BUS.publish("writes", done)
+        BUS.subscribe("writes", WRITES.load_results)
+    if QUERY_LOG is not None:
+        BUS.subscribe("querylog", lambda d: QUERY_LOG.load_peer(d[0], d[1]))
+    if TRACK_WRITES:
+        BUS.subscribe("invalidate", lambda tables: _on_write(set(tables)))
+
+    BUS.subscribe("topology", lambda d: spawn(apply_topology(*parse_topology(d), "api")))
 
-def exec_write(sql: str, host: str, port: int) -> int:
-    conn = None
+
+def overloaded(e: PoolExhausted) -> HTTPException:
+    # Every pooled connection to the node is busy: not a node failure (no breaker, no failover), retry later
+    return HTTPException(status_code=503, detail=f"Overloaded: {e}", headers={"Retry-After": "1"})
+
+
+def _node(n: dict) -> str:
+    return f"{n['host']}:{int(n['port'])}"
+
+
+# --- topology hot reload ---
+
+TOPOLOGY: Dict[str, Any] = {"version": 1, "source": "file", "updated_at": time.time(), "draining": []}
+TOPOLOGY_LOCK = asyncio.Lock()
+_BACKGROUND: set = set()
+
+
+def spawn(coro) -> None:
+    # Fire-and-forget task that is not garbage collected while it runs
+    task = asyncio.get_running_loop().create_task(coro)
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+
+def _key(n: dict) -> Tuple[str, int]:
+    return n["host"], int(n["port"])
+
+
+async def apply_topology(manager: dict, workers: List[dict], source: str) -> Dict[str, Any]:
+    """
+    Switch to a new manager/worker set without a restart: pools of added nodes are
+    warmed first, then routing, probing and lag polling move to the new set at once;
+    removed nodes are drained in the background (see drain()).
+    """
+    global MANAGER, WORKERS
+    async with TOPOLOGY_LOCK:
+        old = {_key(n): n for n in [MANAGER] + WORKERS}
+        # Nodes that stay keep their dict, so routing state keyed on them carries over
+        manager = old.get(_key(manager), manager)
+        workers = [old.get(_key(w), w) for w in workers]
+        new = {_key(n): n for n in [manager] + workers}
+        if _key(manager) == _key(MANAGER) and [_key(w) for w in workers] == [_key(w) for w in WORKERS]:
+            return {"changed": False, "version": TOPOLOGY["version"]}
+        added = [n for k, n in new.items() if k not in old]
+        removed = [n for k, n in old.items() if k not in new]
+        if added:
+            await BACKEND.warm(added)
+        MANAGER, WORKERS = manager, workers
+        PROBER.set_nodes(WORKERS)
+        REPLICATION.set_nodes(MANAGER, WORKERS)
+        TOPOLOGY.update(version=TOPOLOGY["version"] + 1, source=source, updated_at=time.time())
+        print(
+            f"[topology] v{TOPOLOGY['version']} from {source}: manager {_node(MANAGER)}, "
+            f"{len(WORKERS)} worker(s); added {[_node(n) for n in added]}, removed {[_node(n) for n in removed]}"
+        )
+        for n in removed:
+            spawn(drain(n))
+        return {
+            "changed": True,
+            "version": TOPOLOGY["version"],
+            "added": [_node(n) for n in added],
+            "removed": [_node(n) for n in removed],
+        }
+
+
+async def drain(node: dict) -> None:
+    # No new requests are routed to the node; the ones already running finish (up to DRAIN_TIMEOUT)
+    name = _node(node)
+    TOPOLOGY["draining"].append(name)
     try:
-        conn = connect(host, port)
-        cur = conn.cursor()
-        cur.execute(sql)
-        affected = cur.rowcount
-        conn.commit()
-        return affected
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while True:
+            # Also lets requests routed just before the switch reach the node
+            await asyncio.sleep(0.1)
+            if LOAD.in_flight(node) == 0 or time.monotonic() >= deadline:
+                break
+        if _key(node) in {_key(n) for n in [MANAGER] + WORKERS}:
+            return  # added back in the meantime
+        await BACKEND.drop([node])
+        LOAD.forget(node)
+        BREAKERS.forget(node)
+        print(f"[topology] drained {name}")
     finally:
-        try:
-            if conn:
-                conn.close()
-        except Exception:
-            pass
+        TOPOLOGY["draining"].remove(name)
 
 
-def latency_ms(host: str, port: int) -> float:
-    # Minimal latency measurement: connect + simple SELECT 1
-    start = time.perf_counter()
-    conn = None
+def _config_mtime() -> Optional[int]:
     try:
-        conn = connect(host, port)
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        _ = cur.fetchone()
-    except Exception:
-        return float("inf")
-    finally:
+        return os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+async def watch_config() -> None:
+    last = _config_mtime()
+    while True:
+        await asyncio.sleep(TOPOLOGY_WATCH_INTERVAL)
+        mtime = _config_mtime()
+        if mtime == last:
+            continue
+        last = mtime
         try:
-            if conn:
-                conn.close()
-        except Exception:
-            pass
-    return (time.perf_counter() - start) * 1000.0
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                manager, workers = parse_topology(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Half-written or invalid: keep the current topology (a complete write changes mtime again)
+            print(f"[topology] ignoring {CONFIG_PATH}: {e}")
+            continue
+        await apply_topology(manager, workers, "file")
+
+
+def _pool_gauge():
+    for p in BACKEND.stats():
+        for state in ("in_use", "idle"):
+            if state in p:
+                yield (_node(p), state), p[state]
+
+
+def _in_flight_gauge():
+    for n in LOAD.snapshot():
+        yield (_node(n),), n["in_flight"]
+
+
+def _latency_gauge():
+    for n in PROBER.snapshot():
+        if n.get("ewma_ms") is not None:
+            yield (_node(n),), n["ewma_ms"]
+
+
+def _write_queue_gauge():
+    if WRITES is not None:
+        yield (), WRITES.depth()
+
+
+def _circuit_gauge():
+    for b in BREAKERS.snapshot():
+        yield (_node(b),), {"closed": 0, "half-open": 1, "open": 2}[b["state"]]
+
+
+METRICS = Registry()
+REQUESTS = METRICS.counter(
+    "proxy_requests_total", "Requests by endpoint, strategy, operation, target node and HTTP status",
+    ("endpoint", "strategy", "operation", "target", "status"),
+)
+REQUEST_SECONDS = METRICS.histogram(
+    "proxy_request_duration_seconds", "Request latency (until the response is ready)",
+    ("endpoint", "strategy", "operation", "target"),
+)
+observe_stages(METRICS.histogram(
+    "proxy_stage_duration_seconds", "Per-request stage durations (route/connect/execute/fetch/commit/serialize)", ("stage",),
+))
+METRICS.gauge("proxy_node_in_flight", "Queries in flight per node", ("node",), collect=_in_flight_gauge)
+METRICS.gauge("proxy_pool_connections", "Pooled connections per node and state", ("node", "state"), collect=_pool_gauge)
+METRICS.gauge(
+    "proxy_circuit_state", "Circuit breaker per node (0 closed, 1 half-open, 2 open; worst process)", ("node",),
+    collect=_circuit_gauge, merge="max",
+)
+METRICS.gauge("proxy_write_queue_depth", "ack=queued WRITEs waiting for group commit", (), collect=_write_queue_gauge)
+WRITE_GROUPS = METRICS.counter(
+    "proxy_write_group_statements_total", "Queued WRITEs by group commit outcome", ("outcome",)
+)
+RETRIES = METRICS.counter("proxy_read_retries_total", "READs retried on another node after a node failure", ("strategy",))
+COALESCED = METRICS.counter(
+    "proxy_coalesced_requests_total", "READs answered by joining an identical in-flight execution", ("strategy", "node")
+)
+SCATTER_PARTS = METRICS.counter("proxy_scatter_parts_total", "Scatter-gather sub-queries by node", ("node",))
+# Shared by all processes (one prober), so processes are not added up
+METRICS.gauge("proxy_node_latency_ewma_ms", "Prober latency EWMA per worker", ("node",), collect=_latency_gauge, merge="max")
+
+
+def response_media(accept: Optional[str]) -> str:
+    # Content negotiation: JSON unless the client asks for msgpack / columnar
+    media = negotiate(accept)
+    if media is None:
+        raise HTTPException(status_code=406, detail=f"Not acceptable; available: {', '.join(available_encodings())}")
+    return media
+
+
+def encoded_response(obj: Any, media: str = JSON, status_code: int = 200) -> Response:
+    # Encoded here (not by FastAPI) so serialization shows up as its own stage
+    with stage("serialize"):
+        body = encode(obj, media)
+    return Response(content=body, status_code=status_code, media_type=media)
 
 
 @app.get("/health")
-def health():
+async def health():
     return {
         "manager": MANAGER,
         "workers": WORKERS,
         "db_user": DB_USER,
         "db_name": DB_NAME,
+        "driver": BACKEND.name,
+        "pools": BACKEND.stats(),
+        "latency": PROBER.snapshot(),
+        "replication": REPLICATION.snapshot(),
+        "load": LOAD.snapshot(),
+        "circuits": BREAKERS.snapshot(),
+        "statements": BACKEND.statement_stats(),
+        "cache": CACHE.stats() if CACHE else None,
+        "single_flight": FLIGHTS.stats() if FLIGHTS else None,
+        "scatter": {
+            "keys": SCATTER_KEYS,
+            "min_keys": SCATTER_MIN_KEYS,
+            "bounds": {f"{t}.{k}": list(b) if b else None for (t, k), (b, _) in SCATTER_BOUNDS.items()},
+        },
+        "sql_scan": sql_scan_stats(),
+        "query_log": QUERY_LOG.stats() if QUERY_LOG else None,
+        "writes": WRITES.stats() if WRITES else None,
+        "cursors": CURSORS.stats(),
+        "encodings": available_encodings(),
+        "topology": TOPOLOGY,
+        "processes": PROCESSES,
+        "bus": BUS.stats() if BUS else None,
     }
 
 
-@app.post("/query")
-def query(body: QueryBody, strategy: str = Query("direct", regex="^(direct|random|custom)$")):
+@app.get("/metrics")
+async def metrics():
+    return Response(METRICS.render(), media_type=Registry.CONTENT_TYPE)
+
+
+@app.get("/topology")
+async def topology():
+    return {"manager": MANAGER, "workers": WORKERS, **TOPOLOGY}
+
+
+@app.post("/topology")
+async def set_topology(body: TopologyBody):
     """
-    Minimal proxy:
-    - Classifies SQL as READ/WRITE.
-    - Strategies:
-        direct: always manager
-        random: READ -> random worker; WRITE -> manager
-        custom: READ -> lowest-latency worker; WRITE -> manager
+    Replace the manager/worker set at runtime (e.g. add a read replica under load).
+    Not written back to the config file: edit config.json to keep it across restarts.
     """
-    sql = body.sql
-    op = classify_sql(sql)
+    data = body.model_dump()
+    result = await apply_topology(*parse_topology(data), "api")
+    if BUS is not None and result["changed"]:
+        BUS.publish("topology", data)
+    return result
+
+
+@app.get("/cache")
+async def cache_stats():
+    if CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **CACHE.stats()}
+
+
+@app.get("/queries")
+async def queries(limit: int = Query(100, ge=0), slow: bool = Query(False)):
+    """Most recent requests first (slow=1: only those that took at least SLOW_QUERY_MS); this process only."""
+    if QUERY_LOG is None:
+        return {"enabled": False}
+    return {"enabled": True, **QUERY_LOG.stats(), "queries": QUERY_LOG.entries(limit, slow)}
+
+
+@app.get("/queries/top")
+async def queries_top(n: int = Query(20, ge=1), by: str = Query("total", regex="^(total|mean|p99|max|count)$")):
+    """Statement fingerprints ranked by total/mean/p99/max time or count (all processes)."""
+    if QUERY_LOG is None:
+        return {"enabled": False}
+    return {"enabled": True, "by": by, "top": QUERY_LOG.top(n, by)}
+
+
+EXPLAIN_PREFIX = {"traditional": "EXPLAIN ", "json": "EXPLAIN FORMAT=JSON ", "tree": "EXPLAIN FORMAT=TREE "}
+
+
+def find_node(name: Optional[str]) -> dict:
+    # "manager", host or host:port of a current node; the manager when unknown (e.g. "cache")
+    for n in WORKERS:
+        if name in (n["host"], _node(n)):
+            return n
+    return MANAGER
+
+
+@app.post("/queries/explain")
+async def explain(body: ExplainBody):
+    """
+    On-demand EXPLAIN of a logged fingerprint (its last statement and params) or of
+    a given statement, on the node it last ran on (or body.node).
+    format: traditional | json | tree; analyze=true runs EXPLAIN ANALYZE (READs only).
+    """
+    fid, sql, params, last = body.id, body.sql, body.params, None
+    if fid:
+        sample = QUERY_LOG.sample(fid) if QUERY_LOG is not None else None
+        if sample is None:
+            raise HTTPException(status_code=404, detail=f"Fingerprint {fid} not in this process's query log")
+        sql, params, last = sample
+    if not sql:
+        raise HTTPException(status_code=400, detail="Give a fingerprint id or a statement")
+    if body.format not in EXPLAIN_PREFIX:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPLAIN_PREFIX)}")
+    info = scan(sql)
+    if info.statements != 1 or info.keyword not in ("select", "insert", "update", "delete", "replace"):
+        raise HTTPException(status_code=400, detail="EXPLAIN needs a single SELECT/INSERT/UPDATE/DELETE/REPLACE")
+    if body.analyze and info.operation != "read":
+        raise HTTPException(status_code=400, detail="EXPLAIN ANALYZE executes the statement: READs only")
+    node = find_node(body.node or last)
+    prefix = "EXPLAIN ANALYZE " if body.analyze else EXPLAIN_PREFIX[body.format]
+    try:
+        with BREAKERS.track(node):
+            cols, rows = await BACKEND.read(prefix + sql.strip().rstrip(";"), node["host"], int(node["port"]), params)
+    except PoolExhausted as e:
+        raise overloaded(e)
+    except DBError as e:
+        raise HTTPException(status_code=502, detail=f"MySQL error: {e}")
+    return encoded_response({
+        "id": fid,
+        "fingerprint": fingerprint(sql),
+        "sql": sql,
+        "node": _node(node),
+        "columns": cols,
+        "rows": rows,
+    })
+
+
+@app.get("/writes")
+async def writes():
+    if WRITES is None:
+        return {"enabled": False}
+    return {"enabled": True, **WRITES.stats()}
+
+
+@app.get("/writes/{ticket}")
+async def write_status(ticket: str):
+    """Outcome of an ack=queued WRITE: queued, committed (affected, gtid) or failed (error)."""
+    if WRITES is None:
+        raise HTTPException(status_code=404, detail="ack=queued is disabled (WRITE_QUEUE_MAX=0)")
+    result = WRITES.status(ticket)
+    if result is None:
+        if BUS is not None and not WRITES.owns(ticket):
+            # Another process's ticket: its result is published here once the group is done, but
+            # until then (or if that process is gone, or the result expired) this one cannot tell
+            return {"ticket": ticket, "status": "unknown"}
+        raise HTTPException(status_code=404, detail=f"Unknown or expired ticket {ticket}")
+    return result
+
+
+async def commit_group(group: List[QueuedWrite]) -> List[Dict[str, Any]]:
+    """
+    Commits a group of queued WRITEs on the manager in one transaction, with
+    same-shape INSERTs coalesced as in /batch. If a statement fails, the group is
+    re-run statement by statement to find it: it is reported failed and the others
+    are committed without it. Node errors propagate (the queue retries the group).
+    """
+    if not BREAKERS.available(MANAGER):
+        raise NodeError(f"circuit open: {_node(MANAGER)}")
+    results: List[Dict[str, Any]] = [{} for _ in group]
+    pending = list(range(len(group)))
+    coalesce = True
+    tables: set = set()
+    if TRACK_WRITES:
+        scopes = [write_tables(scan(w.sql)) for w in group]
+        tables = set() if any(not t for t in scopes) else set().union(*scopes)
+        invalidate_cache(tables)
+    try:
+        while pending:
+            items = [(group[i].sql, group[i].params) for i in pending]
+            if coalesce:
+                groups = coalesce_items(items, BATCH_INSERT_ROWS)
+            else:
+                groups = [(sql, params, False, [k]) for k, (sql, params) in enumerate(items)]
+            try:
+                with LOAD.track(MANAGER), BREAKERS.track(MANAGER):
+                    affected, gtid = await BACKEND.write_batch(
+                        [(sql, params, many) for sql, params, many, _ in groups], MANAGER["host"], int(MANAGER["port"]),
+                        with_gtid=any(group[i].session for i in pending),
+                    )
+            except BatchError as e:
+                if isinstance(e, NodeError) or e.index < 0:
+                    raise
+                if coalesce:
+                    coalesce = False
+                    continue
+                failed = pending.pop(groups[e.index][3][0])
+                results[failed] = {"status": "failed", "error": f"MySQL error: {e}"}
+                WRITE_GROUPS.inc("failed")
+                continue
+            for (_, _, _, members), count in zip(groups, affected):
+                for m in members:
+                    i = pending[m]
+                    # One multi-row INSERT: per-statement count is exact only if every row landed
+                    res = {"status": "committed", "affected": count if len(members) == 1 else (1 if count == len(members) else None)}
+                    if gtid:
+                        res["gtid"] = gtid
+                        if group[i].session:
+                            remember_session(group[i].session, gtid)
+                    results[i] = res
+            WRITE_GROUPS.inc("committed", amount=len(pending))
+            break
+    finally:
+        if TRACK_WRITES:
+            invalidate_cache(tables)
+    return results
+
 
+def healthy(node: dict, exclude: Sequence[dict] = ()) -> bool:
+    # Routable: circuit not open, not marked down by the prober, not already tried by this request
+    return BREAKERS.available(node) and PROBER.is_up(node) and node not in exclude
+
+
+def route(strategy: str, op: str, x_session_id: Optional[str] = None, exclude: Sequence[dict] = ()) -> Tuple[dict, str]:
+    """
+    Pick the target node for a statement; returns (node, description).
+    Workers with an open circuit (or in exclude) are skipped; a READ falls back to the
+    manager when no worker is left. Raises 503 at once if the chosen node is unavailable.
+    """
     target = MANAGER  # default for direct and for all WRITEs
     chosen = "manager"
+    workers = [w for w in WORKERS if healthy(w, exclude)]
+
+    if strategy in ("random", "custom", "least-loaded") and op == "read" and not WORKERS:
+        raise HTTPException(status_code=503, detail="No workers available for READ")
 
     if strategy == "random" and op == "read":
-        if not WORKERS:
-            raise HTTPException(status_code=503, detail="No workers available for READ")
-        target = random.choice(WORKERS)
-        chosen = f"worker(random) {target['host']}"
+        if workers:
+            target = random.choice(workers)
+            chosen = f"worker(random) {target['host']}"
+        else:
+            chosen = "manager(random,failover)"
 
     elif strategy == "custom" and op == "read":
-        if not WORKERS:
-            raise HTTPException(status_code=503, detail="No workers available for READ")
-        # Pick worker with minimal simple latency (fallback to random if none measurable)
-        best = None
-        best_ms = float("inf")
-        for w in WORKERS:
-            ms = latency_ms(w["host"], int(w["port"]))
-            if ms < best_ms:
-                best_ms = ms
-                best = w
-        if best is None:
-            target = random.choice(WORKERS)
+        # Pick worker with minimal EWMA latency from the prober (fallback to random if none measured yet)
+        best = PROBER.best(lambda n: healthy(n, exclude))
+        if best is not None:
+            target, best_ms = best
+            chosen = f"worker(custom,min-lat) {target['host']} ({best_ms:.1f}ms)"
+        elif workers:
+            target = random.choice(workers)
             chosen = f"worker(custom,fallback) {target['host']}"
         else:
-            target = best
-            chosen = f"worker(custom,min-lat) {target['host']} ({best_ms:.1f}ms)"
+            chosen = "manager(custom,failover)"
+
+    elif strategy in ("lag-aware", "scatter") and op == "read":
+        # scatter: READs that are not split (and retried parts) are routed like lag-aware
+        min_gtid = SESSIONS.get(x_session_id) if x_session_id else None
+        candidates = [(w, state) for w, state in REPLICATION.eligible(min_gtid) if healthy(w, exclude)]
+        if candidates:
+            target, state = random.choice(candidates)
+            chosen = f"worker({strategy}) {target['host']} (lag={state.seconds_behind:.0f}s)"
+        else:
+            chosen = f"manager({strategy},read-your-writes)" if min_gtid else f"manager({strategy},fallback)"
+
+    elif strategy == "least-loaded" and op == "read":
+        candidates = [(w, 1.0) for w in workers]
+        if LEAST_LOADED_MANAGER_WEIGHT > 0 or not candidates:
+            candidates.append((MANAGER, LEAST_LOADED_MANAGER_WEIGHT or 1.0))
+        target, score = LOAD.pick(candidates)
+        role = "manager" if target is MANAGER else "worker"
+        chosen = f"{role}(least-loaded) {target['host']} (score={score:.1f})"
+
+    if target in exclude or not BREAKERS.available(target):
+        # Fail fast instead of waiting on a node known to be down
+        raise HTTPException(status_code=503, detail=f"No healthy node for {op.upper()} (circuit open: {_node(target)})")
+    return target, chosen
+
+
+async def with_failover(call, op: str, strategy: str, x_session_id: Optional[str], target: dict, chosen: str, labels: dict):
+    """
+    Runs await call(target, chosen) under the node's circuit breaker. If the node
+    fails (NodeError) on a READ, it is re-routed excluding the nodes already tried,
+    up to READ_RETRIES times; WRITEs are never retried.
+    """
+    tried: List[dict] = []
+    while True:
+        try:
+            with BREAKERS.track(target):
+                return await call(target, chosen)
+        except NodeError as e:
+            tried.append(target)
+            if op != "read" or len(tried) > READ_RETRIES:
+                raise
+            try:
+                with stage("route"):
+                    target, chosen = route(strategy, op, x_session_id, exclude=tried)
+            except HTTPException:
+                raise e
+            print(f"[failover] {op} on {_node(tried[-1])} failed ({e}); retrying on {_node(target)}")
+            RETRIES.inc(strategy)
+            labels["target"] = _node(target)
+            chosen += " (retry)"
+
+
+def cache_key_for(sql: str, params: Optional[List[Any]]) -> str:
+    key = normalize_sql(sql)
+    if params is not None:
+        key += "\x00" + json.dumps(params, default=str, separators=(",", ":"))
+    return key
+
+
+async def execute(
+    info: SqlInfo,
+    sql: str,
+    host: str,
+    port: int,
+    chosen: str,
+    cache_key: Optional[str],
+    x_session_id: Optional[str],
+    params: Optional[List[Any]] = None,
+):
+    # Runs the statement on the chosen node (cache fill / invalidation, read-your-writes GTID)
+    op = info.operation
+    if op == "read":
+        if cache_key is not None:
+            tables = set(info.tables)
+            generation = CACHE.generation(tables)
+        cols, rows = await BACKEND.read(sql, host, port, params)
+        resp = {
+            "target": chosen,
+            "operation": op,
+            "columns": cols,
+            "rows": rows,
+            "count": len(rows),
+        }
+        if cache_key is not None:
+            CACHE.put(cache_key, (cols, rows), tables, estimate_bytes(cols, rows), generation)
+            resp["cache"] = "miss"
+        return resp
+    else:
+        gtid = None
+        if TRACK_WRITES:
+            tables = write_tables(info)
+            invalidate_cache(tables)
+        try:
+            if x_session_id:
+                affected, gtid = await BACKEND.write_gtid(sql, host, port, params)
+                remember_session(x_session_id, gtid)
+            else:
+                affected = await BACKEND.write(sql, host, port, params)
+        finally:
+            if TRACK_WRITES:
+                invalidate_cache(tables)
+        resp = {
+            "target": chosen,
+            "operation": op,
+            "affected": affected,
+        }
+        if gtid is not None:
+            resp["gtid"] = gtid
+        return resp
+
+
+async def scatter_bounds(plan: ScatterPlan, key: str, node: dict) -> Optional[Tuple[int, int]]:
+    # MIN/MAX of the split key (an index lookup on the primary key), re-read every SCATTER_BOUNDS_TTL s
+    cached = SCATTER_BOUNDS.get((plan.table, key))
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    try:
+        with BREAKERS.track(node):
+            _, rows = await BACKEND.read(plan.bounds_sql(key), node["host"], int(node["port"]))
+    except (NodeError, PoolExhausted):
+        return None
+    except DBError as e:
+        # No such column: remember, the table is then never split
+        print(f"[scatter] no key bounds for {plan.table}.{key}: {e}")
+        rows = []
+    lo, hi = rows[0] if rows else (None, None)
+    bounds = (lo, hi) if isinstance(lo, int) and isinstance(hi, int) else None
+    SCATTER_BOUNDS[(plan.table, key)] = (bounds, time.monotonic() + SCATTER_BOUNDS_TTL)
+    return bounds
+
+
+async def run_scatter(
+    plan: ScatterPlan,
+    sql: str,
+    params: Optional[List[Any]],
+    info: SqlInfo,
+    x_session_id: Optional[str],
+    cache_key: Optional[str],
+) -> Optional[dict]:
+    """
+    Runs a READ as one key-range part per eligible worker, concurrently, and merges
+    the rows. None if it is not worth splitting here (fewer than 2 workers within
+    the lag threshold, lookup by key, unknown key, key range under SCATTER_MIN_KEYS): the caller
+    then routes it to one node.
+    """
+    min_gtid = SESSIONS.get(x_session_id) if x_session_id else None
+    workers = [w for w, _ in REPLICATION.eligible(min_gtid) if healthy(w)]
+    if len(workers) < 2:
+        return None
+    key = SCATTER_KEYS.get(plan.table, f"{plan.table}_id")
+    if key in plan.equals:
+        return None
+    bounds = await scatter_bounds(plan, key, random.choice(workers))
+    if bounds is None or bounds[1] - bounds[0] + 1 < SCATTER_MIN_KEYS:
+        return None
+    if cache_key is not None:
+        tables = set(info.tables)
+        generation = CACHE.generation(tables)
+
+    async def run_part(part_sql: str, node: dict):
+        async def run_on(n: dict, _desc: str):
+            with LOAD.track(n):
+                return n, await BACKEND.read(part_sql, n["host"], int(n["port"]), params)
+        # A failed part is retried on another worker (READ_RETRIES), like a whole READ
+        return await with_failover(run_on, "read", "scatter", x_session_id, node, "", {})
 
+    parts = plan.parts(key, bounds[0], bounds[1], len(workers))
+    results = await asyncio.gather(*(run_part(p, w) for p, w in zip(parts, workers)))
+    cols = results[0][1][0]
+    with stage("merge"):
+        rows = plan.merge([r for _, (_, r) in results], cols)
+    for node, _ in results:
+        SCATTER_PARTS.inc(_node(node))
+    resp = {
+        "target": f"scatter({len(parts)} parts) " + ",".join(n["host"] for n, _ in results),
+        "operation": "read",
+        "columns": cols,
+        "rows": rows,
+        "count": len(rows),
+        "parts": [{"node": _node(n), "count": len(r)} for n, (_, r) in results],
+    }
+    if cache_key is not None:
+        CACHE.put(cache_key, (cols, rows), tables, estimate_bytes(cols, rows), generation)
+        resp["cache"] = "miss"
+    return resp
+
+
+async def stream_read(sql: str, target: dict, chosen: str, params: Optional[List[Any]] = None) -> StreamingResponse:
+    """
+    NDJSON stream: a header line {"target", "operation", "columns"}, one JSON array
+    per row, then {"count": n} (or {"error": ...} if the query fails mid-stream).
+    Rows are encoded as they are fetched, so memory stays flat for large results.
+    """
     host = target["host"]
     port = int(target["port"])
+    rows_iter = BACKEND.stream(sql, host, port, STREAM_BATCH_ROWS, params)
+    # Execute before answering so connection/SQL errors still map to a 502
+    with LOAD.track(target):
+        cols = await rows_iter.__anext__()
+
+    async def body():
+        count = 0
+        try:
+            yield ndjson_line({"target": chosen, "operation": "read", "columns": cols})
+            with LOAD.track(target):
+                async for batch in rows_iter:
+                    count += len(batch)
+                    yield b"".join(ndjson_line(row) for row in batch)
+            yield ndjson_line({"count": count})
+        except DBError as e:
+            yield ndjson_line({"error": f"MySQL error: {e}", "count": count})
+        finally:
+            await rows_iter.aclose()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
 
+
+@app.post("/query")
+async def query(
+    body: QueryBody,
+    strategy: str = Query("direct", regex=STRATEGY_PATTERN),
+    stream: bool = Query(False),
+    ack: str = Query("committed", regex="^(committed|queued)$"),
+    x_session_id: Optional[str] = Header(None),
+    x_sql_info: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Minimal proxy:
+    - Classifies SQL as READ/WRITE (or takes the Gatekeeper's classification, X-Sql-Info).
+    - Strategies:
+        direct: always manager
+        random: READ -> random worker; WRITE -> manager
+        custom: READ -> lowest-latency worker (background EWMA table); WRITE -> manager
+        lag-aware: READ -> random worker within LAG_MAX_SECONDS of replication lag
+                   (manager if none); WRITE -> manager
+        least-loaded: READ -> lowest expected completion time ((in-flight + 1) x latency EWMA / weight),
+                      power of two choices over up workers (+ manager if weighted); WRITE -> manager
+        scatter: single-table SELECT -> split by primary-key range across the lag-aware workers,
+                 parts run concurrently and merged (COUNT/SUM/MIN/MAX, GROUP BY, ORDER BY/LIMIT
+                 applied here); other READs as lag-aware; WRITE -> manager
+    - stream=1: READs are returned as NDJSON rows while they are fetched (no cache).
+    - Accept: application/json (default), application/msgpack, or the columnar
+      layouts application/vnd.dbproxy.columnar+json / +msgpack (406 otherwise).
+    - Read-your-writes (X-Session-Id header): WRITEs remember the manager's GTID set
+      for the session; lag-aware READs of that session only go to a worker that has
+      applied it, otherwise to the manager.
+    - Optional result cache (RESULT_CACHE=1): cacheable SELECTs are answered from
+      memory; WRITEs invalidate cached entries of the tables they touch.
+    - Single-flight (SINGLE_FLIGHT=1): identical concurrent READs routed to the same
+      node share one execution ("coalesced": true on the joiners' responses).
+    - page_size (READs): one page of rows plus "next", a token to send back as cursor (with the
+      same sql/params) for the following page; null after the last one. Keyset pagination when
+      the statement is a single-table SELECT ordered by nothing or by its integer key (stateless),
+      otherwise a server-side cursor held on the node (CURSOR_IDLE_TIMEOUT; 410 once expired,
+      429 + Retry-After beyond CURSOR_MAX_PER_NODE). Not cached or coalesced.
+    - ack=queued (single INSERT/UPDATE/DELETE/REPLACE): 202 with a ticket as soon as the
+      WRITE is queued; a background committer runs queued WRITEs on the manager in groups
+      (one transaction each); poll GET /writes/{ticket}. 429 + Retry-After when the queue is full.
+    - params: values for %s placeholders; executed as a server-side prepared
+      statement (sync driver), re-used across requests on the same connection.
+    - Failover: nodes with an open circuit breaker are skipped (READs fall back to
+      the manager when no worker is left, 503 when the manager itself is open); a
+      READ whose node fails is retried on another node (READ_RETRIES).
+    """
+    sql = body.sql
+    params = body.params
+    info = sql_infos(x_sql_info, [sql])[0]
+    op = info.operation
+    start = time.perf_counter()
+    labels = {"target": "-"}
+    status = 500
+    try:
+        if ack == "queued":
+            resp = queue_write(sql, params, info, stream, x_session_id, accept, labels)
+        elif body.page_size is not None or body.cursor is not None:
+            resp = await run_page(sql, params, info, strategy, stream, body.page_size, body.cursor, x_session_id, accept, labels)
+        else:
+            resp = await run_query(sql, params, info, strategy, stream, x_session_id, accept, labels)
+        status = resp.status_code
+        return resp
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS.inc("query", strategy, op, labels["target"], str(status))
+        REQUEST_SECONDS.observe(elapsed, "query", strategy, op, labels["target"])
+        if QUERY_LOG is not None:
+            timings = current_timings()
+            QUERY_LOG.record(
+                "query", [sql], strategy, op, labels["target"], status, elapsed, labels.get("rows"),
+                timings.stages if timings else (), params,
+            )
+
+
+def queue_write(
+    sql: str,
+    params: Optional[List[Any]],
+    info: SqlInfo,
+    stream: bool,
+    x_session_id: Optional[str],
+    accept: Optional[str],
+    labels: dict,
+) -> Response:
+    media = response_media(accept)
+    if WRITES is None:
+        raise HTTPException(status_code=400, detail="ack=queued is disabled (WRITE_QUEUE_MAX=0)")
+    if stream or info.statements != 1 or info.keyword not in ("insert", "update", "delete", "replace"):
+        raise HTTPException(status_code=400, detail="ack=queued takes a single INSERT/UPDATE/DELETE/REPLACE")
+    labels["target"] = "queue"
     try:
-        if op == "read":
-            cols, rows = exec_read(sql, host, port)
-            return {
-                "target": chosen,
+        ticket = WRITES.submit(sql, params, x_session_id)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Write queue full ({WRITES.max_items} queued)",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    return encoded_response({
+        "target": "queue",
+        "operation": "write",
+        "ticket": ticket,
+        "status": "queued",
+        "queued": WRITES.depth(),
+    }, media, status_code=202)
+
+
+async def run_page(
+    sql: str,
+    params: Optional[List[Any]],
+    info: SqlInfo,
+    strategy: str,
+    stream: bool,
+    page_size: Optional[int],
+    token: Optional[str],
+    x_session_id: Optional[str],
+    accept: Optional[str],
+    labels: dict,
+) -> Response:
+    media = response_media(accept)
+    if stream or info.operation != "read" or info.statements != 1:
+        raise HTTPException(status_code=400, detail="page_size/cursor take a single READ (without stream)")
+    qhash = query_hash(cache_key_for(sql, params))
+    state: Dict[str, Any] = {"h": qhash}
+    if token is not None:
+        try:
+            state = decode_token(token)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if "k" in state and not isinstance(state["k"], int):
+            raise HTTPException(status_code=400, detail="malformed cursor token")
+        if state["h"] != qhash:
+            raise HTTPException(status_code=400, detail="cursor was issued for a different statement or params")
+    size = page_size if page_size is not None else state.get("n")
+    if not isinstance(size, int) or not 1 <= size <= PAGE_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {PAGE_MAX_ROWS}")
+
+    try:
+        if "c" in state:
+            resp = await next_cursor_page(state, size, labels)
+        else:
+            resp = None
+            plan = scatter_plan(sql)
+            if plan is not None:
+                resp = await keyset_page(plan, sql, params, strategy, state, size, x_session_id, labels)
+            if resp is None:
+                if "k" in state:
+                    raise HTTPException(status_code=400, detail="cursor was issued for a different statement or params")
+                resp = await open_cursor_page(sql, params, strategy, qhash, size, x_session_id, labels)
+    except CursorsFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many open cursors on {e.node} (max {CURSORS.max_per_node}); retry when one finishes or expires",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    except PoolExhausted as e:
+        raise overloaded(e)
+    except DBError as e:
+        raise HTTPException(status_code=502, detail=f"MySQL error: {e}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    labels["rows"] = resp["count"]
+    return encoded_response(resp, media)
+
+
+async def keyset_page(
+    plan: ScatterPlan,
+    sql: str,
+    params: Optional[List[Any]],
+    strategy: str,
+    state: Dict[str, Any],
+    size: int,
+    x_session_id: Optional[str],
+    labels: dict,
+) -> Optional[dict]:
+    # Stateless: "WHERE key > last ORDER BY key LIMIT size+1" on whichever node is routed to;
+    # None if the statement is not ordered by its key, or the key is not an integer column
+    key = SCATTER_KEYS.get(plan.table, f"{plan.table}_id")
+    descending = plan.key_order(key)
+    if descending is None:
+        return None
+    with stage("route"):
+        target, chosen = route(strategy, "read", x_session_id)
+    labels["target"] = _node(target)
+    if await scatter_bounds(plan, key, target) is None and "k" not in state:
+        return None
+    page_sql = plan.keyset(key, state.get("k"), descending, size + 1)
+
+    async def run_on(node: dict, desc: str):
+        with LOAD.track(node):
+            cols, rows = await BACKEND.read(page_sql, node["host"], int(node["port"]), params)
+        return desc, cols, rows
+
+    chosen, cols, rows = await with_failover(run_on, "read", strategy, x_session_id, target, chosen, labels)
+    more = len(rows) > size
+    rows = rows[:size]
+    token = encode_token({"h": state["h"], "k": rows[-1][-1], "n": size}) if more else None
+    return {
+        "target": chosen,
+        "operation": "read",
+        "columns": cols[:-1],
+        "rows": [row[:-1] for row in rows],
+        "count": len(rows),
+        "paging": "keyset",
+        "next": token,
+    }
+
+
+async def open_cursor_page(
+    sql: str,
+    params: Optional[List[Any]],
+    strategy: str,
+    qhash: str,
+    size: int,
+    x_session_id: Optional[str],
+    labels: dict,
+) -> dict:
+    # First page: the statement runs on an unbuffered cursor that stays open on its node
+    with stage("route"):
+        target, chosen = route(strategy, "read", x_session_id)
+    labels["target"] = _node(target)
+
+    async def open_on(node: dict, desc: str):
+        cur = CURSORS.open(_node(node), qhash)
+        try:
+            with LOAD.track(node):
+                await CURSORS.attach(cur, BACKEND.stream(sql, node["host"], int(node["port"]), size, params), size)
+        except BaseException:
+            CURSORS.discard(cur)
+            raise
+        return cur, desc
+
+    cur, chosen = await with_failover(open_on, "read", strategy, x_session_id, target, chosen, labels)
+    return await cursor_page(cur, chosen, size)
+
+
+async def next_cursor_page(state: Dict[str, Any], size: int, labels: dict) -> dict:
+    cur = CURSORS.get(state["c"])
+    if cur is None or cur.query != state["h"]:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Cursor expired or unknown (idle for more than {CURSOR_IDLE_TIMEOUT:g}s, finished, "
+            "or opened by another proxy process)",
+        )
+    labels["target"] = cur.node
+    return await cursor_page(cur, f"cursor {cur.node}", size)
+
+
+async def cursor_page(cur: Cursor, chosen: str, size: int) -> dict:
+    try:
+        rows, done = await CURSORS.fetch(cur, size)
+    except BaseException:
+        # The rest of the result is lost with the connection
+        await CURSORS.close(cur)
+        raise
+    return {
+        "target": chosen,
+        "operation": "read",
+        "columns": cur.columns,
+        "rows": rows,
+        "count": len(rows),
+        "paging": "cursor",
+        "next": None if done else encode_token({"h": cur.query, "c": cur.id, "n": size}),
+    }
+
+
+async def run_query(
+    sql: str,
+    params: Optional[List[Any]],
+    info: SqlInfo,
+    strategy: str,
+    stream: bool,
+    x_session_id: Optional[str],
+    accept: Optional[str],
+    labels: dict,
+) -> Response:
+    op = info.operation
+    media = JSON if stream else response_media(accept)
+    # Read-result cache: served before any routing decision
+    cache_key = None
+    if CACHE is not None and op == "read" and not stream and is_cacheable(info):
+        cache_key = cache_key_for(sql, params)
+        hit = CACHE.get(cache_key)
+        if hit is not None:
+            cols, rows = hit
+            labels["target"] = "cache"
+            labels["rows"] = len(rows)
+            return encoded_response({
+                "target": "cache",
                 "operation": op,
                 "columns": cols,
                 "rows": rows,
                 "count": len(rows),
-            }
+                "cache": "hit",
+            }, media)
+
+    if strategy == "scatter" and op == "read" and not stream and info.statements == 1:
+        plan = scatter_plan(sql)
+        if plan is not None:
+            try:
+                if FLIGHTS is not None and not info.volatile:
+                    flight_key = ("scatter", cache_key or cache_key_for(sql, params), FLIGHTS.generation(info.tables))
+                    resp, shared = await FLIGHTS.do(
+                        flight_key, lambda: run_scatter(plan, sql, params, info, x_session_id, cache_key)
+                    )
+                    if shared and resp is not None:
+                        COALESCED.inc(strategy, "scatter")
+                        resp = dict(resp, coalesced=True)
+                else:
+                    resp = await run_scatter(plan, sql, params, info, x_session_id, cache_key)
+            except ScatterUnsupported as e:
+                # The plan did not fit the actual result (e.g. an ORDER BY column it cannot find): run it on one node
+                print(f"[scatter] not split ({e}); routing to one node")
+                resp = None
+            except PoolExhausted as e:
+                raise overloaded(e)
+            except DBError as e:
+                raise HTTPException(status_code=502, detail=f"MySQL error: {e}")
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            if resp is not None:
+                labels["target"] = "scatter"
+                labels["rows"] = resp["count"]
+                return encoded_response(resp, media)
+
+    with stage("route"):
+        target, chosen = route(strategy, op, x_session_id)
+    labels["target"] = _node(target)
+
+    async def run_on(node: dict, desc: str):
+        with LOAD.track(node):
+            return await execute(info, sql, node["host"], int(node["port"]), desc, cache_key, x_session_id, params)
+
+    try:
+        if stream and op == "read":
+            # Failover only until the first rows are fetched (nothing has been sent yet)
+            return await with_failover(
+                lambda node, desc: stream_read(sql, node, desc, params), op, strategy, x_session_id, target, chosen, labels
+            )
+        if FLIGHTS is not None and op == "read" and not info.volatile:
+            # Same normalized SQL + params on the same node: join the execution already in flight
+            flight_key = (_node(target), cache_key or cache_key_for(sql, params), FLIGHTS.generation(info.tables))
+            resp, shared = await FLIGHTS.do(
+                flight_key, lambda: with_failover(run_on, op, strategy, x_session_id, target, chosen, labels)
+            )
+            if shared:
+                COALESCED.inc(strategy, labels["target"])
+                resp = dict(resp, coalesced=True)
         else:
-            affected = exec_write(sql, host, port)
-            return {
-                "target": chosen,
-                "operation": op,
-                "affected": affected,
-            }
-    except MySQLError as e:
+            resp = await with_failover(run_on, op, strategy, x_session_id, target, chosen, labels)
+    except PoolExhausted as e:
+        raise overloaded(e)
+    except DBError as e:
         raise HTTPException(status_code=502, detail=f"MySQL error: {e}")
     except Exception as e:
         raise HTTPException(status_code=502, detail=str(e))
+    labels["rows"] = resp.get("count", resp.get("affected"))
+    return encoded_response(resp, media)
+
+
+@app.post("/batch")
+async def batch(
+    body: BatchBody,
+    strategy: str = Query("direct", regex=STRATEGY_PATTERN),
+    x_session_id: Optional[str] = Header(None),
+    x_sql_info: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Executes a list of statements, returning one result per statement (same order):
+    - WRITEs: one transaction on the manager (single commit); adjacent single-row
+      INSERTs of the same shape are coalesced into multi-row INSERTs. Any failure
+      rolls back every write of the batch. Adjacent parameterized INSERTs with the
+      same SQL template are sent as one executemany().
+    - READs: routed once with the strategy and run on one connection, after the
+      write transaction has committed.
+    - Accept negotiates the encoding as for /query (columnar: per statement result).
+    """
+    items = [(s, None) if isinstance(s, str) else (s.sql, s.params) for s in body.statements]
+    start = time.perf_counter()
+    labels = {"operation": "-", "target": "-"}
+    status = 500
+    try:
+        resp = await run_batch(items, strategy, x_session_id, x_sql_info, accept, labels)
+        status = resp.status_code
+        return resp
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        REQUESTS.inc("batch", strategy, labels["operation"], labels["target"], str(status))
+        REQUEST_SECONDS.observe(elapsed, "batch", strategy, labels["operation"], labels["target"])
+        if QUERY_LOG is not None:
+            timings = current_timings()
+            QUERY_LOG.record(
+                "batch", [sql for sql, _ in items], strategy, labels["operation"], labels["target"], status, elapsed,
+                labels.get("rows"), timings.stages if timings else (),
+            )
+
+
+async def run_batch(
+    items: List[Tuple[str, Optional[List[Any]]]],
+    strategy: str,
+    x_session_id: Optional[str],
+    x_sql_info: Optional[str],
+    accept: Optional[str],
+    labels: dict,
+) -> Response:
+    media = response_media(accept)
+    stmts = [sql for sql, _ in items]
+    if len(stmts) > BATCH_MAX_STATEMENTS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {BATCH_MAX_STATEMENTS} statements)")
+    infos = sql_infos(x_sql_info, stmts)
+    ops = [info.operation for info in infos]
+    write_idx = [i for i, op in enumerate(ops) if op == "write"]
+    read_idx = [i for i, op in enumerate(ops) if op == "read"]
+    labels["operation"] = "mixed" if write_idx and read_idx else ("write" if write_idx else "read")
+    if write_idx:
+        labels["target"] = _node(MANAGER)
+    results: List[dict] = [{} for _ in stmts]
+    committed = None
+    executed = 0
+
+    if write_idx:
+        groups = coalesce_items([items[i] for i in write_idx], BATCH_INSERT_ROWS)
+        executed += len(groups)
+        tables: set = set()
+        if TRACK_WRITES:
+            scopes = [write_tables(infos[i]) for i in write_idx]
+            tables = set() if any(not t for t in scopes) else set().union(*scopes)
+            invalidate_cache(tables)
+        if not BREAKERS.available(MANAGER):
+            raise HTTPException(status_code=503, detail=f"No healthy node for WRITE (circuit open: {_node(MANAGER)})")
+        try:
+            with LOAD.track(MANAGER), BREAKERS.track(MANAGER):
+                affected, gtid = await BACKEND.write_batch(
+                    [(sql, params, many) for sql, params, many, _ in groups], MANAGER["host"], int(MANAGER["port"]), with_gtid=bool(x_session_id)
+                )
+            committed = True
+            if x_session_id and gtid is not None:
+                remember_session(x_session_id, gtid)
+            for (_, _, _, members), count in zip(groups, affected):
+                for m in members:
+                    res = {"target": "manager", "operation": "write"}
+                    if len(members) == 1:
+                        res["affected"] = count
+                    else:
+                        # One multi-row INSERT: per-statement count is exact only if every row landed
+                        res["affected"] = 1 if count == len(members) else None
+                        res["coalesced"] = len(members)
+                    results[write_idx[m]] = res
+        except PoolExhausted as e:
+            # Nothing was written: the client can retry the whole batch
+            raise overloaded(e)
+        except DBError as e:
+            committed = False
+            failed = set(groups[e.index][3]) if isinstance(e, BatchError) and e.index >= 0 else set()
+            for m, i in enumerate(write_idx):
+                err = f"MySQL error: {e}" if (m in failed or not failed) else "rolled back"
+                results[i] = {"target": "manager", "operation": "write", "error": err}
+        finally:
+            if TRACK_WRITES:
+                invalidate_cache(tables)
+
+    if read_idx:
+        executed += len(read_idx)
+        with stage("route"):
+            target, chosen = route(strategy, "read", x_session_id)
+        if not write_idx:
+            labels["target"] = _node(target)
+
+        async def read_on(node: dict, desc: str):
+            with LOAD.track(node):
+                return desc, await BACKEND.read_many([items[i] for i in read_idx], node["host"], int(node["port"]))
+
+        try:
+            chosen, outs = await with_failover(read_on, "read", strategy, x_session_id, target, chosen, {} if write_idx else labels)
+            for i, out in zip(read_idx, outs):
+                results[i] = {"target": chosen, "operation": "read", **out}
+        except PoolExhausted as e:
+            if not write_idx:
+                raise overloaded(e)
+            for i in read_idx:
+                results[i] = {"target": chosen, "operation": "read", "error": f"Overloaded: {e}"}
+        except DBError as e:
+            for i in read_idx:
+                results[i] = {"target": chosen, "operation": "read", "error": f"MySQL error: {e}"}
+
+    labels["rows"] = sum(r.get("count") or r.get("affected") or 0 for r in results)
+    return encoded_response({
+        "count": len(stmts),
+        "reads": len(read_idx),
+        "writes": len(write_idx),
+        "committed": committed,
+        "statements_executed": executed,
+        "results": results,
+    }, media)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=LISTEN_PORT)
\ No newline at end of file
+    if PROCESSES > 1:
+        # Each worker process imports app.py and opens its own pools
+        uvicorn.run("app:app", host="0.0.0.0", port=LISTEN_PORT, workers=PROCESSES, app_dir=str(APP_DIR))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=LISTEN_PORT)
\ No newline at end of file
@@ -0,0 +1,679 @@
+#!/usr/bin/env python3
+"""
+DB execution backends for the Proxy, selected with DB_DRIVER:
+- sync:  mysql-connector-python + pool.py, blocking calls run in the threadpool
+- async: aiomysql pools, queries run natively on the event loop
+- fake:  fakedb.py, in-memory stand-in for local benchmarks (no MySQL)
+
+Both expose the same coroutine API (read/read_many/stream/write/write_gtid/
+write_batch/ping/stats, plus warm/drop to add or remove a node's pool when the
+topology changes) and raise DBError for anything the driver reports, so
+app.py does not care which one is active. Failures of the node rather than of the
+statement (cannot connect, connection lost, no free pooled connection) raise the
+NodeError subclass, which the circuit breakers count and reads retry on; a write
+batch that fails that way raises NodeBatchError (both a BatchError and a NodeError).
+
+Statements may carry DB-API params (%s placeholders). The sync backend runs them
+as server-side prepared statements (binary protocol) cached per connection;
+aiomysql has no prepared-statement support, so the async backend interpolates
+them client-side (still escaped by the driver).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, cast
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from metrics import stage
+from pool import BROKEN_ERRORS, PoolManager, PoolTimeout
+
+
+Rows = List[Tuple[Any, ...]]
+Params = Optional[Sequence[Any]]
+# (sql, params, many): many=True means params is a list of parameter rows for executemany()
+BatchItem = Tuple[str, Any, bool]
+# Client errors meaning the server connection is gone (can't connect, gone away, lost during
+# a query or the network read), whatever exception class the connector reports them with
+CONNECTION_ERRNOS = frozenset({2002, 2003, 2006, 2013, 2055})
+
+
+class DBError(Exception):
+    pass
+
+
+class NodeError(DBError):
+    """The node did not answer: connect failure or broken connection."""
+
+
+class PoolExhausted(DBError):
+    """No free connection to the node within the checkout timeout: overload, not a node failure."""
+
+
+class BatchError(DBError):
+    """A statement of a write batch failed; the whole transaction was rolled back."""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index
+
+
+class NodeBatchError(BatchError, NodeError):
+    """The node failed during a write batch (unreachable, connection lost); index as for BatchError."""
+
+
+class SyncBackend:
+    name = "sync"
+
+    def __init__(
+        self,
+        user: str,
+        password: str,
+        database: str,
+        stmt_cache_size: int = 64,
+        connect_timeout: float = 5.0,
+        **pool_kwargs: Any,
+    ):
+        import mysql.connector
+        from mysql.connector import Error as MySQLError
+
+        self._mysql = mysql.connector
+        self._errors = (MySQLError, PoolTimeout)
+        self._node_errors = BROKEN_ERRORS
+        self.user = user
+        self.password = password
+        self.database = database
+        self.stmt_cache_size = stmt_cache_size
+        self.connect_timeout = connect_timeout
+        self.pools = PoolManager(self.connect, **pool_kwargs)
+        self.stmt_hits = 0
+        self.stmt_prepares = 0
+        self.stmt_evictions = 0
+
+    def connect(self, host: str, port: int):
+        return self._mysql.connect(
+            host=host,
+            port=port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connection_timeout=max(1, int(round(self.connect_timeout))),
+            autocommit=True,
+        )
+
+    # --- prepared statements (per-connection LRU keyed by SQL template) ---
+
+    def _prepared(self, conn, sql: str):
+        cache = getattr(conn, "_proxy_stmts", None)
+        if cache is None:
+            cache = conn._proxy_stmts = OrderedDict()
+        entry = cache.get(sql)
+        if entry is not None:
+            cache.move_to_end(sql)
+            self.stmt_hits += 1
+            return entry
+        # The connector re-prepares unless it gets the very same str object back,
+        # so the cached key is what we pass to execute() from now on
+        entry = (conn.cursor(prepared=True), sql)
+        cache[sql] = entry
+        self.stmt_prepares += 1
+        while len(cache) > self.stmt_cache_size:
+            _, (old, _) = cache.popitem(last=False)
+            self.stmt_evictions += 1
+            try:
+                old.close()  # COM_STMT_CLOSE
+            except Exception:
+                pass
+        return entry
+
+    @contextmanager
+    def _cursor(self, conn, sql: str, params: Params) -> Iterator[Any]:
+        # Plain text protocol without params; server-side prepared statement (binary protocol) with params
+        if params is None:
+            cur = conn.cursor()
+            try:
+                with stage("execute"):
+                    cur.execute(sql)
+                yield cur
+            finally:
+                cur.close()
+            return
+        cur, key = self._prepared(conn, sql)
+        try:
+            with stage("execute"):
+                cur.execute(key, tuple(params))
+        except BaseException:
+            conn._proxy_stmts.pop(sql, None)
+            try:
+                cur.close()
+            except Exception:
+                pass
+            raise
+        yield cur
+
+    @staticmethod
+    def _result(cur) -> Tuple[List[str], Rows]:
+        with stage("fetch"):
+            rows_raw = cur.fetchall() if cur.description else []
+        rows: Rows = cast(Rows, rows_raw if rows_raw is not None else [])
+        colnames = [desc[0] for desc in cur.description] if cur.description else []
+        return colnames, rows
+
+    @contextmanager
+    def _connection(self, host: str, port: int) -> Iterator[Any]:
+        # PoolManager.connection() with the checkout (incl. ping/connect) timed as the "connect" stage
+        pool = self.pools.get(host, port)
+        with stage("connect"):
+            conn = pool.acquire()
+        try:
+            yield conn
+        except BROKEN_ERRORS:
+            pool.release(conn, broken=True)
+            raise
+        except BaseException:
+            pool.release(conn)
+            raise
+        else:
+            pool.release(conn)
+
+    # --- blocking primitives (run in threadpool) ---
+
+    def exec_read(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[List[str], Rows]:
+        with self._connection(host, port) as conn:
+            with self._cursor(conn, sql, params) as cur:
+                return self._result(cur)
+
+    def exec_read_many(self, items: List[Tuple[str, Params]], host: str, port: int) -> List[Dict[str, Any]]:
+        # Several reads on one connection; a failing statement does not stop the others
+        results: List[Dict[str, Any]] = []
+        with self._connection(host, port) as conn:
+            for sql, params in items:
+                try:
+                    with self._cursor(conn, sql, params) as cur:
+                        cols, rows = self._result(cur)
+                    results.append({"columns": cols, "rows": rows, "count": len(rows)})
+                except BROKEN_ERRORS:
+                    raise
+                except self._errors as e:
+                    results.append({"error": f"MySQL error: {e}"})
+        return results
+
+    def iter_read(self, sql: str, host: str, port: int, batch_size: int, params: Params = None) -> Iterator[Any]:
+        # Yields the column names, then batches of rows from an unbuffered cursor
+        pool = self.pools.get(host, port)
+        with stage("connect"):
+            conn = pool.acquire()
+        done = abandoned = False
+        try:
+            with self._cursor(conn, sql, params) as cur:
+                try:
+                    yield [desc[0] for desc in cur.description] if cur.description else []
+                    while cur.description:
+                        with stage("fetch"):
+                            rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        yield rows
+                except GeneratorExit:
+                    abandoned = True
+                    raise
+            done = True
+        except self._errors:
+            # Closing the cursor of an abandoned result fails on the unread rows ("Unread result found")
+            if not abandoned:
+                raise
+        finally:
+            # Abandoned mid-result: unread rows are still on the socket, drop the connection
+            pool.release(conn, broken=not done)
+
+    def exec_write(self, sql: str, host: str, port: int, params: Params = None) -> int:
+        with self._connection(host, port) as conn:
+            with self._cursor(conn, sql, params) as cur:
+                affected = cur.rowcount
+            with stage("commit"):
+                conn.commit()
+            return affected
+
+    def exec_write_gtid(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[int, str]:
+        # Same as exec_write, plus the server's executed GTID set right after commit
+        # (a superset of this write's GTID, used as a read-your-writes token)
+        with self._connection(host, port) as conn:
+            with self._cursor(conn, sql, params) as cur:
+                affected = cur.rowcount
+            with stage("commit"):
+                conn.commit()
+            return affected, self._gtid_executed(conn)
+
+    @staticmethod
+    def _gtid_executed(conn) -> str:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT @@GLOBAL.gtid_executed")
+            row = cur.fetchone()
+            return (row[0] if row else "") or ""
+        finally:
+            cur.close()
+
+    def exec_write_batch(self, items: List[BatchItem], host: str, port: int, with_gtid: bool) -> Tuple[List[int], Optional[str]]:
+        # All statements in one transaction (one commit); any failure rolls everything back
+        i = -1
+        try:
+            with self._connection(host, port) as conn:
+                try:
+                    conn.start_transaction()
+                    affected = []
+                    for i, (sql, params, many) in enumerate(items):
+                        if many:
+                            # executemany() turns INSERT ... VALUES (%s, ...) into one multi-row INSERT
+                            cur = conn.cursor()
+                            try:
+                                with stage("execute"):
+                                    cur.executemany(sql, [tuple(p) for p in params or []])
+                                affected.append(cur.rowcount)
+                            finally:
+                                cur.close()
+                        else:
+                            with self._cursor(conn, sql, params) as cur:
+                                affected.append(cur.rowcount)
+                    i = -1
+                    with stage("commit"):
+                        conn.commit()
+                except BaseException:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    raise
+                return affected, (self._gtid_executed(conn) if with_gtid else None)
+        except PoolTimeout as e:
+            raise PoolExhausted(str(e)) from e
+        except self._errors as e:
+            error = NodeBatchError if self._is_node_error(e) else BatchError
+            raise error(i, str(e)) from e
+
+    def latency_ms(self, host: str, port: int) -> float:
+        # Round trip of SELECT 1 on a pooled connection (connect cost excluded)
+        with self.pools.connection(host, port) as conn:
+            cur = conn.cursor()
+            try:
+                start = time.perf_counter()
+                cur.execute("SELECT 1")
+                _ = cur.fetchone()
+                return (time.perf_counter() - start) * 1000.0
+            finally:
+                cur.close()
+
+    def _is_node_error(self, e: Exception) -> bool:
+        return isinstance(e, self._node_errors) or getattr(e, "errno", None) in CONNECTION_ERRNOS
+
+    def _db_error(self, e: Exception) -> DBError:
+        if isinstance(e, PoolTimeout):
+            return PoolExhausted(str(e))
+        return NodeError(str(e)) if self._is_node_error(e) else DBError(str(e))
+
+    async def _call(self, fn, *args):
+        try:
+            return await run_in_threadpool(fn, *args)
+        except self._errors as e:
+            raise self._db_error(e) from e
+
+    # --- backend API ---
+
+    async def start(self, nodes: List[dict]) -> None:
+        await self.warm(nodes)
+        self.pools.start_reaper()
+
+    async def warm(self, nodes: List[dict]) -> None:
+        await run_in_threadpool(self.pools.warm, nodes)
+
+    async def drop(self, nodes: List[dict]) -> None:
+        for n in nodes:
+            self.pools.remove(n["host"], int(n["port"]))
+
+    async def close(self) -> None:
+        self.pools.close()
+
+    async def read(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[List[str], Rows]:
+        return await self._call(self.exec_read, sql, host, port, params)
+
+    async def read_many(self, items: List[Tuple[str, Params]], host: str, port: int) -> List[Dict[str, Any]]:
+        return await self._call(self.exec_read_many, items, host, port)
+
+    async def stream(self, sql: str, host: str, port: int, batch_size: int = 500, params: Params = None) -> AsyncIterator[Any]:
+        gen = self.iter_read(sql, host, port, batch_size, params)
+        try:
+            async for item in iterate_in_threadpool(gen):
+                yield item
+        except self._errors as e:
+            raise self._db_error(e) from e
+        finally:
+            try:
+                await run_in_threadpool(gen.close)
+            except ValueError:
+                # Still running in its thread (cancelled mid-fetch); closed on garbage collection
+                pass
+
+    async def write(self, sql: str, host: str, port: int, params: Params = None) -> int:
+        return await self._call(self.exec_write, sql, host, port, params)
+
+    async def write_gtid(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[int, str]:
+        return await self._call(self.exec_write_gtid, sql, host, port, params)
+
+    async def write_batch(self, items: List[BatchItem], host: str, port: int, with_gtid: bool = False) -> Tuple[List[int], Optional[str]]:
+        return await self._call(self.exec_write_batch, items, host, port, with_gtid)
+
+    async def ping(self, host: str, port: int) -> float:
+        return await self._call(self.latency_ms, host, port)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return self.pools.stats()
+
+    def statement_stats(self) -> Dict[str, Any]:
+        return {
+            "prepared": True,
+            "cache_size": self.stmt_cache_size,
+            "hits": self.stmt_hits,
+            "prepares": self.stmt_prepares,
+            "evictions": self.stmt_evictions,
+        }
+
+
+class AsyncBackend:
+    name = "async"
+
+    def __init__(
+        self,
+        user: str,
+        password: str,
+        database: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        ping_after: float = 1.0,
+        checkout_timeout: float = 5.0,
+        connect_timeout: float = 5.0,
+    ):
+        import aiomysql
+
+        self._aiomysql = aiomysql
+        self._errors = (aiomysql.MySQLError,)
+        self._broken = (aiomysql.OperationalError, aiomysql.InterfaceError)
+        self.user = user
+        self.password = password
+        self.database = database
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+        self.connect_timeout = connect_timeout
+        self._pools: Dict[Tuple[str, int], Any] = {}
+        self._counters: Dict[Tuple[str, int], Dict[str, int]] = {}
+        self._lock = asyncio.Lock()
+
+    async def _pool(self, host: str, port: int):
+        key = (host, int(port))
+        pool = self._pools.get(key)
+        if pool is None:
+            async with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    # pool_recycle drops connections idle longer than idle_timeout on checkout
+                    pool = await self._aiomysql.create_pool(
+                        host=host,
+                        port=int(port),
+                        user=self.user,
+                        password=self.password,
+                        db=self.database,
+                        minsize=self.min_size,
+                        maxsize=self.max_size,
+                        pool_recycle=int(self.idle_timeout),
+                        connect_timeout=self.connect_timeout,
+                        autocommit=True,
+                    )
+                    self._pools[key] = pool
+                    self._counters[key] = {"reused": 0, "pinged": 0, "broken": 0, "timeouts": 0}
+        return pool
+
+    async def _acquire(self, host: str, port: int):
+        pool = await self._pool(host, port)
+        counters = self._counters[(host, int(port))]
+        while True:
+            try:
+                conn = await asyncio.wait_for(pool.acquire(), self.checkout_timeout)
+            except asyncio.TimeoutError:
+                counters["timeouts"] += 1
+                raise PoolExhausted(f"no free connection to {host}:{port} after {self.checkout_timeout}s")
+            # Health check on borrow: only ping connections that sat idle for a while
+            if asyncio.get_running_loop().time() - conn.last_usage > self.ping_after:
+                counters["pinged"] += 1
+                try:
+                    await conn.ping(reconnect=False)
+                except Exception:
+                    counters["broken"] += 1
+                    conn.close()
+                    pool.release(conn)
+                    continue
+            counters["reused"] += 1
+            return pool, conn
+
+    def _db_error(self, e: Exception) -> DBError:
+        return NodeError(str(e)) if isinstance(e, self._broken) else DBError(str(e))
+
+    async def _run(self, host: str, port: int, fn):
+        try:
+            with stage("connect"):
+                pool, conn = await self._acquire(host, port)
+        except self._errors as e:
+            raise self._db_error(e) from e
+        try:
+            async with conn.cursor() as cur:
+                return await fn(conn, cur)
+        except self._broken as e:
+            self._counters[(host, int(port))]["broken"] += 1
+            conn.close()
+            raise NodeError(str(e)) from e
+        except self._errors as e:
+            raise DBError(str(e)) from e
+        finally:
+            pool.release(conn)
+
+    # --- backend API ---
+
+    async def start(self, nodes: List[dict]) -> None:
+        await self.warm(nodes)
+
+    async def warm(self, nodes: List[dict]) -> None:
+        for n in nodes:
+            try:
+                await self._pool(n["host"], int(n["port"]))
+            except Exception as e:
+                print(f"[pool] warm-up failed for {n['host']}:{n['port']}: {e}")
+
+    async def drop(self, nodes: List[dict]) -> None:
+        # Waits until the connections still in use have been returned
+        for n in nodes:
+            key = (n["host"], int(n["port"]))
+            pool = self._pools.pop(key, None)
+            self._counters.pop(key, None)
+            if pool is not None:
+                pool.close()
+                await pool.wait_closed()
+
+    async def close(self) -> None:
+        for pool in list(self._pools.values()):
+            pool.close()
+            await pool.wait_closed()
+
+    async def read(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[List[str], Rows]:
+        async def fn(conn, cur):
+            with stage("execute"):
+                await cur.execute(sql, params)
+            with stage("fetch"):
+                rows = list(await cur.fetchall())
+            colnames = [desc[0] for desc in cur.description] if cur.description else []
+            return colnames, rows
+
+        return await self._run(host, port, fn)
+
+    async def read_many(self, items: List[Tuple[str, Params]], host: str, port: int) -> List[Dict[str, Any]]:
+        async def fn(conn, cur):
+            results: List[Dict[str, Any]] = []
+            for sql, params in items:
+                try:
+                    with stage("execute"):
+                        await cur.execute(sql, params)
+                    with stage("fetch"):
+                        rows = list(await cur.fetchall())
+                    colnames = [desc[0] for desc in cur.description] if cur.description else []
+                    results.append({"columns": colnames, "rows": rows, "count": len(rows)})
+                except self._broken:
+                    raise
+                except self._errors as e:
+                    results.append({"error": f"MySQL error: {e}"})
+            return results
+
+        return await self._run(host, port, fn)
+
+    async def stream(self, sql: str, host: str, port: int, batch_size: int = 500, params: Params = None) -> AsyncIterator[Any]:
+        try:
+            with stage("connect"):
+                pool, conn = await self._acquire(host, port)
+        except self._errors as e:
+            raise self._db_error(e) from e
+        done = False
+        try:
+            # SSCursor: rows are read from the socket as they are fetched
+            cur = await conn.cursor(self._aiomysql.SSCursor)
+            with stage("execute"):
+                await cur.execute(sql, params)
+            yield [desc[0] for desc in cur.description] if cur.description else []
+            while True:
+                with stage("fetch"):
+                    rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield list(rows)
+            await cur.close()
+            done = True
+        except self._errors as e:
+            raise self._db_error(e) from e
+        finally:
+            if not done:
+                # Abandoned mid-result: closing is cheaper than draining the rest
+                conn.close()
+            pool.release(conn)
+
+    async def write(self, sql: str, host: str, port: int, params: Params = None) -> int:
+        async def fn(conn, cur):
+            with stage("execute"):
+                await cur.execute(sql, params)
+            affected = cur.rowcount
+            with stage("commit"):
+                await conn.commit()
+            return affected
+
+        return await self._run(host, port, fn)
+
+    async def write_gtid(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[int, str]:
+        async def fn(conn, cur):
+            with stage("execute"):
+                await cur.execute(sql, params)
+            affected = cur.rowcount
+            with stage("commit"):
+                await conn.commit()
+            await cur.execute("SELECT @@GLOBAL.gtid_executed")
+            row = await cur.fetchone()
+            return affected, (row[0] if row else "") or ""
+
+        return await self._run(host, port, fn)
+
+    async def write_batch(self, items: List[BatchItem], host: str, port: int, with_gtid: bool = False) -> Tuple[List[int], Optional[str]]:
+        failed = [-1]
+
+        async def fn(conn, cur):
+            await conn.begin()
+            try:
+                affected = []
+                for i, (sql, params, many) in enumerate(items):
+                    failed[0] = i
+                    with stage("execute"):
+                        if many:
+                            await cur.executemany(sql, params or [])
+                        else:
+                            await cur.execute(sql, params)
+                    affected.append(cur.rowcount)
+                failed[0] = -1
+                with stage("commit"):
+                    await conn.commit()
+            except BaseException:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    pass
+                raise
+            gtid = None
+            if with_gtid:
+                await cur.execute("SELECT @@GLOBAL.gtid_executed")
+                row = await cur.fetchone()
+                gtid = (row[0] if row else "") or ""
+            return affected, gtid
+
+        try:
+            return await self._run(host, port, fn)
+        except PoolExhausted:
+            raise
+        except NodeError as e:
+            raise NodeBatchError(failed[0], str(e)) from e
+        except DBError as e:
+            raise BatchError(failed[0], str(e)) from e
+
+    async def ping(self, host: str, port: int) -> float:
+        async def fn(conn, cur):
+            start = time.perf_counter()
+            await cur.execute("SELECT 1")
+            await cur.fetchone()
+            return (time.perf_counter() - start) * 1000.0
+
+        return await self._run(host, port, fn)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        out = []
+        for (host, port), pool in list(self._pools.items()):
+            out.append({
+                "host": host,
+                "port": port,
+                "size": pool.size,
+                "idle": pool.freesize,
+                "in_use": pool.size - pool.freesize,
+                "min_size": pool.minsize,
+                "max_size": pool.maxsize,
+                **self._counters[(host, port)],
+            })
+        return out
+
+    def statement_stats(self) -> Dict[str, Any]:
+        # aiomysql only speaks the text protocol: params are escaped client-side
+        return {"prepared": False}
+
+
+def make_backend(
+    driver: str,
+    user: str,
+    password: str,
+    database: str,
+    stmt_cache_size: int = 64,
+    connect_timeout: float = 5.0,
+    **pool_kwargs: Any,
+):
+    if driver == "sync":
+        return SyncBackend(user, password, database, stmt_cache_size=stmt_cache_size, connect_timeout=connect_timeout, **pool_kwargs)
+    if driver == "async":
+        return AsyncBackend(user, password, database, connect_timeout=connect_timeout, **pool_kwargs)
+    if driver == "fake":
+        # Local benchmarking without MySQL
+        from fakedb import FakeBackend
+
+        return FakeBackend()
+    raise ValueError(f"Unknown DB_DRIVER: {driver!r} (expected sync|async|fake)")
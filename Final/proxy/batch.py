@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Helpers for the /batch endpoint: coalescing runs of same-shape single-row
+INSERTs into one multi-row INSERT (what executemany() does for parameterized
+inserts), so a batch of N inserts costs one statement and one commit.
+"""
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+# INSERT [IGNORE] INTO table [(cols)] VALUES <rest>
+_INSERT_RE = re.compile(
+    r"^\s*(insert\s+(?:ignore\s+)?into\s+[`\w.$]+\s*(?:\([^()]*\))?\s*values)\s*(.*?)\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def _single_tuple(rest: str) -> Optional[str]:
+    """Return rest if it is exactly one parenthesized tuple (quote-aware), else None."""
+    if not rest.startswith("("):
+        return None
+    depth = 0
+    quote = ""
+    i = 0
+    while i < len(rest):
+        ch = rest[i]
+        if quote:
+            if ch == "\\":
+                i += 2
+                continue
+            if ch == quote:
+                quote = ""
+        elif ch in ("'", '"', "`"):
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return rest if i == len(rest) - 1 else None
+        i += 1
+    return None
+
+
+def insert_shape(sql: str) -> Optional[Tuple[str, str, str]]:
+    """(shape key, prefix, values tuple) for a single-row INSERT ... VALUES (...), else None."""
+    m = _INSERT_RE.match(sql)
+    if not m:
+        return None
+    values = _single_tuple(m.group(2))
+    if values is None:
+        return None
+    prefix = " ".join(m.group(1).split())
+    return prefix.lower(), prefix, values
+
+
+def coalesce_writes(statements: List[str], max_rows: int = 1000) -> List[Tuple[str, List[int]]]:
+    """
+    Group adjacent same-shape single-row INSERTs (order preserved).
+    Returns [(sql, [indices of the original statements it covers]), ...].
+    """
+    groups: List[Tuple[str, List[int]]] = []
+    run_key = None
+    run_prefix = ""
+    run_values: List[str] = []
+    run_idx: List[int] = []
+
+    def flush():
+        if run_idx:
+            if len(run_idx) == 1:
+                groups.append((statements[run_idx[0]], list(run_idx)))
+            else:
+                groups.append((f"{run_prefix} {', '.join(run_values)}", list(run_idx)))
+
+    for i, sql in enumerate(statements):
+        shape = insert_shape(sql)
+        if shape is not None and shape[0] == run_key and len(run_idx) < max_rows:
+            run_values.append(shape[2])
+            run_idx.append(i)
+            continue
+        flush()
+        run_idx = []
+        run_values = []
+        run_key = None
+        if shape is not None:
+            run_key, run_prefix, values = shape
+            run_values = [values]
+            run_idx = [i]
+        else:
+            groups.append((sql, [i]))
+    flush()
+    return groups
+
+
+def coalesce_items(
+    items: List[Tuple[str, Optional[Sequence[Any]]]], max_rows: int = 1000
+) -> List[Tuple[str, Any, bool, List[int]]]:
+    """
+    Like coalesce_writes() for (sql, params) items. Literal statements are merged
+    textually; adjacent parameterized single-row INSERTs with the same SQL template
+    become one executemany() item (the driver sends them as one multi-row INSERT).
+    Returns [(sql, params, many, [indices]), ...].
+    """
+    out: List[Tuple[str, Any, bool, List[int]]] = []
+    i = 0
+    while i < len(items):
+        sql, params = items[i]
+        if params is None:
+            # Run of literal statements
+            j = i
+            while j < len(items) and items[j][1] is None:
+                j += 1
+            for merged, idx in coalesce_writes([s for s, _ in items[i:j]], max_rows):
+                out.append((merged, None, False, [i + k for k in idx]))
+            i = j
+            continue
+        j = i + 1
+        if insert_shape(sql) is not None:
+            while j < len(items) and j - i < max_rows and items[j][0] == sql and items[j][1] is not None:
+                j += 1
+        if j - i == 1:
+            out.append((sql, params, False, [i]))
+        else:
+            out.append((sql, [p for _, p in items[i:j]], True, list(range(i, j))))
+        i = j
+    return out
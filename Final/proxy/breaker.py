@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Per-node circuit breakers for fast failover.
+
+- closed: traffic flows; failure_threshold consecutive node failures open the breaker
+- open: routing skips the node for reset_timeout seconds (no request waits on a dead node)
+- half-open: once the timeout has passed, up to half_open_max trial requests at a
+  time are let through; a success closes the breaker, a failure re-opens it
+
+Every request executed on a node is wrapped in CircuitBreakers.track(). Only the
+failure_types exceptions count as failures (node unreachable, broken connection);
+any other exception means the node answered, e.g. a SQL error, and counts as a success.
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple, Type
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class Breaker:
+    def __init__(self, node: dict):
+        self.node = node
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        self.opens = 0
+        self.last_error = ""
+
+
+class CircuitBreakers:
+    def __init__(
+        self,
+        failure_types: Tuple[Type[BaseException], ...],
+        failure_threshold: int = 5,
+        reset_timeout: float = 5.0,
+        half_open_max: int = 1,
+    ):
+        self.failure_types = failure_types
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._nodes: Dict[Tuple[str, int], Breaker] = {}
+
+    def _get(self, node: dict) -> Breaker:
+        key = (node["host"], int(node["port"]))
+        b = self._nodes.get(key)
+        if b is None:
+            b = self._nodes[key] = Breaker(node)
+        return b
+
+    def _refresh(self, b: Breaker) -> str:
+        # open -> half-open happens lazily, when somebody asks after the timeout
+        if b.state == OPEN and time.monotonic() - b.opened_at >= self.reset_timeout:
+            b.state = HALF_OPEN
+            b.trials = 0
+        return b.state
+
+    def state(self, node: dict) -> str:
+        return self._refresh(self._get(node))
+
+    def available(self, node: dict) -> bool:
+        b = self._get(node)
+        state = self._refresh(b)
+        if state == CLOSED:
+            return True
+        return state == HALF_OPEN and b.trials < self.half_open_max
+
+    def _open(self, b: Breaker) -> None:
+        if b.state != OPEN:
+            b.opens += 1
+            print(f"[breaker] {b.node['host']}:{b.node['port']} open after {b.failures} failure(s): {b.last_error}")
+        b.state = OPEN
+        b.opened_at = time.monotonic()
+        b.trials = 0
+
+    def record(self, node: dict, ok: bool, error: str = "") -> None:
+        b = self._get(node)
+        if ok:
+            if b.state != CLOSED:
+                print(f"[breaker] {b.node['host']}:{b.node['port']} closed")
+            b.state = CLOSED
+            b.failures = 0
+            b.trials = 0
+            return
+        b.failures += 1
+        b.last_error = error
+        if b.state == HALF_OPEN or b.failures >= self.failure_threshold:
+            self._open(b)
+
+    @contextmanager
+    def track(self, node: dict) -> Iterator[None]:
+        b = self._get(node)
+        trial = self._refresh(b) == HALF_OPEN
+        if trial:
+            b.trials += 1
+        try:
+            yield
+        except self.failure_types as e:
+            self.record(node, False, str(e) or type(e).__name__)
+            raise
+        except Exception:
+            self.record(node, True)
+            raise
+        else:
+            self.record(node, True)
+        finally:
+            # The trial slot is free again (also if the request was cancelled)
+            if trial:
+                b.trials = max(0, b.trials - 1)
+
+    def forget(self, node: dict) -> None:
+        self._nodes.pop((node["host"], int(node["port"])), None)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        out = []
+        for b in list(self._nodes.values()):
+            state = self._refresh(b)
+            out.append({
+                "host": b.node["host"],
+                "port": int(b.node["port"]),
+                "state": state,
+                "consecutive_failures": b.failures,
+                "opens": b.opens,
+                "retry_in_s": round(max(0.0, self.reset_timeout - (time.monotonic() - b.opened_at)), 3) if state == OPEN else None,
+                "last_error": b.last_error,
+            })
+        return out
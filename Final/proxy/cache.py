@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Optional in-process read-result cache for the Proxy.
+
+- Key: normalized SQL text (whitespace collapsed outside literals, no trailing ';')
+- LRU eviction bounded by entry count and approximate bytes, plus a TTL
+- Writes invalidate every entry that references one of the written tables;
+  a write with no recognizable table clears the whole cache
+- Per-table generations stop a read that started before a write from caching
+  its (now stale) result, and a short hold after each write avoids caching
+  reads served by a replica that has not applied the write yet
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from sqlscan import SqlInfo
+
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`")
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    # Collapse whitespace outside quoted literals/identifiers
+    parts = []
+    pos = 0
+    for m in _LITERAL_RE.finditer(sql):
+        parts.append(_WS_RE.sub(" ", sql[pos:m.start()]))
+        parts.append(m.group(0))
+        pos = m.end()
+    parts.append(_WS_RE.sub(" ", sql[pos:]))
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+def write_tables(info: SqlInfo) -> Set[str]:
+    # DDL and anything unrecognized invalidate the whole cache (empty set)
+    if info.keyword in ("create", "alter", "drop", "truncate", "rename"):
+        return set()
+    return set(info.tables)
+
+
+def is_cacheable(info: SqlInfo) -> bool:
+    # Single plain SELECT whose result only depends on table contents
+    return info.keyword == "select" and info.operation == "read" and info.statements == 1 and not info.volatile
+
+
+def estimate_bytes(cols: Iterable[str], rows: Iterable[Tuple[Any, ...]]) -> int:
+    size = sum(len(c) for c in cols)
+    for row in rows:
+        for v in row:
+            size += 8 + (len(v) if isinstance(v, (str, bytes)) else 8)
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 5.0, write_hold: float = 1.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.write_hold = write_hold
+        self._lock = threading.Lock()
+        # key -> (value, tables, size, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, Set[str], int, float]]" = OrderedDict()
+        self._by_table: Dict[str, Set[str]] = {}
+        self._generation: Dict[str, int] = {}
+        self._hold_until: Dict[str, float] = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.skipped = 0
+
+    def _drop_locked(self, key: str) -> None:
+        _, tables, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        for t in tables:
+            keys = self._by_table.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[t]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[3] < time.monotonic():
+                self._drop_locked(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generation.get(t, 0) for t in sorted(tables)) + (self._generation.get("*", 0),)
+
+    def put(self, key: str, value: Any, tables: Set[str], size: int, generation: Tuple[int, ...]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            held = any(self._hold_until.get(t, 0.0) > now for t in tables) or self._hold_until.get("*", 0.0) > now
+            current = tuple(self._generation.get(t, 0) for t in sorted(tables)) + (self._generation.get("*", 0),)
+            if not tables or held or current != generation or size > self.max_bytes:
+                self.skipped += 1
+                return False
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = (value, set(tables), size, now + self.ttl)
+            self._bytes += size
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, tables: Set[str]) -> None:
+        hold = time.monotonic() + self.write_hold
+        with self._lock:
+            if not tables:
+                # Unknown scope: drop everything
+                self.invalidations += len(self._entries)
+                for key in list(self._entries):
+                    self._drop_locked(key)
+                tables = {"*"}
+            for t in tables:
+                self._generation[t] = self._generation.get(t, 0) + 1
+                self._hold_until[t] = hold
+                for key in list(self._by_table.get(t, ())):
+                    self._drop_locked(key)
+                    self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "skipped": self.skipped,
+            }
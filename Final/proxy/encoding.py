@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Response encoding helpers for the Proxy.
+
+json_default() mirrors what FastAPI's jsonable_encoder does for the MySQL
+types found in Sakila (DATETIME/DATE/TIME, DECIMAL, BLOB/BIT, SET), so the
+streamed NDJSON rows look exactly like the rows of a regular JSON response.
+
+Content negotiation (Accept header) between four encodings of the same result:
+- application/json (default): orjson when installed, else one precompiled stdlib encoder
+- application/msgpack: same object as MessagePack (needs the msgpack package; bytes stay binary)
+- application/vnd.dbproxy.columnar+json / +msgpack: every result with rows becomes
+  {"columns", "types", "data": [one array per column], ...}: names once, one type
+  tag per column (int, float, decimal, str, datetime, date, time, interval, bytes, set, null)
+"""
+import base64
+import datetime
+import decimal
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack encodings are then not offered
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.dbproxy.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.dbproxy.columnar+msgpack"
+
+
+def json_default(o: Any) -> Any:
+    if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, datetime.timedelta):
+        return o.total_seconds()
+    if isinstance(o, decimal.Decimal):
+        return int(o) if o.as_tuple().exponent >= 0 else float(o)
+    if isinstance(o, (bytes, bytearray)):
+        try:
+            return bytes(o).decode("utf-8")
+        except UnicodeDecodeError:
+            return base64.b64encode(bytes(o)).decode("ascii")
+    if isinstance(o, (set, frozenset)):
+        return sorted(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+_JSON_ENCODER = json.JSONEncoder(default=json_default, separators=(",", ":"))
+
+
+def json_bytes(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default)
+    return _JSON_ENCODER.encode(obj).encode("utf-8")
+
+
+def ndjson_line(obj: Any) -> bytes:
+    return json_bytes(obj) + b"\n"
+
+
+# --- content negotiation ---
+
+_ALIASES = {"application/x-msgpack": MSGPACK}
+
+
+def available() -> List[str]:
+    media = [JSON, COLUMNAR_JSON]
+    if msgpack is not None:
+        media += [MSGPACK, COLUMNAR_MSGPACK]
+    return media
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Media type to answer with for an Accept header; None if nothing acceptable (406)."""
+    if not accept:
+        return JSON
+    offered = available()
+    ranges: List[Tuple[float, int, str]] = []
+    for i, part in enumerate(accept.split(",")):
+        media, _, params = part.strip().partition(";")
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        media = _ALIASES.get(media.strip().lower(), media.strip().lower())
+        if q > 0:
+            ranges.append((-q, i, media))
+    for _, _, media in sorted(ranges):
+        if media in ("*/*", "application/*"):
+            return JSON
+        if media in offered:
+            return media
+    return None
+
+
+def _column_type(values: List[Any]) -> str:
+    for v in values:
+        if v is None:
+            continue
+        if isinstance(v, bool):
+            return "bool"
+        if isinstance(v, int):
+            return "int"
+        if isinstance(v, float):
+            return "float"
+        if isinstance(v, decimal.Decimal):
+            return "decimal"
+        if isinstance(v, str):
+            return "str"
+        if isinstance(v, datetime.datetime):
+            return "datetime"
+        if isinstance(v, datetime.date):
+            return "date"
+        if isinstance(v, datetime.time):
+            return "time"
+        if isinstance(v, datetime.timedelta):
+            return "interval"
+        if isinstance(v, (bytes, bytearray)):
+            return "bytes"
+        if isinstance(v, (set, frozenset)):
+            return "set"
+        return type(v).__name__
+    return "null"
+
+
+def columnar(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Row-wise result (or /batch response) -> column arrays."""
+    if "results" in obj:
+        return {**obj, "results": [columnar(r) for r in obj["results"]]}
+    if "rows" not in obj:
+        return obj
+    cols = obj.get("columns") or []
+    data = [list(c) for c in zip(*obj["rows"])] if obj["rows"] else [[] for _ in cols]
+    out = {k: v for k, v in obj.items() if k != "rows"}
+    out["types"] = [_column_type(c) for c in data]
+    out["data"] = data
+    return out
+
+
+def encode(obj: Any, media: str) -> bytes:
+    if media == JSON:
+        return json_bytes(obj)
+    if media == COLUMNAR_JSON:
+        return json_bytes(columnar(obj))
+    if media == MSGPACK:
+        return msgpack.packb(obj, default=json_default, use_bin_type=True)
+    if media == COLUMNAR_MSGPACK:
+        return msgpack.packb(columnar(obj), default=json_default, use_bin_type=True)
+    raise ValueError(f"unsupported media type {media!r}")
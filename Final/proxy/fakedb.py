@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+In-memory MySQL stand-in for local benchmarking (DB_DRIVER=fake).
+
+Implements the backend API of backends.py without any network I/O: every call
+sleeps for the node's configured latency on the event loop and returns canned
+rows, so a local run measures only the Gatekeeper/Proxy overhead (routing,
+validation, serialization, HTTP hops).
+
+Env:
+- FAKE_LATENCY_MS (1.0) base per-call latency, FAKE_JITTER_MS (0.2) uniform jitter on top
+- FAKE_NODE_LATENCY_MS "worker1=5,10.0.0.12:3306=0.5" per-node overrides (host or host:port)
+- FAKE_FAILURE_RATE (0) probability a call fails as if the node were down (NodeError),
+  FAKE_NODE_FAILURE_RATE per-node overrides (worker1=1 simulates a dead worker)
+- FAKE_ROWS (1) rows returned by each read
+- FAKE_REPLICA_LAG_S (0) Seconds_Behind_Source reported by every worker
+- FAKE_KEY_MAX (16049, Sakila's rental/payment) upper key bound reported to the scatter strategy;
+  keyset pages (`_page_key`) return consecutive keys within [1, FAKE_KEY_MAX]
+"""
+import asyncio
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from backends import BatchItem, NodeBatchError, NodeError, Params, Rows
+from metrics import stage
+
+
+_KEYSET_RE = re.compile(r"AS `_PAGE_KEY` .*?(?:([<>]) (\d+) )?ORDER BY .* (ASC|DESC) LIMIT (\d+)$")
+
+
+def _node_map(spec: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in spec.split(","):
+        if "=" in part:
+            node, _, value = part.partition("=")
+            out[node.strip()] = float(value)
+    return out
+
+
+class FakeBackend:
+    name = "fake"
+
+    def __init__(self, *_args: Any, **_kwargs: Any):
+        self.latency_ms = float(os.getenv("FAKE_LATENCY_MS", "1.0"))
+        self.jitter_ms = float(os.getenv("FAKE_JITTER_MS", "0.2"))
+        self.node_latency = _node_map(os.getenv("FAKE_NODE_LATENCY_MS", ""))
+        self.failure_rate = float(os.getenv("FAKE_FAILURE_RATE", "0"))
+        self.node_failure = _node_map(os.getenv("FAKE_NODE_FAILURE_RATE", ""))
+        self.rows = int(os.getenv("FAKE_ROWS", "1"))
+        self.replica_lag_s = float(os.getenv("FAKE_REPLICA_LAG_S", "0"))
+        self.key_max = int(os.getenv("FAKE_KEY_MAX", "16049"))
+        self._uuid = "3e11fa47-71ca-11e1-9e33-c80aa9429562"
+        self._gtid_seq = 0
+        self._counters: Dict[Tuple[str, int], Dict[str, int]] = {}
+
+    def _lookup(self, table: Dict[str, float], host: str, port: int, default: float) -> float:
+        return table.get(f"{host}:{port}", table.get(host, default))
+
+    async def _hit(self, host: str, port: int) -> None:
+        c = self._counters.setdefault((host, port), {"calls": 0, "failures": 0})
+        c["calls"] += 1
+        ms = self._lookup(self.node_latency, host, port, self.latency_ms) + random.uniform(0, self.jitter_ms)
+        with stage("execute"):
+            await asyncio.sleep(ms / 1000.0)
+        if random.random() < self._lookup(self.node_failure, host, port, self.failure_rate):
+            c["failures"] += 1
+            raise NodeError(f"injected failure on {host}:{port}")
+
+    def _gtid(self) -> str:
+        return f"{self._uuid}:1-{self._gtid_seq}" if self._gtid_seq else ""
+
+    def _result(self, sql: str) -> Tuple[List[str], Rows]:
+        s = sql.lstrip().upper()
+        if s.startswith("SELECT @@GLOBAL.GTID_EXECUTED"):
+            return ["@@GLOBAL.gtid_executed"], [(self._gtid(),)]
+        if s.startswith("SHOW REPLICA STATUS") or s.startswith("SHOW SLAVE STATUS"):
+            cols = ["Seconds_Behind_Source", "Replica_IO_Running", "Replica_SQL_Running", "Executed_Gtid_Set"]
+            return cols, [(self.replica_lag_s, "Yes", "Yes", self._gtid())]
+        if s.startswith("SELECT MIN(") and ", MAX(" in s:
+            return ["min", "max"], [(1, self.key_max)]
+        page = _KEYSET_RE.search(s)
+        if page:
+            op, after, order, limit = page.groups()
+            if order == "ASC":
+                keys = range(int(after) + 1 if op else 1, self.key_max + 1)
+            else:
+                keys = range(int(after) - 1 if op else self.key_max, 0, -1)
+            return ["id", "value", "_page_key"], [(k, f"row {k}", k) for k in keys[:int(limit)]]
+        return ["id", "value"], [(i + 1, f"row {i + 1}") for i in range(self.rows)]
+
+    # --- backend API ---
+
+    async def start(self, nodes: List[dict]) -> None:
+        await self.warm(nodes)
+
+    async def warm(self, nodes: List[dict]) -> None:
+        for n in nodes:
+            self._counters.setdefault((n["host"], int(n["port"])), {"calls": 0, "failures": 0})
+
+    async def drop(self, nodes: List[dict]) -> None:
+        for n in nodes:
+            self._counters.pop((n["host"], int(n["port"])), None)
+
+    async def close(self) -> None:
+        pass
+
+    async def read(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[List[str], Rows]:
+        await self._hit(host, port)
+        return self._result(sql)
+
+    async def read_many(self, items: List[Tuple[str, Params]], host: str, port: int) -> List[Dict[str, Any]]:
+        await self._hit(host, port)
+        results: List[Dict[str, Any]] = []
+        for sql, _ in items:
+            cols, rows = self._result(sql)
+            results.append({"columns": cols, "rows": rows, "count": len(rows)})
+        return results
+
+    async def stream(self, sql: str, host: str, port: int, batch_size: int = 500, params: Params = None) -> AsyncIterator[Any]:
+        await self._hit(host, port)
+        cols, rows = self._result(sql)
+        yield cols
+        for i in range(0, len(rows), batch_size):
+            yield rows[i:i + batch_size]
+
+    async def write(self, sql: str, host: str, port: int, params: Params = None) -> int:
+        await self._hit(host, port)
+        self._gtid_seq += 1
+        return 1
+
+    async def write_gtid(self, sql: str, host: str, port: int, params: Params = None) -> Tuple[int, str]:
+        affected = await self.write(sql, host, port, params)
+        return affected, self._gtid()
+
+    async def write_batch(self, items: List[BatchItem], host: str, port: int, with_gtid: bool = False) -> Tuple[List[int], Optional[str]]:
+        try:
+            await self._hit(host, port)
+        except NodeError as e:
+            raise NodeBatchError(-1, str(e)) from e
+        self._gtid_seq += 1
+        affected = [len(params) if many else 1 for _, params, many in items]
+        return affected, (self._gtid() if with_gtid else None)
+
+    async def ping(self, host: str, port: int) -> float:
+        start = time.perf_counter()
+        await self._hit(host, port)
+        return (time.perf_counter() - start) * 1000.0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [{"host": h, "port": p, **c} for (h, p), c in list(self._counters.items())]
+
+    def statement_stats(self) -> Dict[str, Any]:
+        return {"prepared": False}
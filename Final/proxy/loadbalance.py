@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Per-node load tracking for the `least-loaded` strategy.
+
+Every query executed by the Proxy is wrapped in LoadTracker.track(), which
+keeps the node's in-flight count and an EWMA of its observed query latency.
+The expected completion time of a new request on a node is
+(in_flight + 1) * ewma_ms / weight; pick() compares two random candidates
+(power of two choices) so concurrent reads spread instead of herding on the
+single fastest node.
+"""
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class NodeLoad:
+    def __init__(self, node: dict):
+        self.node = node
+        self.in_flight = 0
+        self.ewma_ms: Optional[float] = None
+        self.completed = 0
+        self.errors = 0
+
+
+class LoadTracker:
+    def __init__(self, alpha: float = 0.2, default_ms: float = 1.0):
+        self.alpha = alpha
+        self.default_ms = default_ms
+        self._nodes: Dict[Tuple[str, int], NodeLoad] = {}
+
+    def _get(self, node: dict) -> NodeLoad:
+        key = (node["host"], int(node["port"]))
+        load = self._nodes.get(key)
+        if load is None:
+            load = self._nodes[key] = NodeLoad(node)
+        return load
+
+    @contextmanager
+    def track(self, node: dict) -> Iterator[None]:
+        load = self._get(node)
+        load.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            load.errors += 1
+            raise
+        finally:
+            load.in_flight -= 1
+            ms = (time.perf_counter() - start) * 1000.0
+            load.ewma_ms = ms if load.ewma_ms is None else self.alpha * ms + (1 - self.alpha) * load.ewma_ms
+            load.completed += 1
+
+    def in_flight(self, node: dict) -> int:
+        load = self._nodes.get((node["host"], int(node["port"])))
+        return load.in_flight if load is not None else 0
+
+    def forget(self, node: dict) -> None:
+        self._nodes.pop((node["host"], int(node["port"])), None)
+
+    def score(self, node: dict, weight: float = 1.0) -> float:
+        load = self._get(node)
+        ewma = load.ewma_ms if load.ewma_ms is not None else self.default_ms
+        return (load.in_flight + 1) * ewma / max(weight, 1e-6)
+
+    def pick(self, candidates: List[Tuple[dict, float]]) -> Tuple[dict, float]:
+        """Power of two choices over (node, weight) candidates; returns (node, score)."""
+        if len(candidates) == 1:
+            node, weight = candidates[0]
+            return node, self.score(node, weight)
+        a, b = random.sample(candidates, 2)
+        sa, sb = self.score(*a), self.score(*b)
+        return (a[0], sa) if sa <= sb else (b[0], sb)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "host": load.node["host"],
+                "port": int(load.node["port"]),
+                "in_flight": load.in_flight,
+                "ewma_ms": round(load.ewma_ms, 3) if load.ewma_ms is not None else None,
+                "completed": load.completed,
+                "errors": load.errors,
+            }
+            for load in list(self._nodes.values())
+        ]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Paginated READs for the Proxy (POST /query with page_size, then cursor=<next>).
+
+Two ways to page a result, both answered with {"rows": <one page>, "next": <token or null>}:
+- keyset: statements scatter.plan() can rewrite (one table, ordered by nothing or
+  by its integer key) run as "... WHERE key > <last key> ORDER BY key LIMIT n+1"
+  for every page. The token carries the last key, so nothing is held between
+  pages and any process/node can answer the next one.
+- cursor: any other READ keeps a server-side (unbuffered) cursor open on the node
+  that ran it; every page fetches the next rows from it. The token names the
+  cursor, which lives in this process only.
+
+CursorTable holds the open cursors: at most max_per_node per node (each holds a
+pooled connection; open() raises CursorsFull beyond that), closed after
+idle_timeout seconds without a page (reap()), when the last row was read, or at
+shutdown.
+
+Tokens are base64url JSON with a hash of the statement and params (query_hash()),
+so a token is only accepted with the statement it was issued for.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import secrets
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+def query_hash(key: str) -> str:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def encode_token(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Raises ValueError on anything that is not a token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("malformed cursor token")
+    if not isinstance(state, dict) or not isinstance(state.get("h"), str):
+        raise ValueError("malformed cursor token")
+    return state
+
+
+class CursorsFull(Exception):
+    def __init__(self, node: str, retry_after: float):
+        super().__init__(f"too many open cursors on {node}")
+        self.node = node
+        self.retry_after = retry_after
+
+
+class Cursor:
+    __slots__ = ("id", "node", "query", "columns", "rows", "batch_size", "buffer", "done", "lock", "last_used", "fetched")
+
+    def __init__(self, cursor_id: str, node: str, query: str):
+        self.id = cursor_id
+        self.node = node
+        self.query = query
+        self.columns: List[str] = []
+        self.rows: Optional[AsyncIterator[Any]] = None
+        self.batch_size = 0
+        self.buffer: List[Any] = []
+        self.done = False
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.fetched = 0
+
+
+class CursorTable:
+    def __init__(self, max_per_node: int = 8, idle_timeout: float = 30.0):
+        self.max_per_node = max_per_node
+        self.idle_timeout = idle_timeout
+        self._cursors: Dict[str, Cursor] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.pid = os.getpid()
+        self.opened = 0
+        self.exhausted = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def open(self, node: str, query: str) -> Cursor:
+        """Reserves a slot on node (CursorsFull if none is left); attach() the rows, or discard()."""
+        mine = [c for c in self._cursors.values() if c.node == node]
+        if len(mine) >= self.max_per_node:
+            self.rejected += 1
+            # The node's least recently used cursor expires first
+            oldest = min(c.last_used for c in mine)
+            raise CursorsFull(node, max(0.0, oldest + self.idle_timeout - time.monotonic()))
+        cur = Cursor(f"{self.pid}-{secrets.token_urlsafe(9)}", node, query)
+        self._cursors[cur.id] = cur
+        return cur
+
+    async def attach(self, cur: Cursor, rows: AsyncIterator[Any], batch_size: int) -> None:
+        # Runs the statement: the first item of a backend stream is the column names
+        cur.columns = await rows.__anext__()
+        cur.rows = rows
+        cur.batch_size = batch_size
+        cur.last_used = time.monotonic()
+        self.opened += 1
+
+    def get(self, cursor_id: str) -> Optional[Cursor]:
+        return self._cursors.get(cursor_id)
+
+    async def fetch(self, cur: Cursor, n: int) -> Tuple[List[Any], bool]:
+        """The next n rows, and whether the result is exhausted (the cursor is then closed)."""
+        async with cur.lock:
+            cur.last_used = time.monotonic()
+            last = cur.batch_size
+            while len(cur.buffer) < n and not cur.done:
+                last = await self._next(cur)
+            if not cur.buffer and not cur.done and last < cur.batch_size:
+                # A short batch was the end of the result: confirm without waiting for the next page
+                await self._next(cur)
+            page, cur.buffer = cur.buffer[:n], cur.buffer[n:]
+            cur.fetched += len(page)
+            cur.last_used = time.monotonic()
+            done = cur.done and not cur.buffer
+        if done:
+            self.exhausted += 1
+            await self.close(cur)
+        return page, done
+
+    async def _next(self, cur: Cursor) -> int:
+        try:
+            batch = await cur.rows.__anext__()
+        except StopAsyncIteration:
+            cur.done = True
+            return 0
+        cur.buffer.extend(batch)
+        return len(batch)
+
+    async def close(self, cur: Cursor) -> None:
+        """Never raises: the connection of a cursor that cannot be closed cleanly is dropped by the backend."""
+        if self._cursors.pop(cur.id, None) is not None and cur.rows is not None:
+            try:
+                await cur.rows.aclose()
+            except Exception as e:
+                # e.g. rows still unread on the connection
+                print(f"[paging] closing cursor {cur.id} on {cur.node}: {e}")
+
+    def discard(self, cur: Cursor) -> None:
+        # Slot reserved by open() whose statement never ran
+        self._cursors.pop(cur.id, None)
+
+    # --- idle timeout ---
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._reap_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for cur in list(self._cursors.values()):
+            await self.close(cur)
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(0.1, min(1.0, self.idle_timeout / 4)))
+            await self.reap()
+
+    async def reap(self) -> None:
+        # Idle cursors hold a connection (and the server's result); a page in progress is never cut
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [c for c in self._cursors.values() if c.rows is not None and c.last_used < cutoff and not c.lock.locked()]
+        for cur in idle:
+            self.expired += 1
+            await self.close(cur)
+
+    def stats(self) -> Dict[str, Any]:
+        per_node: Dict[str, int] = {}
+        for c in self._cursors.values():
+            per_node[c.node] = per_node.get(c.node, 0) + 1
+        return {
+            "open": len(self._cursors),
+            "per_node": per_node,
+            "max_per_node": self.max_per_node,
+            "idle_timeout_s": self.idle_timeout,
+            "opened": self.opened,
+            "exhausted": self.exhausted,
+            "expired": self.expired,
+            "rejected": self.rejected,
+        }
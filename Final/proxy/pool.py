@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Minimal per-node MySQL connection pools for the Proxy.
+
+One ConnectionPool per (host, port). Connections are created lazily up to
+max_size, reused LIFO (warmest first), pinged on checkout when they have been
+idle for a while, and closed when idle longer than idle_timeout (never below
+min_size).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from mysql.connector import errors as mysql_errors
+
+
+# Errors after which the connection itself cannot be trusted anymore
+BROKEN_ERRORS = (mysql_errors.InterfaceError, mysql_errors.OperationalError)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        connect: Callable[[str, int], Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        ping_after: float = 1.0,
+        checkout_timeout: float = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self._connect = connect
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle: Deque[Tuple[Any, float]] = deque()  # (conn, last_used)
+        self._size = 0  # idle + in use
+        self._closed = False
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.broken = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    # --- internal helpers ---
+
+    def _close_quietly(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, now: float) -> List[Any]:
+        # Oldest idle connections sit at the left end of the deque
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self.evicted += 1
+            expired.append(conn)
+        return expired
+
+    def _discard(self, conn: Any) -> None:
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self.broken += 1
+            self._cond.notify()
+
+    # --- public API ---
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout(f"pool {self.host}:{self.port} is closed")
+                expired = self._evict_idle_locked(time.monotonic())
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"no free connection to {self.host}:{self.port} after {self.checkout_timeout}s")
+                    self.waits += 1
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+            for c in expired:
+                self._close_quietly(c)
+
+            if create:
+                try:
+                    conn = self._connect(self.host, self.port)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self.created += 1
+                return conn
+
+            # Health check on borrow: only ping connections that sat idle for a while
+            if time.monotonic() - last_used > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._discard(conn)
+                    continue
+            with self._cond:
+                self.reused += 1
+            return conn
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        if not broken:
+            try:
+                # Never hand out a connection with a pending transaction/snapshot
+                if conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+        except BROKEN_ERRORS:
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def warm(self) -> None:
+        # Open connections up to min_size (best effort)
+        conns = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                conns.append(self.acquire())
+        finally:
+            for c in conns:
+                self.release(c)
+
+    def prune(self) -> None:
+        with self._cond:
+            expired = self._evict_idle_locked(time.monotonic())
+        for c in expired:
+            self._close_quietly(c)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for c in idle:
+            self._close_quietly(c)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "host": self.host,
+                "port": self.port,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+                "broken": self.broken,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+            }
+
+
+class PoolManager:
+    """Lazily creates one ConnectionPool per (host, port) and reaps idle connections."""
+
+    def __init__(self, connect: Callable[[str, int], Any], **pool_kwargs: Any):
+        self._connect = connect
+        self._pool_kwargs = pool_kwargs
+        self._pools: Dict[Tuple[str, int], ConnectionPool] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get(self, host: str, port: int) -> ConnectionPool:
+        key = (host, int(port))
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = ConnectionPool(host, int(port), self._connect, **self._pool_kwargs)
+                    self._pools[key] = pool
+        return pool
+
+    @contextmanager
+    def connection(self, host: str, port: int) -> Iterator[Any]:
+        with self.get(host, port).connection() as conn:
+            yield conn
+
+    def warm(self, nodes: List[dict]) -> None:
+        for n in nodes:
+            try:
+                self.get(n["host"], int(n["port"])).warm()
+            except Exception as e:
+                print(f"[pool] warm-up failed for {n['host']}:{n['port']}: {e}")
+
+    def remove(self, host: str, port: int) -> None:
+        # Node left the topology: idle connections close now, in-use ones when released
+        with self._lock:
+            pool = self._pools.pop((host, int(port)), None)
+        if pool is not None:
+            pool.close()
+
+    def start_reaper(self, interval: float = 30.0) -> None:
+        def loop():
+            while not self._stop.wait(interval):
+                for pool in list(self._pools.values()):
+                    pool.prune()
+
+        self._stop.clear()
+        self._reaper = threading.Thread(target=loop, name="pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        for pool in list(self._pools.values()):
+            pool.close()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [p.stats() for p in list(self._pools.values())]
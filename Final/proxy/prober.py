@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Background latency prober for the `custom` strategy.
+
+Samples every node on a fixed interval (all nodes concurrently), keeps an
+EWMA plus a short window of raw samples per node, marks a node down after
+N consecutive failures, and precomputes the current best node after each
+round so the request path only reads one attribute.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+
+def percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(pct / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+class NodeLatency:
+    def __init__(self, node: dict, window: int):
+        self.node = node
+        self.ewma_ms: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.up = True
+        self.last_error = ""
+        self.last_sample_at = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        vals = sorted(self.samples)
+        return {
+            "host": self.node["host"],
+            "port": int(self.node["port"]),
+            "up": self.up,
+            "ewma_ms": round(self.ewma_ms, 3) if self.ewma_ms is not None else None,
+            "p50_ms": round(percentile(vals, 50), 3),
+            "p95_ms": round(percentile(vals, 95), 3),
+            "samples": len(vals),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_sample_age_s": round(time.time() - self.last_sample_at, 3) if self.last_sample_at else None,
+        }
+
+
+class LatencyProber:
+    def __init__(
+        self,
+        probe: Callable[[str, int], Awaitable[float]],
+        interval: float = 1.0,
+        alpha: float = 0.3,
+        window: int = 60,
+        fail_threshold: int = 3,
+        timeout: float = 2.0,
+    ):
+        self._probe = probe
+        self.interval = interval
+        self.alpha = alpha
+        self.window = window
+        self.fail_threshold = fail_threshold
+        self.timeout = timeout
+        self._nodes: Dict[Tuple[str, int], NodeLatency] = {}
+        self._best: Optional[Tuple[dict, float]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def set_nodes(self, nodes: List[dict]) -> None:
+        current = {}
+        for n in nodes:
+            key = (n["host"], int(n["port"]))
+            current[key] = self._nodes.get(key) or NodeLatency(n, self.window)
+        self._nodes = current
+        self._recompute_best()
+
+    def _record(self, stat: NodeLatency, ms: Optional[float], error: str = "") -> None:
+        stat.last_sample_at = time.time()
+        if ms is None:
+            stat.consecutive_failures += 1
+            stat.last_error = error
+            if stat.consecutive_failures >= self.fail_threshold:
+                stat.up = False
+            return
+        stat.consecutive_failures = 0
+        stat.up = True
+        stat.last_error = ""
+        stat.samples.append(ms)
+        stat.ewma_ms = ms if stat.ewma_ms is None else self.alpha * ms + (1 - self.alpha) * stat.ewma_ms
+
+    def _recompute_best(self) -> None:
+        best = None
+        for stat in self._nodes.values():
+            if stat.up and stat.ewma_ms is not None and (best is None or stat.ewma_ms < best[1]):
+                best = (stat.node, stat.ewma_ms)
+        self._best = best
+
+    async def _probe_one(self, stat: NodeLatency) -> None:
+        try:
+            ms = await asyncio.wait_for(self._probe(stat.node["host"], int(stat.node["port"])), self.timeout)
+            self._record(stat, ms)
+        except Exception as e:
+            self._record(stat, None, str(e) or type(e).__name__)
+
+    async def sample_once(self) -> None:
+        await asyncio.gather(*(self._probe_one(s) for s in list(self._nodes.values())))
+        self._recompute_best()
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await self.sample_once()
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def export_state(self) -> List[Dict[str, Any]]:
+        # Everything a process that does not probe needs to route like the one that does
+        return [
+            {
+                "host": s.node["host"],
+                "port": int(s.node["port"]),
+                "ewma_ms": s.ewma_ms,
+                "samples": list(s.samples),
+                "up": s.up,
+                "consecutive_failures": s.consecutive_failures,
+                "last_error": s.last_error,
+                "last_sample_at": s.last_sample_at,
+            }
+            for s in list(self._nodes.values())
+        ]
+
+    def load_state(self, state: List[Dict[str, Any]]) -> None:
+        for item in state:
+            stat = self._nodes.get((item["host"], int(item["port"])))
+            if stat is None:
+                continue
+            stat.ewma_ms = item["ewma_ms"]
+            stat.samples = deque(item["samples"], maxlen=self.window)
+            stat.up = item["up"]
+            stat.consecutive_failures = item["consecutive_failures"]
+            stat.last_error = item["last_error"]
+            stat.last_sample_at = item["last_sample_at"]
+        self._recompute_best()
+
+    def best(self, allowed: Optional[Callable[[dict], bool]] = None) -> Optional[Tuple[dict, float]]:
+        # O(1): precomputed at the end of each probing round
+        best = self._best
+        if best is None or allowed is None or allowed(best[0]):
+            return best
+        # Best node excluded (open circuit, already tried): next lowest EWMA
+        others = [(s.node, s.ewma_ms) for s in self._nodes.values() if s.up and s.ewma_ms is not None and allowed(s.node)]
+        return min(others, key=lambda x: x[1]) if others else None
+
+    def is_up(self, node: dict) -> bool:
+        stat = self._nodes.get((node["host"], int(node["port"])))
+        return stat.up if stat is not None else True
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [s.snapshot() for s in list(self._nodes.values())]
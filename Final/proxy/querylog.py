@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+In-memory query log for the Proxy (no MySQL slow log needed).
+
+- recent: ring buffer of the last `size` requests (SQL, fingerprint, endpoint,
+  strategy, operation, target node, status, rows, duration and per-stage timings)
+- slow: a second ring of the requests that took at least slow_ms, so a burst of
+  fast queries does not push them out
+- per fingerprint: count, errors, total/mean/max time, p99 over the last
+  `samples` durations, mean time per stage, rows, and the last SQL seen (with its
+  params) so the statement can be EXPLAINed on demand. At most `fingerprints`
+  are kept, the least recently seen is dropped first.
+
+fingerprint() is the normalized statement: literals and %s placeholders become ?,
+lists of them (?+), repeated VALUES tuples "(?+), ...", identifiers unquoted and
+lowercased. fingerprint_id() is a short stable hash of it, used in the API.
+
+With several worker processes each one logs the requests it served; top() also
+merges the per-fingerprint aggregates the other processes publish (load_peer()).
+"""
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from sqlscan import SCAN_CACHE_MAX_LEN, spans
+
+# Kept per entry (the full text of a fingerprint's last statement is kept up to SAMPLE_MAX_LEN)
+ENTRY_SQL_LEN = 512
+SAMPLE_MAX_LEN = 65536
+
+_LIST_RE = re.compile(r"\(\?(?:, \?)+\)")
+_TUPLES_RE = re.compile(r"(\(\?\+?\))(?:, \(\?\+?\))+")
+
+
+def _fingerprint(sql: str) -> str:
+    out: List[str] = []
+    for kind, value, _, _ in spans(sql):
+        if kind in ("str", "num"):
+            tok = "?"
+        elif kind == "word" and value == "s" and out and out[-1] == "%":
+            out[-1] = "?"
+            continue
+        else:
+            tok = value
+        if out and (tok in (",", ")", ".") or out[-1].endswith(("(", "."))):
+            out[-1] += tok
+        else:
+            out.append(tok)
+    while out and out[-1] == ";":
+        out.pop()
+    text = " ".join(out).replace(" ,", ",")
+    text = _LIST_RE.sub("(?+)", text)
+    return _TUPLES_RE.sub(r"\1, ...", text)
+
+
+_fingerprint_cached = lru_cache(maxsize=4096)(_fingerprint)
+
+
+def fingerprint(sql: str) -> str:
+    return _fingerprint_cached(sql) if len(sql) <= SCAN_CACHE_MAX_LEN else _fingerprint(sql)
+
+
+def fingerprint_id(fp: str) -> str:
+    return hashlib.blake2b(fp.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Aggregate:
+    __slots__ = ("fingerprint", "id", "count", "errors", "total", "max", "rows", "stages", "durations", "sample", "params", "target")
+
+    def __init__(self, fp: str, samples: int):
+        self.fingerprint = fp
+        self.id = fingerprint_id(fp)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.stages: Dict[str, float] = {}
+        self.durations: Deque[float] = deque(maxlen=samples)
+        self.sample = ""
+        self.params: Optional[List[Any]] = None
+        self.target = ""
+
+    def export(self) -> Dict[str, Any]:
+        n = max(1, self.count)
+        return {
+            "id": self.id,
+            "fingerprint": self.fingerprint,
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000.0, 3),
+            "mean_ms": round(self.total * 1000.0 / n, 3),
+            "p99_ms": round(_percentile(self.durations, 0.99) * 1000.0, 3),
+            "max_ms": round(self.max * 1000.0, 3),
+            "rows": self.rows,
+            "stages_mean_ms": {k: round(v * 1000.0 / n, 3) for k, v in self.stages.items()},
+            "last_target": self.target,
+        }
+
+
+class QueryLog:
+    PEER_TTL_S = 10.0
+
+    def __init__(self, size: int = 1000, slow_ms: float = 100.0, fingerprints: int = 1000, samples: int = 256):
+        self.slow_ms = slow_ms
+        self.max_fingerprints = fingerprints
+        self.samples = samples
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._aggs: "OrderedDict[str, _Aggregate]" = OrderedDict()
+        self._by_id: Dict[str, _Aggregate] = {}
+        self._peers: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+        self.recorded = 0
+
+    def record(
+        self,
+        endpoint: str,
+        statements: Sequence[str],
+        strategy: str,
+        operation: str,
+        target: str,
+        status: int,
+        seconds: float,
+        rows: Optional[int] = None,
+        stages: Sequence[Tuple[str, float]] = (),
+        params: Optional[List[Any]] = None,
+    ) -> None:
+        if len(statements) == 1:
+            sql = statements[0]
+            fp = fingerprint(sql)
+        else:
+            # /batch: one entry, distinct statement shapes in order
+            sql = "; ".join(statements)
+            fp = "batch: " + "; ".join(OrderedDict.fromkeys(fingerprint(s) for s in statements))
+        stage_ms: Dict[str, float] = {}
+        for name, s in stages:
+            stage_ms[name] = stage_ms.get(name, 0.0) + s
+        entry = {
+            "ts": time.time(),
+            "endpoint": endpoint,
+            "strategy": strategy,
+            "operation": operation,
+            "target": target,
+            "status": status,
+            "duration_ms": round(seconds * 1000.0, 3),
+            "rows": rows,
+            "stages_ms": {k: round(v * 1000.0, 3) for k, v in stage_ms.items()},
+            "fingerprint": fp,
+            "sql": sql if len(sql) <= ENTRY_SQL_LEN else sql[:ENTRY_SQL_LEN] + "…",
+        }
+        self.recorded += 1
+        self.recent.append(entry)
+        if seconds * 1000.0 >= self.slow_ms:
+            self.slow.append(entry)
+
+        agg = self._aggs.get(fp)
+        if agg is None:
+            agg = _Aggregate(fp, self.samples)
+            self._aggs[fp] = agg
+            self._by_id[agg.id] = agg
+            while len(self._aggs) > self.max_fingerprints:
+                _, old = self._aggs.popitem(last=False)
+                self._by_id.pop(old.id, None)
+        else:
+            self._aggs.move_to_end(fp)
+        agg.count += 1
+        agg.errors += status >= 400
+        agg.total += seconds
+        agg.max = max(agg.max, seconds)
+        agg.rows += rows or 0
+        agg.durations.append(seconds)
+        for name, s in stage_ms.items():
+            agg.stages[name] = agg.stages.get(name, 0.0) + s
+        agg.target = target
+        if len(statements) == 1 and len(sql) <= SAMPLE_MAX_LEN:
+            agg.sample, agg.params = sql, params
+
+    def entries(self, limit: int = 100, slow: bool = False) -> List[Dict[str, Any]]:
+        ring = self.slow if slow else self.recent
+        return list(ring)[-limit:][::-1] if limit > 0 else []
+
+    def sample(self, fid: str) -> Optional[Tuple[str, Optional[List[Any]], str]]:
+        """(sql, params, last target) of the last statement seen for a fingerprint id."""
+        agg = self._by_id.get(fid)
+        if agg is None or not agg.sample:
+            return None
+        return agg.sample, agg.params, agg.target
+
+    # --- aggregates (merged across processes) ---
+
+    def export(self, n: int = 50) -> List[Dict[str, Any]]:
+        return self._top([a.export() for a in self._aggs.values()], n, "total")
+
+    def load_peer(self, pid: int, data: List[Dict[str, Any]]) -> None:
+        self._peers[pid] = (time.monotonic(), data)
+
+    def top(self, n: int = 20, by: str = "total") -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        for pid in [p for p, (at, _) in self._peers.items() if now - at > self.PEER_TTL_S]:
+            del self._peers[pid]
+        merged: Dict[str, Dict[str, Any]] = {}
+        for rows in [[a.export() for a in self._aggs.values()]] + [data for _, data in list(self._peers.values())]:
+            for r in rows:
+                m = merged.get(r["id"])
+                merged[r["id"]] = dict(r) if m is None else _combine(m, r)
+        return self._top(list(merged.values()), n, by)
+
+    @staticmethod
+    def _top(rows: List[Dict[str, Any]], n: int, by: str) -> List[Dict[str, Any]]:
+        field = by if by == "count" else f"{by}_ms"
+        return sorted(rows, key=lambda r: r.get(field, 0), reverse=True)[:n]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded,
+            "recent": len(self.recent),
+            "slow": len(self.slow),
+            "slow_ms": self.slow_ms,
+            "fingerprints": len(self._aggs),
+            "pid": os.getpid(),
+            "peers": len(self._peers),
+        }
+
+
+def _combine(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    # Two processes' aggregates of one fingerprint; p99 is approximated by the worse of the two
+    count = a["count"] + b["count"]
+    n = max(1, count)
+    out = dict(a)
+    out.update({
+        "count": count,
+        "errors": a["errors"] + b["errors"],
+        "total_ms": round(a["total_ms"] + b["total_ms"], 3),
+        "mean_ms": round((a["total_ms"] + b["total_ms"]) / n, 3),
+        "p99_ms": max(a["p99_ms"], b["p99_ms"]),
+        "max_ms": max(a["max_ms"], b["max_ms"]),
+        "rows": a["rows"] + b["rows"],
+        "stages_mean_ms": {
+            k: round((a["stages_mean_ms"].get(k, 0.0) * a["count"] + b["stages_mean_ms"].get(k, 0.0) * b["count"]) / n, 3)
+            for k in set(a["stages_mean_ms"]) | set(b["stages_mean_ms"])
+        },
+    })
+    return out
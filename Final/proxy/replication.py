@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Replication-lag monitor for the `lag-aware` strategy.
+
+Polls every worker's SHOW REPLICA STATUS (Seconds_Behind_Source, thread state,
+Executed_Gtid_Set) and the manager's @@GLOBAL.gtid_executed on a fixed
+interval, so routing can skip lagging replicas and, for read-your-writes,
+pick a replica whose executed GTID set already contains a session's last write.
+"""
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Intervals = List[Tuple[int, int]]
+GtidSet = Dict[str, Intervals]
+
+_NUM_RE = re.compile(r"^\d+(?:-\d+)?$")
+
+
+# --- GTID set arithmetic ---
+
+def parse_gtid_set(text: str) -> GtidSet:
+    """'uuid:1-5:7,uuid2[:tag]:1-3' -> {'uuid': [(1, 5), (7, 7)], 'uuid2[:tag]': [(1, 3)]}"""
+    out: GtidSet = {}
+    for part in (text or "").replace("\n", "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        key = None
+        for seg in part.split(":"):
+            seg = seg.strip()
+            if key is None:
+                key = seg.lower()
+            elif _NUM_RE.match(seg):
+                lo, _, hi = seg.partition("-")
+                out.setdefault(key, []).append((int(lo), int(hi or lo)))
+            else:
+                # MySQL 8.4 tagged GTIDs: uuid:tag:1-5
+                key = f"{part.split(':', 1)[0].strip().lower()}:{seg.lower()}"
+    for key in out:
+        out[key].sort()
+    return out
+
+
+def gtid_contains(superset: GtidSet, subset: GtidSet) -> bool:
+    for key, intervals in subset.items():
+        have = superset.get(key, [])
+        for lo, hi in intervals:
+            if not any(a <= lo and hi <= b for a, b in have):
+                return False
+    return True
+
+
+def gtid_missing(superset: GtidSet, subset: GtidSet) -> int:
+    """Number of transactions in superset that subset has not executed."""
+    missing = 0
+    for key, intervals in superset.items():
+        have = subset.get(key, [])
+        for lo, hi in intervals:
+            total = hi - lo + 1
+            for a, b in have:
+                overlap = min(hi, b) - max(lo, a) + 1
+                if overlap > 0:
+                    total -= overlap
+            missing += max(0, total)
+    return missing
+
+
+# --- monitor ---
+
+class ReplicaState:
+    def __init__(self, node: dict):
+        self.node = node
+        self.seconds_behind: Optional[float] = None
+        self.io_running = False
+        self.sql_running = False
+        self.executed: GtidSet = {}
+        self.trx_behind: Optional[int] = None
+        self.last_error = ""
+        self.checked_at = 0.0
+
+    def healthy(self, max_lag_s: float) -> bool:
+        return (
+            self.checked_at > 0
+            and not self.last_error
+            and self.io_running
+            and self.sql_running
+            and self.seconds_behind is not None
+            and self.seconds_behind <= max_lag_s
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "host": self.node["host"],
+            "port": int(self.node["port"]),
+            "seconds_behind": self.seconds_behind,
+            "trx_behind": self.trx_behind,
+            "io_running": self.io_running,
+            "sql_running": self.sql_running,
+            "last_error": self.last_error,
+            "checked_age_s": round(time.time() - self.checked_at, 3) if self.checked_at else None,
+        }
+
+
+def _row_dict(cols: List[str], rows: List[Tuple[Any, ...]]) -> Dict[str, Any]:
+    return dict(zip(cols, rows[0])) if rows else {}
+
+
+class ReplicationMonitor:
+    def __init__(
+        self,
+        read: Callable[[str, str, int], Awaitable[Tuple[List[str], List[Tuple[Any, ...]]]]],
+        interval: float = 1.0,
+        max_lag_s: float = 5.0,
+        timeout: float = 2.0,
+    ):
+        self._read = read
+        self.interval = interval
+        self.max_lag_s = max_lag_s
+        self.timeout = timeout
+        self.manager: Optional[dict] = None
+        self.manager_executed: GtidSet = {}
+        self._replicas: Dict[Tuple[str, int], ReplicaState] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def set_nodes(self, manager: dict, workers: List[dict]) -> None:
+        self.manager = manager
+        current = {}
+        for w in workers:
+            key = (w["host"], int(w["port"]))
+            current[key] = self._replicas.get(key) or ReplicaState(w)
+        self._replicas = current
+
+    async def _status(self, host: str, port: int) -> Dict[str, Any]:
+        try:
+            cols, rows = await self._read("SHOW REPLICA STATUS", host, port)
+        except Exception:
+            # MySQL < 8.0.22 only knows the SLAVE syntax
+            cols, rows = await self._read("SHOW SLAVE STATUS", host, port)
+        return _row_dict(cols, rows)
+
+    async def _poll_replica(self, st: ReplicaState) -> None:
+        try:
+            row = await asyncio.wait_for(self._status(st.node["host"], int(st.node["port"])), self.timeout)
+            if not row:
+                raise RuntimeError("replication not configured")
+            lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+            st.seconds_behind = float(lag) if lag is not None else None
+            st.io_running = str(row.get("Replica_IO_Running", row.get("Slave_IO_Running"))) == "Yes"
+            st.sql_running = str(row.get("Replica_SQL_Running", row.get("Slave_SQL_Running"))) == "Yes"
+            st.executed = parse_gtid_set(row.get("Executed_Gtid_Set") or "")
+            st.trx_behind = gtid_missing(self.manager_executed, st.executed) if self.manager_executed else None
+            st.last_error = ""
+        except Exception as e:
+            st.last_error = str(e) or type(e).__name__
+        st.checked_at = time.time()
+
+    async def _poll_manager(self) -> None:
+        if self.manager is None:
+            return
+        try:
+            _, rows = await asyncio.wait_for(
+                self._read("SELECT @@GLOBAL.gtid_executed", self.manager["host"], int(self.manager["port"])),
+                self.timeout,
+            )
+            self.manager_executed = parse_gtid_set(rows[0][0] if rows else "")
+        except Exception:
+            pass
+
+    async def poll_once(self) -> None:
+        await self._poll_manager()
+        await asyncio.gather(*(self._poll_replica(st) for st in list(self._replicas.values())))
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await self.poll_once()
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def export_state(self) -> Dict[str, Any]:
+        return {
+            "manager_executed": self.manager_executed,
+            "replicas": [
+                {
+                    "host": st.node["host"],
+                    "port": int(st.node["port"]),
+                    "seconds_behind": st.seconds_behind,
+                    "io_running": st.io_running,
+                    "sql_running": st.sql_running,
+                    "executed": st.executed,
+                    "trx_behind": st.trx_behind,
+                    "last_error": st.last_error,
+                    "checked_at": st.checked_at,
+                }
+                for st in list(self._replicas.values())
+            ],
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        def gtid_set(d: Dict[str, Any]) -> GtidSet:
+            return {k: [(int(lo), int(hi)) for lo, hi in v] for k, v in d.items()}
+
+        self.manager_executed = gtid_set(state["manager_executed"])
+        for item in state["replicas"]:
+            st = self._replicas.get((item["host"], int(item["port"])))
+            if st is None:
+                continue
+            st.seconds_behind = item["seconds_behind"]
+            st.io_running = item["io_running"]
+            st.sql_running = item["sql_running"]
+            st.executed = gtid_set(item["executed"])
+            st.trx_behind = item["trx_behind"]
+            st.last_error = item["last_error"]
+            st.checked_at = item["checked_at"]
+
+    def eligible(self, min_gtid: Optional[str] = None) -> List[Tuple[dict, ReplicaState]]:
+        """Workers within the lag threshold (and, if given, that have applied min_gtid)."""
+        needed = parse_gtid_set(min_gtid) if min_gtid else None
+        out = []
+        for st in list(self._replicas.values()):
+            if not st.healthy(self.max_lag_s):
+                continue
+            if needed and not gtid_contains(st.executed, needed):
+                continue
+            out.append((st.node, st))
+        return out
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [st.snapshot() for st in list(self._replicas.values())]
+
+
+class SessionGtids:
+    """Last write GTID set per client session (bounded LRU with TTL)."""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 300.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def set(self, session: str, gtid: str) -> None:
+        self._items[session] = (gtid, time.monotonic() + self.ttl)
+        self._items.move_to_end(session)
+        while len(self._items) > self.max_sessions:
+            self._items.popitem(last=False)
+
+    def get(self, session: str) -> Optional[str]:
+        item = self._items.get(session)
+        if item is None:
+            return None
+        if item[1] < time.monotonic():
+            del self._items[session]
+            return None
+        return item[0]
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Scatter-gather planning for the Proxy's scatter strategy.
+
+plan(sql) decides whether a READ can be split by key range across workers and
+returns a ScatterPlan, or None (the statement then runs on one node as usual).
+Eligible: one SELECT on one table, without JOIN, UNION, subquery, DISTINCT,
+HAVING, window function or locking clause, whose select list is either
+- plain expressions (the parts' rows are concatenated), or
+- COUNT/SUM/MIN/MAX aggregates plus the GROUP BY expressions (the parts return
+  partial aggregates, combined per group).
+ORDER BY must name select-list items (alias, expression or position), or plain
+columns of a SELECT *; LIMIT takes literal numbers.
+
+ScatterPlan.parts(key, lo, hi, n) rewrites the statement into n statements, one
+per key range. The first and last ranges are open-ended, so rows outside [lo, hi]
+(inserted since the bounds were read) are still returned exactly once; the key
+must be a NOT NULL integer column (the primary key). ScatterPlan.merge() combines
+the parts' rows and applies ORDER BY / LIMIT at the proxy.
+
+The same plan gives keyset pagination (ScatterPlan.keyset()): one page of rows
+after a key value, ordered by the key, for statements that are not grouped, have
+no LIMIT and are ordered by nothing or by the key alone.
+"""
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlscan import spans
+
+MERGEABLE = frozenset({"count", "sum", "min", "max"})
+AGGREGATES = MERGEABLE | frozenset({
+    "avg", "group_concat", "std", "stddev", "stddev_pop", "stddev_samp", "variance", "var_pop", "var_samp",
+    "bit_and", "bit_or", "bit_xor", "json_arrayagg", "json_objectagg", "any_value",
+})
+# Anywhere in the statement: the result cannot be rebuilt from key-range parts
+_REJECT = frozenset({
+    "join", "straight_join", "union", "intersect", "except", "into", "for", "lock", "window", "over", "having",
+    "rollup", "procedure", "distinct", "distinctrow", "sql_calc_found_rows",
+})
+# Allowed between SELECT and the first item
+_SELECT_OPTIONS = frozenset({"all", "high_priority", "sql_small_result", "sql_big_result", "sql_buffer_result", "sql_no_cache"})
+_CLAUSES = ("from", "where", "group", "order", "limit")
+
+Token = Tuple[str, str, int, int]
+
+
+class _NotSplittable(Exception):
+    pass
+
+
+class ScatterUnsupported(ValueError):
+    """The parts' result does not fit the plan (merge() cannot combine it): run the statement on one node."""
+
+
+class OrderKey(NamedTuple):
+    index: int  # result column, or -1: looked up by name (SELECT *)
+    name: str
+    descending: bool
+
+
+class ScatterPlan(NamedTuple):
+    table: str
+    source: str  # FROM … (table and alias)
+    head: str  # SELECT … FROM …
+    where: str  # WHERE condition, "" if none
+    equals: FrozenSet[str]  # columns the WHERE compares with = or IN (point lookups are not worth splitting)
+    group: str  # "GROUP BY …" or ""
+    tail: str  # ORDER BY / LIMIT sent to every part ("" when applied only after merging)
+    items: Tuple[str, ...]  # normalized select-list expressions ("*" for a star)
+    merges: Tuple[str, ...]  # per select item: count/sum/min/max, or "" (plain / group key)
+    grouped: bool
+    order: Tuple[OrderKey, ...]
+    limit: Optional[int]
+    offset: int
+
+    def bounds_sql(self, key: str) -> str:
+        col = _quote(key)
+        return f"SELECT MIN({col}), MAX({col}) {self.source}"
+
+    def parts(self, key: str, lo: int, hi: int, n: int) -> List[str]:
+        col = _quote(key)
+        step = (hi - lo + 1) / n
+        cuts = [lo + round(i * step) for i in range(1, n)]
+        out = []
+        for i in range(n):
+            cond = []
+            if i > 0:
+                cond.append(f"{col} >= {cuts[i - 1]}")
+            if i < n - 1:
+                cond.append(f"{col} < {cuts[i]}")
+            where = " AND ".join(([f"({self.where})"] if self.where else []) + cond)
+            sql = self.head
+            for clause in (f"WHERE {where}" if where else "", self.group, self.tail):
+                if clause:
+                    sql += " " + clause
+            out.append(sql)
+        return out
+
+    def key_order(self, key: str) -> Optional[bool]:
+        """Keyset-pageable by key: False (ascending, or no ORDER BY) / True (descending); None if not."""
+        if self.grouped or self.limit is not None or len(self.order) > 1:
+            return None
+        if not self.order:
+            return False
+        k = self.order[0]
+        if k.index < 0:
+            named = k.name
+        elif "*" not in self.items and k.index < len(self.items):
+            words = self.items[k.index].split(" ")
+            named = words[-1] if len(words) == 1 or (len(words) == 3 and words[1] == ".") else ""
+        else:
+            return None
+        return k.descending if _fold(named) == _fold(key) else None
+
+    def keyset(self, key: str, after: Optional[int], descending: bool, limit: int) -> str:
+        """One page: rows after key value `after` in key order, plus the key as a trailing _page_key column."""
+        col = _quote(key)
+        select = self.head[:len(self.head) - len(self.source)].rstrip()
+        cond = [f"({self.where})"] if self.where else []
+        if after is not None:
+            cond.append(f"{col} {'<' if descending else '>'} {int(after)}")
+        sql = f"{select}, {col} AS `_page_key` {self.source}"
+        if cond:
+            sql += " WHERE " + " AND ".join(cond)
+        return sql + f" ORDER BY {col} {'DESC' if descending else 'ASC'} LIMIT {int(limit)}"
+
+    def merge(self, results: Sequence[Sequence[Sequence[Any]]], columns: Sequence[str]) -> List[Sequence[Any]]:
+        """Rows of all parts -> rows of the original statement."""
+        if self.grouped:
+            keys = [i for i, m in enumerate(self.merges) if not m]
+            groups: Dict[tuple, list] = {}
+            for rows in results:
+                for row in rows:
+                    k = tuple(_fold(row[i]) for i in keys)
+                    acc = groups.get(k)
+                    if acc is None:
+                        groups[k] = list(row)
+                        continue
+                    for i, m in enumerate(self.merges):
+                        if m:
+                            acc[i] = _combine(m, acc[i], row[i])
+            merged: List[Sequence[Any]] = list(groups.values())
+        else:
+            merged = [row for rows in results for row in rows]
+        # One stable sort per key, last key first; DESC keeps NULLs last like MySQL
+        for key in reversed(self.order):
+            idx = key.index if key.index >= 0 else _column_index(columns, key.name)
+            merged.sort(key=lambda r: _sort_key(r[idx]), reverse=key.descending)
+        stop = None if self.limit is None else self.offset + self.limit
+        return merged[self.offset:stop]
+
+
+def _quote(name: str) -> str:
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _fold(v: Any) -> Any:
+    # Default collations compare strings case-insensitively
+    return v.casefold() if isinstance(v, str) else v
+
+
+def _sort_key(v: Any) -> tuple:
+    return (0,) if v is None else (1, _fold(v))
+
+
+def _combine(merge: str, a: Any, b: Any) -> Any:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if merge in ("count", "sum"):
+        return a + b
+    return min(a, b) if merge == "min" else max(a, b)
+
+
+def _column_index(columns: Sequence[str], name: str) -> int:
+    # Column names are case-insensitive in MySQL; a backticked reference keeps its case
+    for i, c in enumerate(columns):
+        if _fold(c) == _fold(name):
+            return i
+    raise ScatterUnsupported(f"ORDER BY column {name!r} is not in the result")
+
+
+def _split(toks: Sequence[Token]) -> List[List[Token]]:
+    # Comma-separated list at paren depth 0
+    out: List[List[Token]] = [[]]
+    depth = 0
+    for t in toks:
+        if t[0] == "punct" and t[1] == "(":
+            depth += 1
+        elif t[0] == "punct" and t[1] == ")":
+            depth -= 1
+        elif depth == 0 and t[:2] == ("punct", ","):
+            out.append([])
+            continue
+        out[-1].append(t)
+    if any(not part for part in out):
+        raise _NotSplittable()
+    return out
+
+
+def _norm(toks: Sequence[Token]) -> str:
+    return " ".join(t[1] for t in toks)
+
+
+def _item(toks: List[Token]) -> Tuple[str, str, str, bool]:
+    """Select item -> (normalized expression, alias, merge, is_star)."""
+    if toks[-1][:2] == ("punct", "*") and (len(toks) == 1 or toks[-2][:2] == ("punct", ".")):
+        return "*", "", "", True
+    alias = ""
+    if len(toks) >= 3 and toks[-2][:2] == ("word", "as"):
+        alias, toks = toks[-1][1], toks[:-2]
+    elif len(toks) >= 2 and toks[-1][0] in ("word", "ident") and (toks[-2][0] in ("word", "ident") or toks[-2][1] == ")"):
+        alias, toks = toks[-1][1], toks[:-1]
+    merge = ""
+    is_call = len(toks) >= 3 and toks[0][0] == "word" and toks[1][:2] == ("punct", "(") and toks[-1][:2] == ("punct", ")")
+    if is_call and toks[0][1] in MERGEABLE and _closes_at_end(toks):
+        merge = toks[0][1]
+        toks_inner = toks[2:-1]
+    else:
+        toks_inner = toks
+    for i, t in enumerate(toks_inner[:-1]):
+        if t[0] == "word" and t[1] in AGGREGATES and toks_inner[i + 1][:2] == ("punct", "("):
+            raise _NotSplittable()  # nested or unsupported aggregate (AVG(x), SUM(a)/COUNT(*))
+    return _norm(toks), alias, merge, False
+
+
+def _closes_at_end(toks: Sequence[Token]) -> bool:
+    # The paren opened at toks[1] is the one closed by the last token
+    depth = 0
+    for i, t in enumerate(toks[1:], 1):
+        if t[0] == "punct" and t[1] == "(":
+            depth += 1
+        elif t[0] == "punct" and t[1] == ")":
+            depth -= 1
+            if depth == 0:
+                return i == len(toks) - 1
+    return False
+
+
+def _resolve(ref: List[Token], items: List[Tuple[str, str, str, bool]]) -> Tuple[int, str]:
+    # GROUP BY / ORDER BY reference -> (select item index, or -1, column name)
+    star = any(it[3] for it in items)
+    if len(ref) == 1 and ref[0][0] == "num" and ref[0][1].isdigit():
+        pos = int(ref[0][1]) - 1
+        if pos < 0 or (not star and pos >= len(items)):
+            raise _NotSplittable()
+        return pos, ""
+    if not star:
+        norm = _norm(ref)
+        for i, (expr, alias, _, _) in enumerate(items):
+            if norm == alias or norm == expr:
+                return i, ""
+        raise _NotSplittable()
+    # SELECT *: a plain (optionally qualified) column, found by name in the result
+    if ref[-1][0] in ("word", "ident") and (len(ref) == 1 or (len(ref) == 3 and ref[1][:2] == ("punct", "."))):
+        return -1, ref[-1][1]
+    raise _NotSplittable()
+
+
+@lru_cache(maxsize=1024)
+def plan(sql: str) -> Optional[ScatterPlan]:
+    try:
+        return _plan(sql)
+    except _NotSplittable:
+        return None
+
+
+def _plan(sql: str) -> ScatterPlan:
+    toks = spans(sql)
+    while toks and toks[-1][:2] == ("punct", ";"):
+        toks.pop()
+    if not toks or toks[0][:2] != ("word", "select"):
+        raise _NotSplittable()
+
+    # Top-level clause positions; nested parens are only checked for subqueries
+    at: Dict[str, int] = {}
+    depth = 0
+    for i, (kind, value, _, _) in enumerate(toks):
+        nxt = toks[i + 1][1] if i + 1 < len(toks) else ""
+        if kind == "punct":
+            if value == "(":
+                depth += 1
+                if nxt in ("select", "with"):
+                    raise _NotSplittable()
+            elif value == ")":
+                depth -= 1
+            elif value == ";":
+                raise _NotSplittable()
+        elif kind == "word":
+            if value in _REJECT:
+                raise _NotSplittable()
+            if depth == 0 and value in _CLAUSES and (value not in ("group", "order") or nxt == "by"):
+                if value in at:
+                    raise _NotSplittable()
+                at[value] = i
+    if "from" not in at or list(at) != [c for c in _CLAUSES if c in at]:
+        raise _NotSplittable()
+    bounds = sorted(at.values()) + [len(toks)]
+
+    def clause(name: str, skip: int) -> List[Token]:
+        if name not in at:
+            return []
+        start = at[name]
+        body = toks[start + skip:bounds[bounds.index(start) + 1]]
+        if not body:
+            raise _NotSplittable()
+        return body
+
+    def text(name: str) -> str:
+        if name not in at:
+            return ""
+        start = at[name]
+        end = bounds[bounds.index(start) + 1]
+        return sql[toks[start][2]:toks[end - 1][3]]
+
+    select = toks[1:at["from"]]
+    while select and select[0][0] == "word" and select[0][1] in _SELECT_OPTIONS:
+        select = select[1:]
+    if not select:
+        raise _NotSplittable()
+    items = [_item(it) for it in _split(select)]
+    star = any(it[3] for it in items)
+
+    source = clause("from", 1)
+    if any(t[:2] == ("punct", ",") for t in source) or source[0][0] not in ("word", "ident"):
+        raise _NotSplittable()
+    dotted = len(source) >= 3 and source[1][:2] == ("punct", ".")
+    table = source[2][1] if dotted else source[0][1]
+
+    merges = tuple(it[2] for it in items)
+    group_refs = [_resolve(ref, items) for ref in _split(clause("group", 2))] if "group" in at else []
+    grouped = "group" in at or any(merges)
+    if grouped:
+        keys = {i for i, _ in group_refs}
+        plain = {i for i, m in enumerate(merges) if not m}
+        # Every group expression is a plain item (and vice versa), so the plain values identify the group
+        if star or -1 in keys or keys != plain:
+            raise _NotSplittable()
+
+    order = []
+    for ref in _split(clause("order", 2)) if "order" in at else []:
+        descending = False
+        if ref[-1][0] == "word" and ref[-1][1] in ("asc", "desc"):
+            descending = ref[-1][1] == "desc"
+            ref = ref[:-1]
+            if not ref:
+                raise _NotSplittable()
+        index, name = _resolve(ref, items)
+        order.append(OrderKey(index, name, descending))
+
+    limit, offset = None, 0
+    if "limit" in at:
+        lt = clause("limit", 1)
+        nums = [t[1] for t in lt[::2]]
+        seps = [t[1] for t in lt[1::2]]
+        if not all(t[0] == "num" and t[1].isdigit() for t in lt[::2]) or seps not in ([], [","], ["offset"]):
+            raise _NotSplittable()
+        if seps == [","]:
+            offset, limit = int(nums[0]), int(nums[1])
+        else:
+            limit = int(nums[0])
+            offset = int(nums[1]) if seps else 0
+
+    after_from = min([at[c] for c in ("where", "group", "order", "limit") if c in at] or [len(toks)])
+    where_toks = clause("where", 1)
+    # Each part returns its own top offset+limit rows; aggregates are ordered and cut after merging
+    tail = ""
+    if not grouped and limit is not None:
+        tail = (text("order") + " " if order else "") + f"LIMIT {offset + limit}"
+    return ScatterPlan(
+        table=table,
+        source=sql[toks[at["from"]][2]:toks[after_from - 1][3]],
+        head=sql[:toks[after_from - 1][3]],
+        where=sql[where_toks[0][2]:where_toks[-1][3]] if where_toks else "",
+        equals=frozenset(
+            t[1] for t, nxt in zip(where_toks, where_toks[1:]) if t[0] in ("word", "ident") and nxt[1] in ("=", "in")
+        ),
+        group=text("group"),
+        tail=tail,
+        items=tuple(it[0] for it in items),
+        merges=merges,
+        grouped=grouped,
+        order=tuple(order),
+        limit=limit,
+        offset=offset,
+    )
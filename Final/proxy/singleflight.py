@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Single-flight request coalescing for the Proxy.
+
+Concurrent callers of do() with the same key share one execution: the first
+one starts it as a separate task, later ones await that same task and all get
+its result (or its exception). The key is released as soon as the execution
+finishes, so nothing is cached; a caller that arrives afterwards runs again.
+
+The execution runs in its own task, so a caller that goes away (client
+disconnect) does not cancel it for the others.
+
+Per-table write generations (bump() when a write to the tables commits, part
+of the caller's key through generation()) keep a read from joining an
+execution that started before the write: it would return pre-write rows.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Set, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self._generation: Dict[str, int] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def generation(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._generation.get(t, 0) for t in sorted(tables)) + (self._generation.get("*", 0),)
+
+    def bump(self, tables: Set[str]) -> None:
+        # Unknown scope ("*"): every key changes
+        for t in tables or {"*"}:
+            self._generation[t] = self._generation.get(t, 0) + 1
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, shared): shared is True if another caller's execution was joined."""
+        task = self._flights.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._flights), "executions": self.executions, "coalesced": self.coalesced}
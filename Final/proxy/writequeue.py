@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Queued WRITEs with group commit for the Proxy (POST /query?ack=queued).
+
+submit() appends a write to a bounded in-memory FIFO and returns a ticket at
+once; a background committer hands the queue to flush() in groups of up to
+group_size writes, one transaction per group, as soon as a group is full or
+interval seconds after the first write of the group arrived. flush() returns one
+result per write ({"status": "committed"|"failed", ...}); if it raises one of
+retry_types (node down, connection lost) the group goes back to the head of the
+queue and is retried after retry_interval s, any other exception fails every
+write of the group (retrying would fail the same way and block the queue). When the queue holds max_items writes, submit() raises
+QueueFull (back-pressure: the client gets 429 with Retry-After).
+
+Results are kept ticket_ttl seconds for status(ticket). Tickets and journals are
+named after the queue's instance (<pid>.<random>, new at every start), so a
+restarted process that gets an old pid back never reuses either.
+
+Durability (journal_dir set): every accepted write is appended to
+<journal_dir>/journal-<instance>.log before it is acknowledged (fsync=True also
+syncs it to disk), and the tickets of every committed group after it. The file
+is held under an exclusive flock; at start, a process replays the pending
+writes of every journal-*.log no live process holds (a crashed or restarted
+process) and deletes them. A crash between a group's COMMIT and its journal
+record replays that group: delivery is at least once.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple, Type
+
+
+class QueuedWrite(NamedTuple):
+    ticket: str
+    sql: str
+    params: Optional[List[Any]]
+    session: Optional[str]
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("write queue full")
+        self.retry_after = retry_after
+
+
+class WriteQueue:
+    def __init__(
+        self,
+        flush: Callable[[List[QueuedWrite]], Awaitable[List[Dict[str, Any]]]],
+        max_items: int = 10000,
+        group_size: int = 200,
+        interval: float = 0.02,
+        journal_dir: str = "",
+        fsync: bool = False,
+        ticket_ttl: float = 300.0,
+        retry_interval: float = 1.0,
+        retry_types: Tuple[Type[BaseException], ...] = (ConnectionError,),
+    ):
+        self._flush = flush
+        self.max_items = max_items
+        self.group_size = group_size
+        self.interval = interval
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.ticket_ttl = ticket_ttl
+        self.retry_interval = retry_interval
+        self.retry_types = retry_types
+        self._items: Deque[QueuedWrite] = deque()
+        self._results: Dict[str, tuple] = {}
+        # (expiry, ticket) of finished tickets; expiries only grow, so the oldest is first
+        self._expiry: Deque[tuple] = deque()
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._journal = None
+        self._seq = 0
+        self.pid = os.getpid()
+        self.instance = f"{self.pid}.{secrets.token_hex(3)}"
+        self.accepted = 0
+        self.committed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.groups = 0
+        self.retries = 0
+        self.replayed = 0
+        # Called with the results of every flushed group (e.g. to publish them to other processes)
+        self.on_results: Optional[Callable[[List[list]], None]] = None
+
+    # --- journal ---
+
+    def _open_journal(self) -> None:
+        os.makedirs(self.journal_dir, exist_ok=True)
+        path = os.path.join(self.journal_dir, f"journal-{self.instance}.log")
+        self._journal = open(path, "a", encoding="utf-8")
+        fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        for name in sorted(os.listdir(self.journal_dir)):
+            other = os.path.join(self.journal_dir, name)
+            if name.startswith("journal-") and name.endswith(".log") and other != path:
+                self._adopt(other)
+
+    def _adopt(self, path: str) -> None:
+        # Pending writes of a journal no live process holds
+        with open(path, "r+", encoding="utf-8") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # its process is alive
+            pending: "OrderedDict[str, QueuedWrite]" = OrderedDict()
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line of a crash
+                if "done" in rec:
+                    for t in rec["done"]:
+                        pending.pop(t, None)
+                else:
+                    pending[rec["t"]] = QueuedWrite(rec["t"], rec["sql"], rec.get("params"), rec.get("session"))
+            for w in pending.values():
+                self._append(w)
+            self.replayed += len(pending)
+            os.unlink(path)
+        if pending:
+            print(f"[writes] replayed {len(pending)} queued write(s) from {path}")
+
+    def _log(self, rec: Dict[str, Any]) -> None:
+        self._journal.write(json.dumps(rec, separators=(",", ":"), default=str) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    # --- queue ---
+
+    def _append(self, w: QueuedWrite) -> None:
+        if self._journal is not None:
+            self._log({"t": w.ticket, "sql": w.sql, "params": w.params, "session": w.session})
+        self._items.append(w)
+        self._results[w.ticket] = ({"status": "queued"}, None)
+        self._wake.set()
+        if len(self._items) >= self.group_size:
+            self._full.set()
+
+    def submit(self, sql: str, params: Optional[List[Any]] = None, session: Optional[str] = None) -> str:
+        if len(self._items) >= self.max_items:
+            self.rejected += 1
+            raise QueueFull(max(self.interval, self.retry_interval))
+        self._seq += 1
+        ticket = f"{self.instance}-{self._seq}"
+        self._append(QueuedWrite(ticket, sql, params, session))
+        self.accepted += 1
+        return ticket
+
+    def depth(self) -> int:
+        return len(self._items)
+
+    def owns(self, ticket: str) -> bool:
+        return ticket.rpartition("-")[0] == self.instance
+
+    def status(self, ticket: str) -> Optional[Dict[str, Any]]:
+        self._purge(time.monotonic())
+        item = self._results.get(ticket)
+        return dict(item[0], ticket=ticket) if item is not None else None
+
+    def load_results(self, results: List[list]) -> None:
+        # Results of another process's tickets (PROCESSES > 1)
+        self._store(results)
+
+    def _store(self, results: List[list]) -> None:
+        now = time.monotonic()
+        expires = now + self.ticket_ttl
+        for ticket, result in results:
+            self._results[ticket] = (result, expires)
+            self._expiry.append((expires, ticket))
+        self._purge(now)
+
+    def _purge(self, now: float) -> None:
+        # Only finished tickets expire; queued ones (no expiry) stay until their group is done
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, ticket = self._expiry.popleft()
+            item = self._results.get(ticket)
+            if item is not None and item[1] == expires:
+                del self._results[ticket]
+
+    # --- committer ---
+
+    def start(self) -> None:
+        if self.journal_dir:
+            self._open_journal()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        # Give the committer a chance to empty the queue; what is left stays in the journal
+        deadline = time.monotonic() + timeout
+        while self._items and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            # A group in flight goes back to the queue before the journal is closed
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._items:
+            where = "kept in the journal" if self._journal is not None else "lost"
+            print(f"[writes] {len(self._items)} queued write(s) not committed at shutdown ({where})")
+        if self._journal is not None:
+            self._journal.close()
+
+    async def _run(self) -> None:
+        while True:
+            if not self._items:
+                self._wake.clear()
+                await self._wake.wait()
+            if len(self._items) < self.group_size:
+                # Group commit window: wait for a full group or the interval
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            group = [self._items.popleft() for _ in range(min(self.group_size, len(self._items)))]
+            try:
+                results = await self._flush(group)
+            except asyncio.CancelledError:
+                self._items.extendleft(reversed(group))
+                raise
+            except self.retry_types as e:
+                # Node down / connection lost: keep the order, retry the same writes later
+                self._items.extendleft(reversed(group))
+                self.retries += 1
+                print(f"[writes] group of {len(group)} not committed ({e}); retrying in {self.retry_interval}s")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            except Exception as e:
+                print(f"[writes] group of {len(group)} failed ({type(e).__name__}: {e})")
+                results = [{"status": "failed", "error": str(e)} for _ in group]
+            self.groups += 1
+            done = [[w.ticket, r] for w, r in zip(group, results)]
+            for _, r in done:
+                if r.get("status") == "committed":
+                    self.committed += 1
+                else:
+                    self.failed += 1
+            if self._journal is not None:
+                self._log({"done": [w.ticket for w in group]})
+                if not self._items and self._journal.tell() > (1 << 20):
+                    self._journal.truncate(0)
+                    self._journal.seek(0)
+            self._store(done)
+            if self.on_results is not None:
+                self.on_results(done)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._items),
+            "max_items": self.max_items,
+            "group_size": self.group_size,
+            "interval_ms": self.interval * 1000.0,
+            "journal": self._journal.name if self._journal is not None else None,
+            "accepted": self.accepted,
+            "committed": self.committed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "groups": self.groups,
+            "retries": self.retries,
+            "replayed": self.replayed,
+        }
@@ -5,6 +5,8 @@ set -euo pipefail
 # Prereqs:
 # - Run: python Final/scripts/boto_up_final.py
 # - KEY_PEM points to a valid SSH key for ubuntu user
+# - APT_READY=1 skips apt-get (python3/pip already installed by the instance user data)
+# - PROCESSES=<n> opts in to n worker processes (default 1)
 
 KEY_PEM="${KEY_PEM:-$HOME/assignment_final.pem}"
 SSH_OPTS="-o StrictHostKeyChecking=no -o BatchMode=yes -i ${KEY_PEM}"
@@ -45,21 +47,26 @@ echo "Proxy private IP: $PROXY_PRIV_IP"
 
 # Copy gatekeeper code
 scp $SSH_OPTS -r "$GK_DIR_LOCAL" "ubuntu@${GK_IP}:/home/ubuntu/"
+# Shared modules (metrics, bus, sqlscan), imported from ../common
+scp $SSH_OPTS -r "Final/common" "ubuntu@${GK_IP}:/home/ubuntu/"
 
 # Install deps and run Gatekeeper bound to :80
 ssh $SSH_OPTS "ubuntu@${GK_IP}" 'bash -lc "
   set -e
-  sudo apt-get update -y
-  sudo apt-get install -y python3 python3-pip
+  if [ '"${APT_READY:-0}"' != 1 ]; then
+    sudo apt-get update -y
+    sudo apt-get install -y python3 python3-pip
+  fi
   python3 -m pip install --user --upgrade pip || true
   # Install dependencies for the root user (executed with sudo below)
-  sudo -H pip3 install --no-input --upgrade fastapi uvicorn requests
+  sudo -H pip3 install --no-input --upgrade fastapi uvicorn aiohttp
 
   # Env (minimal)
   echo \"export API_KEY=\${API_KEY:-changeme}\" >  ~/.gk_env
   echo \"export PROXY_HOST='"$PROXY_PRIV_IP"'\" >> ~/.gk_env
   echo \"export PROXY_PORT=8080\"            >> ~/.gk_env
   echo \"export PORT=80\"                    >> ~/.gk_env
+  echo \"export PROCESSES='"${PROCESSES:-1}"'\" >> ~/.gk_env
 
   cd ~/gatekeeper
   # Kill previous exact process if any
@@ -5,6 +5,9 @@ set -euo pipefail
 # Prereqs:
 # - Run python Final/scripts/boto_up_final.py first
 # - Ensure KEY_PEM points to a valid SSH key for ubuntu user
+# - APT_READY=1 skips apt-get (python3/pip already installed by the instance user data,
+#   set by orchestrate.py once cloud-init has finished)
+# - PROCESSES=<n> opts in to n worker processes (default 1), e.g. the vCPU count of the instance
 
 KEY_PEM="${KEY_PEM:-$HOME/assignment_final.pem}"
 SSH_OPTS="-o StrictHostKeyChecking=no -o BatchMode=yes -i ${KEY_PEM}"
@@ -38,19 +41,26 @@ echo "Proxy IP: $PROXY_IP"
 
 # Copy proxy code and config
 scp $SSH_OPTS -r "$PROXY_DIR_LOCAL" "ubuntu@${PROXY_IP}:/home/ubuntu/"
+# Shared modules (metrics, bus, sqlscan), imported from ../common
+scp $SSH_OPTS -r "Final/common" "ubuntu@${PROXY_IP}:/home/ubuntu/"
 
 # Install deps and run
 ssh $SSH_OPTS "ubuntu@${PROXY_IP}" 'bash -lc "
   set -e
-  sudo apt-get update -y
-  sudo apt-get install -y python3 python3-pip
+  if [ '"${APT_READY:-0}"' != 1 ]; then
+    sudo apt-get update -y
+    sudo apt-get install -y python3 python3-pip
+  fi
   python3 -m pip install --user --upgrade pip
-  python3 -m pip install --user fastapi uvicorn mysql-connector-python
+  python3 -m pip install --user fastapi uvicorn mysql-connector-python aiomysql orjson msgpack
 
   # Env for DB creds (defaults: app/password on sakila)
   echo \"export DB_USER=\${DB_USER:-app}\"     >  ~/.proxy_env
   echo \"export DB_PASSWORD=\${DB_PASSWORD:-password}\" >> ~/.proxy_env
   echo \"export DB_NAME=\${DB_NAME:-sakila}\"   >> ~/.proxy_env
+  echo \"export DB_DRIVER=\${DB_DRIVER:-sync}\"  >> ~/.proxy_env
+  # Single process unless PROCESSES is set when deploying (multi-process mode is opt-in)
+  echo \"export PROCESSES='"${PROCESSES:-1}"'\" >> ~/.proxy_env
 
   cd ~/proxy
   # Kill previous exact process if any
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Parallel cluster bring-up: provisioning, MySQL bootstrap and deploys as a dependency graph.
+
+Same steps as run_demo.sh's sequential path (boto_up_final.py, bootstrap_mysql.sh,
+deploy_proxy.sh, deploy_gatekeeper.sh), but every step starts as soon as the steps
+it depends on are done:
+
+  provision ─┬─ ssh:manager ── mysql:manager ─────────────────┐
+             ├─ ssh:workerN ── mysql:workerN:prepare ── mysql:workerN:replicate
+             ├─ ssh:proxy ──── deploy:proxy ──────────────────┤
+             └─ ssh:gatekeeper ─ deploy:gatekeeper ───────────┴─ ready
+
+- SSH readiness is polled for all hosts at once and also waits for cloud-init, so the
+  user data's apt-get has finished; the deploy scripts then skip their own apt-get (APT_READY=1)
+- Workers install MySQL and import Sakila while the manager is being set up
+  (setup_worker.sh PHASE=prepare); only the replication step waits for the manager
+- Proxy and Gatekeeper are deployed while MySQL bootstraps (the Proxy's pools and
+  probes connect once the nodes are up)
+- ready: POST /query through the Gatekeeper until it answers 200
+
+Per-step start/duration, the critical path and the time a sequential run would have
+taken are printed and written to Final/infra/bringup.json.
+
+Usage:
+  python Final/scripts/orchestrate.py                   # AWS (same env as run_demo.sh)
+  python Final/scripts/orchestrate.py --skip-provision  # existing instances.json (e.g. local stand-in hosts)
+  python Final/scripts/orchestrate.py --simulate        # no AWS/SSH: every step sleeps SIM_SECONDS × SIM_SCALE
+Env: KEY_PEM, APP_PASS/REPL_PASS/ROOT_PASS (as bootstrap_mysql.sh), SSH_WAIT_TIMEOUT (600s),
+     READY_TIMEOUT (300s), SIM_SCALE (0.01)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+INFO_JSON = Path("Final/infra/instances.json")
+REPORT_JSON = Path("Final/infra/bringup.json")
+
+KEY_PEM = os.getenv("KEY_PEM", str(Path.home() / "assignment_final.pem"))
+SSH_OPTS = ["-o", "StrictHostKeyChecking=no", "-o", "BatchMode=yes", "-i", KEY_PEM]
+APP_PASS = os.getenv("APP_PASS", "password")
+REPL_PASS = os.getenv("REPL_PASS", "replpass")
+ROOT_PASS = os.getenv("ROOT_PASS", "rootpass")
+API_KEY = os.getenv("API_KEY", "changeme")
+SSH_WAIT_TIMEOUT = float(os.getenv("SSH_WAIT_TIMEOUT", "600"))
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "300"))
+SIM_SCALE = float(os.getenv("SIM_SCALE", "0.01"))
+
+# --simulate: typical durations (s) of each kind of step on t2 instances
+SIM_SECONDS = {
+    "provision": 75,
+    "ssh": 60,
+    "mysql:manager": 240,
+    "prepare": 210,
+    "replicate": 20,
+    "deploy:proxy": 90,
+    "deploy:gatekeeper": 80,
+    "ready": 5,
+}
+
+
+class Step:
+    def __init__(self, name: str, deps: List[str], run: Callable[[], Awaitable[None]]):
+        self.name = name
+        self.deps = deps
+        self.run = run
+        self.status = "pending"  # pending | ok | failed | skipped
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.error = ""
+        self.done = asyncio.Event()
+
+    @property
+    def duration(self) -> float:
+        return (self.end - self.start) if self.start is not None and self.end is not None else 0.0
+
+
+def log(step: str, msg: str) -> None:
+    print(f"[{time.strftime('%H:%M:%S')}] [{step}] {msg}", flush=True)
+
+
+async def sh(step: str, *argv: str, env: Optional[Dict[str, str]] = None) -> None:
+    # Runs a command, streaming its output prefixed with the step name; raises on failure
+    proc = await asyncio.create_subprocess_exec(
+        *argv,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env={**os.environ, **(env or {})},
+    )
+    assert proc.stdout is not None
+    async for line in proc.stdout:
+        log(step, line.decode("utf-8", "replace").rstrip())
+    rc = await proc.wait()
+    if rc != 0:
+        raise RuntimeError(f"{argv[0]} exited with {rc}")
+
+
+async def ssh(step: str, host: str, command: str) -> None:
+    await sh(step, "ssh", *SSH_OPTS, f"ubuntu@{host}", command)
+
+
+async def scp(step: str, local: str, host: str) -> None:
+    await sh(step, "scp", *SSH_OPTS, local, f"ubuntu@{host}:/home/ubuntu/")
+
+
+async def wait_ssh(step: str, host: str) -> None:
+    # SSH up and cloud-init (user data: apt-get update/install) finished
+    deadline = time.monotonic() + SSH_WAIT_TIMEOUT
+    attempt = 0
+    while True:
+        attempt += 1
+        proc = await asyncio.create_subprocess_exec(
+            "ssh", *SSH_OPTS, "-o", "ConnectTimeout=5", f"ubuntu@{host}",
+            "cloud-init status --wait >/dev/null 2>&1 || true; echo ssh-ok",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+        if proc.returncode == 0 and b"ssh-ok" in out:
+            return
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"SSH not ready on {host} after {attempt} attempts")
+        log(step, f"SSH not ready on {host} (try {attempt}), retrying in 5s...")
+        await asyncio.sleep(5)
+
+
+async def wait_ready(step: str, gk_ip: str) -> None:
+    # End to end: Gatekeeper -> Proxy -> MySQL
+    url = f"http://{gk_ip}/query?strategy=direct"
+    body = json.dumps({"sql": "SELECT COUNT(*) FROM film"}).encode("utf-8")
+    deadline = time.monotonic() + READY_TIMEOUT
+    last = ""
+    while time.monotonic() < deadline:
+        req = urllib.request.Request(url, data=body, headers={"X-API-Key": API_KEY, "Content-Type": "application/json"})
+        try:
+            resp = await asyncio.to_thread(urllib.request.urlopen, req, timeout=5)
+            with resp:
+                if resp.status == 200:
+                    log(step, resp.read().decode("utf-8", "replace"))
+                    return
+        except OSError as e:
+            last = str(e)
+        await asyncio.sleep(3)
+    raise RuntimeError(f"Gatekeeper not answering queries after {READY_TIMEOUT}s: {last}")
+
+
+def load_hosts() -> Dict[str, dict]:
+    with open(INFO_JSON, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    hosts = {
+        "gatekeeper": data["gatekeeper"],
+        "proxy": data["proxy"],
+        "manager": data["mysql"]["manager"],
+    }
+    for i, w in enumerate(data["mysql"]["workers"], start=1):
+        hosts[f"worker{i}"] = w
+    return hosts
+
+
+def public_ip(h: dict) -> str:
+    return h.get("public_ip") or h.get("private_ip") or ""
+
+
+def build_steps(hosts: Dict[str, dict], simulate: bool) -> List[Step]:
+    workers = [name for name in hosts if name.startswith("worker")]
+    mgr_priv = hosts["manager"].get("private_ip") or ""
+    steps: List[Step] = []
+
+    def add(name: str, deps: List[str], run: Callable[[], Awaitable[None]], kind: str) -> None:
+        if simulate:
+            async def run() -> None:
+                await asyncio.sleep(SIM_SECONDS[kind] * SIM_SCALE)
+        steps.append(Step(name, deps, run))
+
+    for name, h in hosts.items():
+        add(f"ssh:{name}", [], lambda s=f"ssh:{name}", ip=public_ip(h): wait_ssh(s, ip), "ssh")
+
+    mgr_ip = public_ip(hosts["manager"])
+
+    async def setup_manager() -> None:
+        await scp("mysql:manager", "Final/db/setup_manager.sh", mgr_ip)
+        await ssh("mysql:manager", mgr_ip, f"sudo bash /home/ubuntu/setup_manager.sh '{APP_PASS}' '{REPL_PASS}' '{ROOT_PASS}'")
+
+    add("mysql:manager", ["ssh:manager"], setup_manager, "mysql:manager")
+
+    for w in workers:
+        ip = public_ip(hosts[w])
+
+        async def prepare(w: str = w, ip: str = ip) -> None:
+            await scp(f"mysql:{w}:prepare", "Final/db/setup_worker.sh", ip)
+            await ssh(
+                f"mysql:{w}:prepare", ip,
+                f"sudo bash /home/ubuntu/setup_worker.sh '{mgr_priv}' '{REPL_PASS}' '{ROOT_PASS}' prepare",
+            )
+
+        async def replicate(w: str = w, ip: str = ip) -> None:
+            await ssh(
+                f"mysql:{w}:replicate", ip,
+                f"sudo bash /home/ubuntu/setup_worker.sh '{mgr_priv}' '{REPL_PASS}' '{ROOT_PASS}' replicate",
+            )
+
+        add(f"mysql:{w}:prepare", [f"ssh:{w}"], prepare, "prepare")
+        add(f"mysql:{w}:replicate", [f"mysql:{w}:prepare", "mysql:manager"], replicate, "replicate")
+
+    apt_ready = {"APT_READY": "1"}
+    add("deploy:proxy", ["ssh:proxy"],
+        lambda: sh("deploy:proxy", "bash", "Final/scripts/deploy_proxy.sh", env=apt_ready), "deploy:proxy")
+    add("deploy:gatekeeper", ["ssh:gatekeeper"],
+        lambda: sh("deploy:gatekeeper", "bash", "Final/scripts/deploy_gatekeeper.sh", env=apt_ready), "deploy:gatekeeper")
+
+    everything = [s.name for s in steps]
+    add("ready", everything, lambda: wait_ready("ready", public_ip(hosts["gatekeeper"])), "ready")
+    return steps
+
+
+async def run_graph(steps: List[Step], t0: float) -> bool:
+    by_name = {s.name: s for s in steps}
+
+    async def run(step: Step) -> None:
+        try:
+            for d in step.deps:
+                await by_name[d].done.wait()
+            failed = [d for d in step.deps if by_name[d].status != "ok"]
+            if failed:
+                step.status = "skipped"
+                step.error = f"dependency failed: {', '.join(failed)}"
+                log(step.name, f"skipped ({step.error})")
+                return
+            step.start = time.monotonic() - t0
+            log(step.name, "start")
+            try:
+                await step.run()
+                step.status = "ok"
+            except Exception as e:
+                step.status = "failed"
+                step.error = str(e) or type(e).__name__
+            step.end = time.monotonic() - t0
+            log(step.name, f"{step.status} in {step.duration:.1f}s" + (f": {step.error}" if step.error else ""))
+        finally:
+            step.done.set()
+
+    # Steps already run (provision) only count as dependencies
+    await asyncio.gather(*(run(s) for s in steps if s.status == "pending"))
+    return all(s.status == "ok" for s in steps)
+
+
+def critical_path(steps: List[Step]) -> List[Step]:
+    # From the step that finished last, follow the dependency that finished last
+    by_name = {s.name: s for s in steps}
+    timed = [s for s in steps if s.end is not None]
+    if not timed:
+        return []
+    path = [max(timed, key=lambda s: s.end)]
+    while True:
+        deps = [by_name[d] for d in path[-1].deps if by_name[d].end is not None]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda s: s.end))
+    return list(reversed(path))
+
+
+def report(steps: List[Step], wall: float, ok: bool) -> None:
+    print()
+    print(f"{'step':<28} {'status':<8} {'start (s)':>10} {'duration (s)':>13}")
+    for s in sorted(steps, key=lambda s: (s.start is None, s.start or 0.0)):
+        start = f"{s.start:.1f}" if s.start is not None else "-"
+        print(f"{s.name:<28} {s.status:<8} {start:>10} {s.duration:>13.1f}")
+    path = critical_path(steps)
+    sequential = sum(s.duration for s in steps)
+    print()
+    print("Critical path: " + " -> ".join(f"{s.name} ({s.duration:.1f}s)" for s in path))
+    print(f"Time to ready: {wall:.1f}s (sum of all steps, i.e. one after another: {sequential:.1f}s)")
+
+    REPORT_JSON.parent.mkdir(parents=True, exist_ok=True)
+    with open(REPORT_JSON, "w", encoding="utf-8") as f:
+        json.dump({
+            "ok": ok,
+            "wall_s": round(wall, 3),
+            "sequential_s": round(sequential, 3),
+            "critical_path": [s.name for s in path],
+            "steps": [
+                {
+                    "name": s.name,
+                    "deps": s.deps,
+                    "status": s.status,
+                    "start_s": round(s.start, 3) if s.start is not None else None,
+                    "duration_s": round(s.duration, 3),
+                    "error": s.error,
+                }
+                for s in steps
+            ],
+        }, f, indent=2)
+    print(f"Written: {REPORT_JSON}")
+
+
+def simulated_hosts(workers: int) -> Dict[str, dict]:
+    hosts = {name: {"public_ip": f"10.0.0.{i + 10}", "private_ip": f"10.0.0.{i + 10}"}
+             for i, name in enumerate(["gatekeeper", "proxy", "manager"])}
+    for i in range(1, workers + 1):
+        hosts[f"worker{i}"] = {"public_ip": f"10.0.1.{i}", "private_ip": f"10.0.1.{i}"}
+    return hosts
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Bring the cluster up with independent steps running concurrently")
+    parser.add_argument("--skip-provision", action="store_true", help="use the hosts already in Final/infra/instances.json")
+    parser.add_argument("--simulate", action="store_true", help="no AWS/SSH: steps sleep for their typical duration × SIM_SCALE")
+    parser.add_argument("--workers", type=int, default=2, help="workers in --simulate mode (default 2)")
+    args = parser.parse_args()
+
+    t0 = time.monotonic()
+    provision = Step("provision", [], lambda: sh("provision", sys.executable, "Final/scripts/boto_up_final.py"))
+    if args.simulate:
+        provision.run = lambda: asyncio.sleep(SIM_SECONDS["provision"] * SIM_SCALE)
+    steps = [provision]
+    if args.skip_provision:
+        steps = []
+    else:
+        # Everything else needs the instances (and their IPs) first
+        if not await run_graph(steps, t0):
+            report(steps, time.monotonic() - t0, False)
+            return 1
+
+    hosts = simulated_hosts(args.workers) if args.simulate else load_hosts()
+    graph = build_steps(hosts, args.simulate)
+    if steps:
+        for s in graph:
+            if not s.deps:
+                s.deps = ["provision"]
+        graph = steps + graph
+    ok = await run_graph(graph, t0)
+    report(graph, time.monotonic() - t0, ok)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
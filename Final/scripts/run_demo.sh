@@ -12,6 +12,9 @@ set -euo pipefail
 # - Existing EC2 key pair: KEY_NAME (e.g., export KEY_NAME="assignment-final")
 # - Local SSH key for ubuntu: export KEY_PEM=/path/to/key.pem (default: $HOME/assignment_final.pem)
 # - Python 3 installed locally
+#
+# PARALLEL=1 (default) runs steps 1-4 through Final/scripts/orchestrate.py (dependency graph,
+# per-step timing in Final/infra/bringup.json); PARALLEL=0 runs them one after the other.
 
 log(){ printf '==== [%s] %s\n' "$(date -u +%FT%TZ)" "$*"; }
 
@@ -21,17 +24,22 @@ log(){ printf '==== [%s] %s\n' "$(date -u +%FT%TZ)" "$*"; }
 PYBIN="python"
 command -v "$PYBIN" >/dev/null 2>&1 || PYBIN="python3"
 
-log "1) Provision (EC2 + SG) ..."
-$PYBIN Final/scripts/boto_up_final.py
+if [[ "${PARALLEL:-1}" == "1" ]]; then
+  log "1-4) Provision + bootstrap MySQL + deploy Proxy/Gatekeeper (parallel) ..."
+  $PYBIN Final/scripts/orchestrate.py
+else
+  log "1) Provision (EC2 + SG) ..."
+  $PYBIN Final/scripts/boto_up_final.py
 
-log "2) Bootstrap MySQL (Sakila + sysbench + replication) ..."
-bash Final/scripts/bootstrap_mysql.sh
+  log "2) Bootstrap MySQL (Sakila + sysbench + replication) ..."
+  bash Final/scripts/bootstrap_mysql.sh
 
-log "3) Deploy Proxy ..."
-bash Final/scripts/deploy_proxy.sh
+  log "3) Deploy Proxy ..."
+  bash Final/scripts/deploy_proxy.sh
 
-log "4) Deploy Gatekeeper ..."
-bash Final/scripts/deploy_gatekeeper.sh
+  log "4) Deploy Gatekeeper ..."
+  bash Final/scripts/deploy_gatekeeper.sh
+fi
 
 # Retrieve Gatekeeper public IP for display
 GK_IP="$($PYBIN - <<'PY'
@@ -52,5 +60,6 @@ log "6) Benchmark (1000 READ + 1000 WRITE per strategy) ..."
 $PYBIN Final/benchmark/bench.py
 
 echo
-log "Done. CSV results:"
-echo "  Final/benchmark/results/results.csv"
\ No newline at end of file
+log "Done. Results:"
+echo "  Final/benchmark/results/results.csv"
+echo "  Final/benchmark/results/results.json"
\ No newline at end of file
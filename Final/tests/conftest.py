@@ -0,0 +1,59 @@
+"""
+Proxy tests run against the in-memory backend (DB_DRIVER=fake): a manager and two
+workers, no MySQL needed; gatekeeper tests replace its HTTP session. Run from the
+repository root: python -m pytest Final/tests
+"""
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+FINAL_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(FINAL_DIR / "common"))
+sys.path.insert(0, str(FINAL_DIR / "proxy"))
+sys.path.insert(0, str(FINAL_DIR / "gatekeeper"))
+
+
+def _load(name: str, path: Path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def proxy(tmp_path_factory):
+    # proxy/app.py reads its topology and env once, at import
+    config = tmp_path_factory.mktemp("proxy") / "config.json"
+    config.write_text(json.dumps({
+        "manager": {"host": "manager", "port": 3306},
+        "workers": [{"host": "worker1", "port": 3306}, {"host": "worker2", "port": 3306}],
+    }))
+    os.environ.update({
+        "DB_DRIVER": "fake",
+        "PROXY_CONFIG": str(config),
+        "FAKE_LATENCY_MS": "0",
+        "FAKE_JITTER_MS": "0",
+        "TOPOLOGY_WATCH_INTERVAL": "0",
+    })
+    return _load("proxy_app", FINAL_DIR / "proxy" / "app.py")
+
+
+@pytest.fixture(scope="session")
+def gatekeeper():
+    return _load("gatekeeper_app", FINAL_DIR / "gatekeeper" / "app.py")
+
+
+@pytest.fixture
+def client(proxy):
+    from fastapi.testclient import TestClient
+
+    with TestClient(proxy.app) as c:
+        yield c
+    # Breaker state is module-global: every test starts with closed circuits
+    for node in [proxy.MANAGER] + proxy.WORKERS:
+        proxy.BREAKERS.forget(node)
@@ -0,0 +1,24 @@
+def test_manager_outage_on_batch_opens_the_breaker(proxy, client, monkeypatch):
+    monkeypatch.setitem(proxy.BACKEND.node_failure, "manager", 1.0)
+    body = {"statements": ["INSERT INTO actor (first_name) VALUES ('A')"]}
+    for _ in range(proxy.CIRCUIT_FAILURE_THRESHOLD):
+        r = client.post("/batch", json=body)
+        assert r.status_code == 200
+        assert r.json()["committed"] is False
+
+    assert not proxy.BREAKERS.available(proxy.MANAGER)
+    assert client.post("/batch", json=body).status_code == 503
+    assert client.post("/query", json={"sql": "UPDATE actor SET first_name = 'B'"}).status_code == 503
+
+
+def test_statement_error_on_batch_does_not_count_as_node_failure(proxy, client, monkeypatch):
+    async def failing_batch(items, host, port, with_gtid=False):
+        raise proxy.BatchError(0, "Duplicate entry '1' for key 'PRIMARY'")
+
+    monkeypatch.setattr(proxy.BACKEND, "write_batch", failing_batch)
+    body = {"statements": ["INSERT INTO actor (actor_id) VALUES (1)"]}
+    for _ in range(proxy.CIRCUIT_FAILURE_THRESHOLD + 1):
+        r = client.post("/batch", json=body)
+        assert r.json()["results"][0]["error"].startswith("MySQL error: Duplicate entry")
+
+    assert proxy.BREAKERS.available(proxy.MANAGER)
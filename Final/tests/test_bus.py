@@ -0,0 +1,113 @@
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+
+import bus as busmod
+from bus import Bus
+
+
+def _pair(tmp_path):
+    a, b = Bus("t", str(tmp_path)), Bus("t", str(tmp_path))
+    # One process in the test: give the second bus its own socket name
+    b.path = os.path.join(str(tmp_path), "t-peer.sock")
+    return a, b
+
+
+def test_large_message_is_fragmented_and_reassembled(tmp_path):
+    a, b = _pair(tmp_path)
+    got = []
+    b.subscribe("metrics", got.append)
+    data = {"series": ["x" * 100 for _ in range(20000)]}  # ~2 MB, far over one datagram
+
+    async def run():
+        a.start()
+        b.start()
+        a.publish("metrics", data)
+        for _ in range(200):
+            if got:
+                break
+            await asyncio.sleep(0.01)
+        a.close()
+        b.close()
+
+    asyncio.run(run())
+    assert got == [data]
+    assert a.dropped == 0
+
+
+def test_full_peer_does_not_block_publish(tmp_path):
+    a = Bus("t", str(tmp_path))
+    # A peer that never reads: its receive queue fills up
+    stuck = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stuck.bind(os.path.join(str(tmp_path), "t-stuck.sock"))
+    message = {"payload": "y" * 30000}
+
+    async def run():
+        a.start()
+        start = time.perf_counter()
+        for _ in range(200):
+            a.publish("metrics", message)
+        elapsed = time.perf_counter() - start
+        stats = a.stats()
+        a.close()
+        return elapsed, stats
+
+    elapsed, stats = asyncio.run(run())
+    stuck.close()
+    assert elapsed < 0.5
+    assert stats["backlog_bytes"] > 0
+    assert stats["backlog_bytes"] <= busmod.BACKLOG_MAX_BYTES
+    assert stats["dropped"] > 0
+
+
+def test_backlog_is_delivered_in_order_once_the_peer_reads(tmp_path):
+    a, b = _pair(tmp_path)
+    got = []
+    b.subscribe("n", got.append)
+
+    async def run():
+        a.start()
+        b.start()
+        # Stop reading on b while a publishes more than b's receive queue holds
+        a._loop.remove_reader(b._recv.fileno())
+        for i in range(100):
+            a.publish("n", [i, "z" * 20000])
+        assert a.stats()["backlog_bytes"] > 0
+        a._loop.add_reader(b._recv.fileno(), b._on_readable)
+        for _ in range(300):
+            if len(got) == 100:
+                break
+            await asyncio.sleep(0.01)
+        a.close()
+        b.close()
+
+    asyncio.run(run())
+    assert [m[0] for m in got] == list(range(100))
+
+
+def test_bus_directory_is_created_private(tmp_path):
+    directory = tmp_path / "bus"
+    b = Bus("t", str(directory))
+
+    async def run():
+        b.start()
+        b.close()
+
+    asyncio.run(run())
+    assert directory.stat().st_mode & 0o777 == 0o700
+
+
+def test_bus_refuses_a_directory_others_can_write_to(tmp_path):
+    directory = tmp_path / "bus"
+    directory.mkdir()
+    directory.chmod(0o777)
+    b = Bus("t", str(directory))
+
+    async def run():
+        b.start()
+
+    with pytest.raises(PermissionError, match="writable by other users"):
+        asyncio.run(run())
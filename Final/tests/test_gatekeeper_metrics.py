@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+
+
+def test_metrics_scrape_needs_no_api_key(gatekeeper):
+    with TestClient(gatekeeper.app) as c:
+        r = c.get("/metrics")
+    assert r.status_code == 200
+    assert "gatekeeper_requests_total" in r.text
+
+
+def test_metrics_can_require_the_api_key(gatekeeper, monkeypatch):
+    monkeypatch.setattr(gatekeeper, "METRICS_REQUIRE_KEY", True)
+    with TestClient(gatekeeper.app) as c:
+        assert c.get("/metrics").status_code == 401
+        assert c.get("/metrics", headers={"X-API-Key": gatekeeper.API_KEY}).status_code == 200
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+
+class _Content:
+    async def iter_any(self):
+        yield b'{"columns": ["id"]}\n'
+        yield b"[1]\n"
+
+
+class _Upstream:
+    status = 200
+    headers = {"content-type": "application/x-ndjson"}
+
+    def __init__(self):
+        self.content = _Content()
+        self.closed = 0
+        self.released = 0
+
+    def close(self):
+        self.closed += 1
+
+    def release(self):
+        self.released += 1
+
+
+class _Session:
+    def __init__(self, upstream):
+        self.upstream = upstream
+
+    async def post(self, *args, **kwargs):
+        return self.upstream
+
+
+def _relay(gatekeeper, monkeypatch, send):
+    upstream = _Upstream()
+    monkeypatch.setattr(gatekeeper, "HTTP", _Session(upstream))
+    released = []
+
+    async def run():
+        resp = await gatekeeper.forward_stream("http://proxy/query", {}, {}, {}, lambda: released.append(1))
+
+        async def receive():
+            await asyncio.sleep(3600)
+
+        await resp({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    return upstream, released, run
+
+
+def test_client_gone_before_the_first_chunk_frees_slot_and_connection(gatekeeper, monkeypatch):
+    async def send(message):
+        raise OSError("connection reset by peer")
+
+    upstream, released, run = _relay(gatekeeper, monkeypatch, send)
+    with pytest.raises(Exception):
+        asyncio.run(run())
+    assert released == [1]
+    assert (upstream.closed, upstream.released) == (1, 0)
+
+
+def test_complete_relay_releases_once(gatekeeper, monkeypatch):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    upstream, released, run = _relay(gatekeeper, monkeypatch, send)
+    asyncio.run(run())
+    assert b"".join(m.get("body", b"") for m in sent) == b'{"columns": ["id"]}\n[1]\n'
+    assert released == [1]
+    assert (upstream.closed, upstream.released) == (0, 1)
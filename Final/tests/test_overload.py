@@ -0,0 +1,38 @@
+from backends import NodeError, PoolExhausted, SyncBackend
+from pool import PoolTimeout
+
+
+def test_pool_checkout_timeout_is_not_a_node_error():
+    backend = SyncBackend("app", "password", "sakila")
+    error = backend._db_error(PoolTimeout("no free connection to worker1:3306 after 5.0s"))
+    assert isinstance(error, PoolExhausted)
+    assert not isinstance(error, NodeError)
+
+
+def test_exhausted_pool_answers_503_without_opening_the_breaker(proxy, client, monkeypatch):
+    tried = []
+
+    async def busy(sql, host, port, params=None):
+        tried.append(host)
+        raise PoolExhausted(f"no free connection to {host}:{port} after 5.0s")
+
+    monkeypatch.setattr(proxy.BACKEND, "read", busy)
+    for _ in range(proxy.CIRCUIT_FAILURE_THRESHOLD + 1):
+        r = client.post("/query", json={"sql": "SELECT * FROM actor"})
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "1"
+
+    # One node per request: no failover to the others
+    assert len(tried) == proxy.CIRCUIT_FAILURE_THRESHOLD + 1
+    assert all(proxy.BREAKERS.available(n) for n in [proxy.MANAGER] + proxy.WORKERS)
+
+
+def test_exhausted_pool_on_batch_answers_503(proxy, client, monkeypatch):
+    async def busy(items, host, port, with_gtid=False):
+        raise PoolExhausted(f"no free connection to {host}:{port} after 5.0s")
+
+    monkeypatch.setattr(proxy.BACKEND, "write_batch", busy)
+    body = {"statements": ["INSERT INTO actor (first_name) VALUES ('A')"]}
+    for _ in range(proxy.CIRCUIT_FAILURE_THRESHOLD + 1):
+        assert client.post("/batch", json=body).status_code == 503
+    assert proxy.BREAKERS.available(proxy.MANAGER)
@@ -0,0 +1,46 @@
+import asyncio
+
+from paging import CursorTable
+
+
+class _Rows:
+    # A backend stream whose close fails, as a cursor with unread rows does
+    def __init__(self):
+        self.closed = False
+
+    async def __anext__(self):
+        return ["actor_id"]
+
+    async def aclose(self):
+        self.closed = True
+        raise RuntimeError("Unread result found")
+
+
+def test_stop_closes_every_cursor_even_if_one_fails():
+    table = CursorTable()
+
+    async def scenario():
+        table.start()
+        streams = []
+        for node in ("worker1", "worker1", "worker2"):
+            rows = _Rows()
+            await table.attach(table.open(node, "q"), rows, 10)
+            streams.append(rows)
+        await table.stop()
+        return streams
+
+    streams = asyncio.run(scenario())
+    assert all(rows.closed for rows in streams)
+    assert table.stats()["open"] == 0
+
+
+def test_closing_a_cursor_does_not_raise():
+    table = CursorTable()
+
+    async def scenario():
+        cur = table.open("worker1", "q")
+        await table.attach(cur, _Rows(), 10)
+        await table.close(cur)
+
+    asyncio.run(scenario())
+    assert table.stats()["open"] == 0
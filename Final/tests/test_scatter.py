@@ -0,0 +1,45 @@
+import time
+
+from scatter import plan
+
+
+def _wait_for_workers(proxy, n=2, timeout=5.0):
+    # The lag monitor's first poll makes the workers eligible for lag-aware/scatter
+    deadline = time.monotonic() + timeout
+    while len(proxy.REPLICATION.eligible(None)) < n:
+        assert time.monotonic() < deadline, "workers never became eligible"
+        time.sleep(0.05)
+
+
+def test_merge_matches_order_by_columns_case_insensitively():
+    p = plan("SELECT * FROM rental ORDER BY `Rental_Date` DESC")
+    rows = p.merge([[(1, "a"), (3, "c")], [(2, "b")]], ["rental_id", "rental_date"])
+    assert [r[0] for r in rows] == [3, 2, 1]
+
+
+def test_unmergeable_scatter_falls_back_to_one_node(proxy, client):
+    _wait_for_workers(proxy)
+    # The fake result has no rental_id column: the merge cannot sort the parts
+    r = client.post("/query?strategy=scatter", json={"sql": "SELECT * FROM rental ORDER BY rental_id LIMIT 5"})
+    assert r.status_code == 200
+    assert r.json()["target"].startswith("worker(scatter)")
+    assert "parts" not in r.json()
+
+
+def test_scatter_merges_parts(proxy, client):
+    _wait_for_workers(proxy)
+    r = client.post("/query?strategy=scatter", json={"sql": "SELECT COUNT(*) FROM rental"})
+    assert r.status_code == 200
+    assert len(r.json()["parts"]) == 2
+
+
+def test_other_scatter_errors_are_not_hidden_by_the_fallback(proxy, client, monkeypatch):
+    _wait_for_workers(proxy)
+
+    def broken(self, results, columns):
+        raise RuntimeError("merge bug")
+
+    monkeypatch.setattr(proxy.ScatterPlan, "merge", broken)
+    r = client.post("/query?strategy=scatter", json={"sql": "SELECT COUNT(*) FROM rental"})
+    assert r.status_code == 502
+    assert "merge bug" in r.json()["detail"]
@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+from sqlscan import scan
+
+
+def test_read_after_a_committed_write_does_not_join_an_older_flight(proxy, monkeypatch):
+    sql = "SELECT COUNT(*) FROM actor"
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_first_read(q, host, port, params=None):
+        if not started.is_set():
+            started.set()
+            await release.wait()
+            return ["n"], [[200]]
+        return ["n"], [[201]]
+
+    monkeypatch.setattr(proxy.BACKEND, "read", slow_first_read)
+
+    async def query(q):
+        resp = await proxy.run_query(q, None, scan(q), "direct", False, None, None, {})
+        return json.loads(resp.body)
+
+    async def scenario():
+        before = asyncio.ensure_future(query(sql))
+        await started.wait()
+        await query("INSERT INTO actor (first_name, last_name) VALUES ('A', 'B')")
+        after = asyncio.ensure_future(query(sql))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await before, await after
+
+    before, after = asyncio.run(scenario())
+    assert before["rows"] == [[200]]
+    assert "coalesced" not in after
+    assert after["rows"] == [[201]]
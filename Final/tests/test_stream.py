@@ -0,0 +1,63 @@
+import asyncio
+
+from mysql.connector import errors
+
+from backends import SyncBackend
+
+
+class _Cursor:
+    description = [("actor_id",)]
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql):
+        pass
+
+    def fetchmany(self, n):
+        batch, self.rows = self.rows[:n], self.rows[n:]
+        return batch
+
+    def close(self):
+        # As the C extension's cursor: rows left on the socket
+        if self.rows:
+            raise errors.InternalError(msg="Unread result found")
+
+
+class _Connection:
+    def cursor(self):
+        return _Cursor([(i,) for i in range(10)])
+
+
+class _Pool:
+    def __init__(self):
+        self.released = []
+
+    def acquire(self):
+        return _Connection()
+
+    def release(self, conn, broken=False):
+        self.released.append(broken)
+
+
+def test_abandoned_stream_drops_the_connection_without_an_error(monkeypatch):
+    backend = SyncBackend("app", "password", "sakila")
+    pool = _Pool()
+    monkeypatch.setattr(backend.pools, "get", lambda host, port: pool)
+
+    async def first_chunk():
+        rows = backend.stream("SELECT actor_id FROM actor", "worker1", 3306, batch_size=2)
+        assert await rows.__anext__() == ["actor_id"]
+        assert await rows.__anext__() == [(0,), (1,)]
+        # The client went away: the response closes the stream
+        await rows.aclose()
+
+    asyncio.run(first_chunk())
+    assert pool.released == [True]
+
+
+def test_client_leaving_after_the_first_chunk(proxy, client):
+    with client.stream("POST", "/query?stream=1", json={"sql": "SELECT * FROM actor"}) as r:
+        assert r.status_code == 200
+        assert "columns" in next(r.iter_lines())
+    assert client.get("/health").status_code == 200
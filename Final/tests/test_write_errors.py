@@ -0,0 +1,98 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from mysql.connector import errors
+
+from backends import BatchError, NodeBatchError, NodeError, SyncBackend
+from writequeue import QueuedWrite
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 1
+
+    def execute(self, sql, params=None):
+        if sql == "BAD":
+            raise self.conn.error
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, error):
+        self.error = error
+
+    def cursor(self, prepared=False):
+        return _Cursor(self)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def _sync_batch(error, items):
+    backend = SyncBackend("app", "password", "sakila")
+
+    @contextmanager
+    def connection(host, port):
+        yield _Connection(error)
+
+    backend._connection = connection
+    return backend.exec_write_batch(items, "manager", 3306, False)
+
+
+@pytest.mark.parametrize("error", [
+    errors.OperationalError(msg="Lost connection to MySQL server during query", errno=2013),
+    errors.InterfaceError(msg="Lost connection to MySQL server at 'manager:3306'", errno=2055),
+    errors.DatabaseError(msg="MySQL server has gone away", errno=2006),
+])
+def test_sync_batch_connection_loss_is_a_node_error(error):
+    with pytest.raises(NodeBatchError) as exc:
+        _sync_batch(error, [("INSERT INTO actor VALUES (1)", None, False), ("BAD", None, False)])
+    assert exc.value.index == 1
+    assert isinstance(exc.value, NodeError)
+
+
+@pytest.mark.parametrize("error", [
+    errors.IntegrityError(msg="Duplicate entry '1' for key 'PRIMARY'", errno=1062),
+    errors.ProgrammingError(msg="You have an error in your SQL syntax", errno=1064),
+])
+def test_sync_batch_statement_error_is_not_a_node_error(error):
+    with pytest.raises(BatchError) as exc:
+        _sync_batch(error, [("BAD", None, False)])
+    assert exc.value.index == 0
+    assert not isinstance(exc.value, NodeError)
+
+
+def _group(*sqls):
+    return [QueuedWrite(f"t-{i}", sql, None, None) for i, sql in enumerate(sqls)]
+
+
+def test_commit_group_retries_the_group_on_a_node_error(proxy, monkeypatch):
+    async def lost(items, host, port, with_gtid=False):
+        raise NodeBatchError(1, "Lost connection to MySQL server during query")
+
+    monkeypatch.setattr(proxy.BACKEND, "write_batch", lost)
+    with pytest.raises(NodeError):
+        asyncio.run(proxy.commit_group(_group("UPDATE actor SET a = 1", "UPDATE film SET b = 2")))
+    proxy.BREAKERS.forget(proxy.MANAGER)
+
+
+def test_commit_group_fails_only_the_bad_statement(proxy, monkeypatch):
+    async def write_batch(items, host, port, with_gtid=False):
+        for i, (sql, _, _) in enumerate(items):
+            if sql == "UPDATE bad SET x = 1":
+                raise BatchError(i, "Table 'sakila.bad' doesn't exist")
+        return [1] * len(items), None
+
+    monkeypatch.setattr(proxy.BACKEND, "write_batch", write_batch)
+    results = asyncio.run(proxy.commit_group(_group("UPDATE actor SET a = 1", "UPDATE bad SET x = 1", "UPDATE film SET b = 2")))
+    assert [r["status"] for r in results] == ["committed", "failed", "committed"]
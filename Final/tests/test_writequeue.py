@@ -0,0 +1,136 @@
+import asyncio
+import os
+import time
+
+from writequeue import WriteQueue
+
+
+async def _never(group):
+    raise AssertionError("not flushed in this test")
+
+
+def test_expired_results_are_purged_behind_a_queued_ticket():
+    q = WriteQueue(_never, ticket_ttl=0.05)
+    queued = q.submit("UPDATE actor SET a = 1")
+    q._store([["other.1-1", {"status": "committed"}], ["other.1-2", {"status": "failed"}]])
+    assert q.status("other.1-1")["status"] == "committed"
+    time.sleep(0.06)
+    q._store([["other.1-3", {"status": "committed"}]])
+    assert q.status("other.1-1") is None and q.status("other.1-2") is None
+    assert q.status("other.1-3")["status"] == "committed"
+    # Still waiting for its group: never expires
+    assert q.status(queued)["status"] == "queued"
+
+
+def test_tickets_are_unique_per_start():
+    a, b = WriteQueue(_never), WriteQueue(_never)
+    assert a.pid == b.pid and a.instance != b.instance
+    ticket = a.submit("DELETE FROM actor WHERE actor_id = 1")
+    assert a.owns(ticket) and not b.owns(ticket)
+
+
+def test_journal_of_a_dead_instance_is_replayed(tmp_path):
+    flushed = []
+
+    async def flush(group):
+        flushed.extend(w.sql for w in group)
+        return [{"status": "committed"} for _ in group]
+
+    async def run():
+        dead = WriteQueue(flush, journal_dir=str(tmp_path))
+        dead._open_journal()
+        dead.submit("UPDATE actor SET a = 1")
+        dead.submit("UPDATE actor SET a = 2")
+        dead._journal.close()  # "crashed" before committing: the flock is released
+
+        fresh = WriteQueue(flush, journal_dir=str(tmp_path), interval=0.01)
+        fresh.start()
+        for _ in range(100):
+            if len(flushed) == 2:
+                break
+            await asyncio.sleep(0.01)
+        await fresh.stop()
+        return fresh
+
+    fresh = asyncio.run(run())
+    assert flushed == ["UPDATE actor SET a = 1", "UPDATE actor SET a = 2"]
+    assert fresh.replayed == 2
+    assert os.listdir(tmp_path) == [f"journal-{fresh.instance}.log"]
+
+
+def test_foreign_ticket_reads_unknown(proxy, client, monkeypatch):
+    monkeypatch.setattr(proxy, "BUS", object())
+    r = client.get("/writes/99999.abcdef-1")
+    assert r.json() == {"ticket": "99999.abcdef-1", "status": "unknown"}
+    monkeypatch.setattr(proxy, "BUS", None)
+    assert client.get("/writes/99999.abcdef-1").status_code == 404
+
+
+def test_group_that_fails_for_good_is_reported_failed():
+    calls = []
+
+    async def flush(group):
+        calls.append(len(group))
+        raise ValueError("commit refused")
+
+    async def run():
+        q = WriteQueue(flush, interval=0.01, retry_interval=0.01)
+        q.start()
+        ticket = q.submit("UPDATE actor SET a = 1")
+        for _ in range(100):
+            if q.status(ticket)["status"] != "queued":
+                break
+            await asyncio.sleep(0.01)
+        await q.stop()
+        return q, ticket
+
+    q, ticket = asyncio.run(run())
+    assert calls == [1]
+    assert q.status(ticket) == {"ticket": ticket, "status": "failed", "error": "commit refused"}
+    assert q.retries == 0 and q.failed == 1
+
+
+def test_node_failure_is_retried():
+    calls = []
+
+    async def flush(group):
+        calls.append(len(group))
+        if len(calls) == 1:
+            raise ConnectionError("manager unreachable")
+        return [{"status": "committed"} for _ in group]
+
+    async def run():
+        q = WriteQueue(flush, interval=0.01, retry_interval=0.01)
+        q.start()
+        ticket = q.submit("UPDATE actor SET a = 1")
+        for _ in range(100):
+            if q.status(ticket)["status"] != "queued":
+                break
+            await asyncio.sleep(0.01)
+        await q.stop()
+        return q, ticket
+
+    q, ticket = asyncio.run(run())
+    assert q.status(ticket)["status"] == "committed"
+    assert q.retries == 1
+
+
+def test_stop_waits_for_the_group_in_flight(tmp_path):
+    async def run():
+        flushing = asyncio.Event()
+
+        async def flush(group):
+            flushing.set()
+            await asyncio.sleep(10)
+
+        q = WriteQueue(flush, journal_dir=str(tmp_path), interval=0.01)
+        q.start()
+        q.submit("UPDATE actor SET a = 1")
+        await flushing.wait()
+        await q.stop(timeout=0)
+        return q
+
+    q = asyncio.run(run())
+    # Cancelled mid-flush: the write went back to the queue before the journal was closed
+    assert len(q._items) == 1
+    assert q._task is None and q._journal.closed